@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_cors import CORS
 import os
+import tempfile
 import logging
 
 # Настройка логирования
@@ -18,7 +19,8 @@ app = Flask(__name__,
 # Настраиваем CORS только если не в тестовом режиме
 # или если явно указано в переменных окружения
 if os.getenv('FLASK_ENV') != 'test' or os.getenv('ENABLE_CORS_IN_TESTS'):
-    CORS(app)
+    # Заголовки трассировки доступны скрипту страницы с другого origin
+    CORS(app, expose_headers=['X-Request-ID', 'Server-Timing', 'Retry-After'])
     logger.info("CORS включен")
 else:
     logger.info("CORS отключен в тестовом режиме")
@@ -31,9 +33,132 @@ class Config:
     
     # Секретный ключ
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    
+    # Пул декодирования и предобработки: thread | process | inline
+    PREPROCESS_EXECUTOR = os.getenv('PREPROCESS_EXECUTOR', 'thread')
+    PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', '0')) or os.cpu_count() or 1
+    
+    # Число заранее выделенных буферов входа модели
+    INPUT_BUFFER_SLOTS = int(os.getenv('INPUT_BUFFER_SLOTS', '8'))
+    
+    # Пакетная обработка /predict/batch: размер батча модели, лимиты пакета
+    # и число буферов (BATCH_SIZE x 299 x 299 x 3 float32 каждый)
+    BATCH_SIZE = int(os.getenv('BATCH_SIZE', '32'))
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '256'))
+    BATCH_MAX_MB = int(os.getenv('BATCH_MAX_MB', '512'))
+    BATCH_BUFFER_SLOTS = int(os.getenv('BATCH_BUFFER_SLOTS', '2'))
+    
+    # Проверка качества перед инференсом (пустые, расфокусированные, пересвеченные кадры)
+    QUALITY_GATE_ENABLED = os.getenv('QUALITY_GATE_ENABLED', '0') == '1'
+    QUALITY_MIN_VARIANCE = float(os.getenv('QUALITY_MIN_VARIANCE', '1e-4'))
+    QUALITY_MIN_FOCUS = float(os.getenv('QUALITY_MIN_FOCUS', '1e-5'))
+    QUALITY_MAX_SATURATION = float(os.getenv('QUALITY_MAX_SATURATION', '0.5'))
+    QUALITY_MIN_FOREGROUND = float(os.getenv('QUALITY_MIN_FOREGROUND', '0.005'))
+    
+    # Версия модели для ключей кэша (по умолчанию — из файла модели)
+    MODEL_VERSION = os.getenv('MODEL_VERSION', '')
+    
+    # LRU-кэш результатов в памяти процесса (0 записей — выключен)
+    PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '1024'))
+    PREDICTION_CACHE_MAX_MB = int(os.getenv('PREDICTION_CACHE_MAX_MB', '64'))
+    PREDICTION_CACHE_TTL = int(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+    
+    # Общее для воркеров хранилище результатов (SQLite WAL). Пустой путь — выключено
+    RESULT_STORE_PATH = os.getenv('RESULT_STORE_PATH', '')
+    RESULT_STORE_MAX_ENTRIES = int(os.getenv('RESULT_STORE_MAX_ENTRIES', '100000'))
+    RESULT_STORE_MAX_MB = int(os.getenv('RESULT_STORE_MAX_MB', '512'))
+    
+    # Большие загрузки: тело больше UPLOAD_SPOOL_MB пишется блоками во временный
+    # файл в UPLOAD_SPOOL_DIR, а не читается в память. MAX_UPLOAD_MB — предел изображения
+    MAX_UPLOAD_MB = int(os.getenv('MAX_UPLOAD_MB', '512'))
+    UPLOAD_SPOOL_MB = int(os.getenv('UPLOAD_SPOOL_MB', '16'))
+    UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'flask_ml_uploads'))
+    
+    # Сжатые тела (Content-Encoding: gzip, zstd): предел объема после распаковки
+    MAX_DECOMPRESSED_MB = int(os.getenv('MAX_DECOMPRESSED_MB', '1024'))
+    
+    # Контроль допуска: не больше ADMISSION_CONCURRENCY вычислений одновременно
+    # (лимит адаптируется к задержке в пределах ADMISSION_MAX_CONCURRENCY),
+    # остальные ждут в очереди до ADMISSION_MAX_QUEUE запросов, сверх — 429
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') == '1'
+    ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', '2'))
+    ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '8'))
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '16'))
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '30'))
+    ADMISSION_ADAPTIVE = os.getenv('ADMISSION_ADAPTIVE', '1') == '1'
+    ADMISSION_LATENCY_TOLERANCE = float(os.getenv('ADMISSION_LATENCY_TOLERANCE', '2.0'))
+    # Класс приоритета запросов без X-Priority: interactive | normal | bulk
+    # (/predict/batch без заголовка — всегда bulk)
+    ADMISSION_DEFAULT_PRIORITY = os.getenv('ADMISSION_DEFAULT_PRIORITY', 'normal')
+    
+    # Асинхронный режим (uvicorn app.asgi:application): тело запроса принимается
+    # в цикле событий, обработчики выполняются в пуле из ASYNC_HANDLER_THREADS потоков.
+    # ASYNC_MAX_BODY_MB — предел тела по сети (0 — по MAX_UPLOAD_MB в base64)
+    ASYNC_HANDLER_THREADS = int(os.getenv('ASYNC_HANDLER_THREADS', '16'))
+    ASYNC_MAX_BODY_MB = int(os.getenv('ASYNC_MAX_BODY_MB', '0'))
+    
+    # Очередь асинхронных заданий /jobs. Пустой каталог — выключено
+    JOB_QUEUE_DIR = os.getenv('JOB_QUEUE_DIR', '')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '1000'))
+    JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', '24'))
+    
+    # Превью изображений /images/<hash>/preview (каталог общий для воркеров)
+    PREVIEW_DIR = os.getenv('PREVIEW_DIR', os.path.join(tempfile.gettempdir(), 'flask_ml_previews'))
+    PREVIEW_MAX_SIZE = int(os.getenv('PREVIEW_MAX_SIZE', '512'))
+    PREVIEW_MAX_FILES = int(os.getenv('PREVIEW_MAX_FILES', '10000'))
+    
+    # Метрики /metrics: каждый воркер раз в METRICS_FLUSH_SECONDS пишет снимок
+    # в METRICS_DIR (каталог общий для воркеров, очищается при развертывании).
+    # Пустой каталог — только метрики отвечающего воркера
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'flask_ml_metrics'))
+    METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+    
+    # Запись app.timing (JSON: request ID, статус, время этапов) на каждый запрос
+    REQUEST_TIMING_LOG = os.getenv('REQUEST_TIMING_LOG', '1') == '1'
+    
+    # Логи пишет фоновый поток из очереди до LOG_QUEUE_SIZE записей (сверх — отбрасываются).
+    # Подробные строки этапов (логгер app.stages) — для доли LOG_STAGE_SAMPLE_RATE запросов
+    LOG_ASYNC = os.getenv('LOG_ASYNC', '1') == '1'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_STAGE_SAMPLE_RATE = float(os.getenv('LOG_STAGE_SAMPLE_RATE', '0.01'))
+    
+    # Профилирование запросов: X-Profile = HMAC-SHA256(PROFILE_SECRET, X-Request-ID)
+    # или доля PROFILE_SAMPLE_RATE запросов. Профили — в PROFILE_DIR (кольцо:
+    # не больше PROFILE_MAX_CAPTURES профилей и PROFILE_MAX_MB)
+    PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'flask_ml_profiles'))
+    PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', '50'))
+    PROFILE_MAX_MB = int(os.getenv('PROFILE_MAX_MB', '512'))
+    
+    # Постоянная выборка стеков воркеров (/profiles/stacks): SAMPLER_HZ выборок в
+    # секунду, частота снижается, если затраты выше SAMPLER_MAX_OVERHEAD доли времени
+    SAMPLER_ENABLED = os.getenv('SAMPLER_ENABLED', '1') == '1'
+    SAMPLER_HZ = float(os.getenv('SAMPLER_HZ', '19'))
+    SAMPLER_MAX_OVERHEAD = float(os.getenv('SAMPLER_MAX_OVERHEAD', '0.01'))
+    SAMPLER_INCLUDE_IDLE = os.getenv('SAMPLER_INCLUDE_IDLE', '0') == '1'
+    SAMPLER_DIR = os.getenv('SAMPLER_DIR', os.path.join(tempfile.gettempdir(), 'flask_ml_stacks'))
+    
+    # Бюджет памяти декодирования одного изображения (оценка по заголовку: размер x режим).
+    # Сверх бюджета: downgrade — уменьшенное декодирование (JPEG draft, TIFF полосами),
+    # reject — 413. 0 — без проверки. MEMORY_TRACE — замеры памяти этапов
+    # (tracemalloc и RSS) в /metrics и в app.timing, замедляет обработку
+    MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', '1024'))
+    MEMORY_BUDGET_ACTION = os.getenv('MEMORY_BUDGET_ACTION', 'downgrade')
+    MEMORY_TRACE_ENABLED = os.getenv('MEMORY_TRACE', '0') == '1'
 
 app.config.from_object(Config)
 
+# Запись логов — в фоновом потоке, не в потоке запроса
+from app.logs import AsyncLogging
+async_logging = AsyncLogging(app.config['LOG_QUEUE_SIZE'])
+if app.config['LOG_ASYNC']:
+    async_logging.install()
+
 # Импортируем routes после создания app чтобы избежать circular imports
 from app import routes
 
@@ -0,0 +1,340 @@
+"""
+Контроль допуска и сброс нагрузки (admission control).
+
+При всплеске запросов все потоки воркера одновременно начинают
+декодирование и инференс, и задержка растет для всех. Контроллер
+пропускает к вычислению не больше limit запросов, остальные ждут в
+ограниченной очереди. Если очередь заполнена или ожидаемое ожидание
+больше queue_timeout, запрос сразу отклоняется (429 с Retry-After),
+поэтому задержка допущенных запросов остается ограниченной.
+
+Лимит подстраивается под наблюдаемую задержку (градиентный алгоритм):
+если кратковременная средняя задержка растет выше tolerance x долговременной,
+лимит уменьшается, а пока задержка в норме и лимит используется — растет.
+
+Очередь упорядочена по классу приоритета (interactive, normal, bulk), внутри
+класса — по ближайшему крайнему сроку (deadline), затем по времени прихода.
+Запрос с истекшим сроком отбрасывается до декодирования и инференса
+(DeadlineExceeded). В заполненной очереди новый запрос вытесняет последний
+в порядке обслуживания, если тот менее важен, — массовые пакеты не занимают
+очередь, нужную интерактивным запросам.
+"""
+import math
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Сглаживание задержки: кратковременная и долговременная средние
+SHORT_ALPHA = 0.2
+LONG_ALPHA = 0.02
+
+# Классы приоритета в порядке обслуживания
+PRIORITIES = ('interactive', 'normal', 'bulk')
+
+
+class Overloaded(Exception):
+    """Запрос отклонен контролем допуска; retry_after — через сколько секунд повторить"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Крайний срок запроса истек до начала вычисления — результат уже никому не нужен"""
+
+
+class ScheduleError(ValueError):
+    """Некорректный класс приоритета или крайний срок в запросе"""
+
+
+def parse_priority(value, default='normal'):
+    """Класс приоритета из заголовка X-Priority (без заголовка — default)"""
+    if value is None or value == '':
+        return default
+    priority = value.strip().lower()
+    if priority not in PRIORITIES:
+        raise ScheduleError(f"Неизвестный приоритет: {value}. Допустимы: {', '.join(PRIORITIES)}")
+    return priority
+
+
+def parse_timeout_ms(value):
+    """Оставшееся время запроса из заголовка X-Deadline-Ms в секундах (или None)"""
+    if value is None or value == '':
+        return None
+    try:
+        timeout_ms = float(value)
+    except ValueError:
+        raise ScheduleError(f"Некорректный X-Deadline-Ms: {value}")
+    if math.isnan(timeout_ms):
+        raise ScheduleError(f"Некорректный X-Deadline-Ms: {value}")
+    return timeout_ms / 1000
+
+
+class _Waiter:
+    """Запрос в очереди; порядок — приоритет, крайний срок, время прихода"""
+
+    __slots__ = ('key', 'priority', 'evicted')
+
+    def __init__(self, priority, deadline, seq):
+        self.priority = priority
+        self.key = (PRIORITIES.index(priority), math.inf if deadline is None else deadline, seq)
+        self.evicted = False
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+class PriorityLock:
+    """Блокировка, которую ожидающие получают в порядке очереди допуска
+    (приоритет, крайний срок, время прихода), а не в произвольном порядке.
+
+    Допущенных запросов может быть несколько (limit), а модель считает по
+    одному: без упорядочивания здесь интерактивный запрос ждал бы пакеты,
+    допущенные раньше него.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._locked = False
+
+    @contextmanager
+    def hold(self, priority='normal', deadline=None):
+        with self._cond:
+            waiter = _Waiter(priority, deadline, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+            while self._locked or self._waiters[0] is not waiter:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._locked = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._locked = False
+                self._cond.notify_all()
+
+    def waiting(self):
+        with self._cond:
+            return len(self._waiters)
+
+
+class AdmissionController:
+    """Ограничение одновременных вычислений с очередью и адаптивным лимитом"""
+
+    def __init__(self, enabled=True, limit=2, min_limit=1, max_limit=8, max_queue=16,
+                 queue_timeout=30.0, adaptive=True, tolerance=2.0, smoothing=0.2, clock=time.monotonic):
+        self.enabled = enabled
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self._clock = clock
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._expired = 0
+        self._preempted = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._short = None
+        self._long = None
+
+    def _current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def _estimated_wait(self, position):
+        """Ожидаемое ожидание запроса на позиции position в очереди, секунды"""
+        if self._short is None:
+            return 0.0
+        return position * self._short / self._current_limit()
+
+    def _reject(self, message, position):
+        self._rejected += 1
+        retry_after = max(1, math.ceil(self._estimated_wait(position)))
+        raise Overloaded(message, retry_after)
+
+    def deadline(self, timeout):
+        """Крайний срок по часам контроллера через timeout секунд (None — без срока)"""
+        return None if timeout is None else self._clock() + timeout
+
+    def _check_deadline(self, deadline):
+        if deadline is not None and self._clock() >= deadline:
+            self._expired += 1
+            raise DeadlineExceeded("Крайний срок запроса истек до начала обработки")
+
+    def check(self, priority='normal', deadline=None):
+        """Быстрая проверка до чтения тела запроса: Overloaded или DeadlineExceeded,
+        если его все равно отклонят"""
+        with self._cond:
+            self._check_deadline(deadline)
+            if not self.enabled:
+                return
+            if not self._waiters and self._in_flight < self._current_limit():
+                return
+            self._check_queue(_Waiter(priority, deadline, next(self._seq)))
+
+    def _check_queue(self, waiter):
+        """Overloaded, если запросу нет места в очереди или ждать слишком долго"""
+        ahead = sum(1 for other in self._waiters if other < waiter)
+        position = ahead + 1
+        if len(self._waiters) >= self.max_queue and not (self._waiters and waiter < max(self._waiters)):
+            self._reject(f"Сервер перегружен: в очереди {len(self._waiters)} запросов", position)
+        if self._estimated_wait(position) > self.queue_timeout:
+            self._reject(f"Сервер перегружен: ожидание больше {self.queue_timeout:.0f} с", position)
+
+    def _enqueue(self, waiter):
+        """Ставит запрос в очередь; в полной очереди вытесняет наименее важный"""
+        self._check_queue(waiter)
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters)
+            worst.evicted = True
+            self._remove(worst)
+            self._preempted += 1
+        heapq.heappush(self._waiters, waiter)
+
+    def _remove(self, waiter):
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def acquire(self, priority='normal', deadline=None):
+        """Ждет места для вычисления. Возвращает отметку времени для release().
+
+        priority — класс из PRIORITIES, deadline — крайний срок по часам
+        контроллера (см. deadline()); истекший срок — DeadlineExceeded.
+        """
+        start = self._clock()
+        with self._cond:
+            self._check_deadline(deadline)
+            if not self.enabled:
+                return None
+
+            if self._waiters or self._in_flight >= self._current_limit():
+                waiter = _Waiter(priority, deadline, next(self._seq))
+                self._enqueue(waiter)
+                give_up = start + self.queue_timeout
+                try:
+                    while True:
+                        if waiter.evicted:
+                            self._reject("Сервер перегружен: место в очереди занял более важный запрос",
+                                         len(self._waiters))
+                        if self._waiters[0] is waiter and self._in_flight < self._current_limit():
+                            break
+                        self._check_deadline(deadline)
+                        now = self._clock()
+                        if now >= give_up:
+                            self._timeouts += 1
+                            self._reject(f"Сервер перегружен: ожидание больше {self.queue_timeout:.0f} с",
+                                         len(self._waiters))
+                        self._cond.wait(min(give_up, math.inf if deadline is None else deadline) - now)
+                finally:
+                    # Следующий в очереди проверяет, не его ли теперь очередь
+                    self._remove(waiter)
+
+            self._in_flight += 1
+            self._admitted += 1
+            admitted = self._clock()
+            waited = admitted - start
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return admitted
+
+    def release(self, admitted, weight=1):
+        """Освобождает место; время с acquire() — наблюдаемая задержка.
+
+        weight — число изображений в допущенной работе: задержка пакета
+        делится на него, чтобы один большой пакет не занижал лимит и не
+        вызывал отказы быстрым одиночным запросам.
+        """
+        if admitted is None:
+            return
+        latency = (self._clock() - admitted) / max(1, weight)
+        with self._cond:
+            saturated = self._in_flight >= self.limit / 2
+            self._in_flight -= 1
+            self._observe(latency, saturated)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, weight=1, priority='normal', deadline=None):
+        """Контекст допущенного вычисления"""
+        admitted = self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(admitted, weight)
+
+    def releaser(self, admitted, weight=1):
+        """Функция, освобождающая место не больше одного раза (для потоковых ответов,
+        где место освобождает и генератор, и закрытие ответа)"""
+        lock = threading.Lock()
+        released = []
+
+        def release():
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            self.release(admitted, weight)
+
+        return release
+
+    def _observe(self, latency, saturated):
+        """Обновляет средние задержки и лимит"""
+        if self._short is None:
+            self._short = self._long = latency
+        else:
+            self._short += SHORT_ALPHA * (latency - self._short)
+            self._long += LONG_ALPHA * (latency - self._long)
+
+        if not self.adaptive or self._short <= 0:
+            return
+
+        # Рост задержки сверх tolerance x долговременной уменьшает лимит (не больше чем вдвое)
+        gradient = max(0.5, min(1.0, self.tolerance * self._long / self._short))
+        new_limit = self.limit * gradient
+        # Лимит растет, только если он действительно используется
+        if saturated and gradient == 1.0:
+            new_limit += math.sqrt(self.limit)
+
+        limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+
+    def stats(self):
+        """Лимит, глубина очереди, отказы и время ожидания"""
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'limit': round(self.limit, 2),
+                'in_flight': self._in_flight,
+                'queued': len(self._waiters),
+                'queued_by_priority': {
+                    priority: sum(1 for waiter in self._waiters if waiter.priority == priority)
+                    for priority in PRIORITIES
+                },
+                'max_queue': self.max_queue,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'expired': self._expired,
+                'preempted': self._preempted,
+                'wait_avg_ms': round(self._wait_total / self._admitted * 1000, 3) if self._admitted else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+                'latency_short_ms': round(self._short * 1000, 3) if self._short is not None else None,
+                'latency_long_ms': round(self._long * 1000, 3) if self._long is not None else None,
+            }
@@ -0,0 +1,223 @@
+"""
+Асинхронный режим обслуживания (ASGI): `uvicorn app.asgi:application`.
+
+В режиме gunicorn sync/gthread поток воркера занят запросом все время,
+пока медленный клиент передает тело (десятки MB base64 по сети
+лаборатории). Здесь тело принимается в цикле событий без потока: блоки из
+receive() пишутся во временный файл (в памяти — до UPLOAD_SPOOL_MB, запись
+на диск — в стандартном пуле цикла, чтобы не блокировать его), и только
+полностью полученный запрос передается Flask-приложению в ограниченный пул
+потоков (ASYNC_HANDLER_THREADS). Декодирование идет в пуле
+предобработки, инференс — под контролем допуска, как и в синхронном режиме,
+поэтому воркер держит тысячи медленных соединений, а вычисления остаются
+ограниченными. Ответ (в том числе поток NDJSON) отдается по блокам: каждый
+блок берется из итератора WSGI в пуле, между блоками поток не занят.
+"""
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from app.tracing import REQUEST_ID_HEADER, request_id
+from app.uploads import body_limit
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Маркер конца итератора ответа WSGI
+_END = object()
+
+
+class WSGIBridge:
+    """ASGI-приложение поверх WSGI-приложения Flask.
+
+    max_body — предел тела запроса по сети (больше — 413 без передачи в
+    приложение), spool_bytes — сколько тела держать в памяти до записи на
+    диск, threads — размер пула, в котором выполняются обработчики.
+    """
+
+    def __init__(self, wsgi_app, max_body, spool_bytes, threads, spool_dir=None, on_startup=None):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir
+        self.on_startup = on_startup
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-handler')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Неподдерживаемый тип ASGI: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        """Загрузка модели при старте воркера, остановка пула при завершении"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.on_startup is not None:
+                        await asyncio.get_running_loop().run_in_executor(self.executor, self.on_startup)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка запуска ASGI-воркера: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        headers = [(name.decode('latin-1').lower(), value.decode('latin-1')) for name, value in scope['headers']]
+        declared = next((value for name, value in headers if name == 'content-length'), None)
+        if declared is not None and declared.isdigit() and int(declared) > self.max_body:
+            await self._error(send, 413, f"Тело запроса больше {self.max_body / MB:.0f} MB", headers)
+            return
+
+        # Тело читается без потока: блоки по мере прихода от клиента
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, dir=self.spool_dir)
+        loop = asyncio.get_running_loop()
+        try:
+            size = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if size > self.max_body:
+                    await self._error(send, 413, f"Тело запроса больше {self.max_body / MB:.0f} MB", headers)
+                    return
+                if chunk and self.spool_bytes and size > self.spool_bytes:
+                    # Тело уже (или с этим блоком) на диске: запись не блокирует цикл событий
+                    await loop.run_in_executor(None, body.write, chunk)
+                elif chunk:
+                    body.write(chunk)
+                more_body = message.get('more_body', False)
+            body.seek(0)
+
+            await self._respond(build_environ(scope, headers, body, size), send)
+        finally:
+            body.close()
+
+    async def _respond(self, environ, send):
+        """Обработчик Flask выполняется в пуле; ответ передается по блокам"""
+        loop = asyncio.get_running_loop()
+        response = {}
+        # Блоки, переданные через write() из start_response (устаревший интерфейс WSGI)
+        written = []
+
+        def start_response(status, response_headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in response_headers]
+            return written.append
+
+        app_iter = await loop.run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+        iterator = iter(app_iter)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, _END)
+                pending = b''.join(written)
+                written.clear()
+                if chunk is _END:
+                    await self._send_chunk(send, response, pending, more_body=False)
+                    break
+                if pending or chunk:
+                    await self._send_chunk(send, response, pending + chunk, more_body=True)
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+    @staticmethod
+    async def _send_chunk(send, response, chunk, more_body):
+        if not response.get('sent'):
+            response['sent'] = True
+            await send({'type': 'http.response.start', 'status': response['status'],
+                        'headers': response['headers']})
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+    @staticmethod
+    async def _error(send, status, message, headers=()):
+        """Ответ в формате приложения ({'success': False, 'error': ...}) без вызова Flask,
+        с X-Request-ID клиента (или новым), как у ответов приложения"""
+        incoming = next((value for name, value in headers if name == REQUEST_ID_HEADER.lower()), None)
+        body = json.dumps({'success': False, 'error': message}).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'connection', b'close'),
+            (REQUEST_ID_HEADER.lower().encode(), request_id(incoming).encode('latin-1')),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def build_environ(scope, headers, body, size):
+    """WSGI environ для полностью полученного запроса (PEP 3333)"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI передает строки как байты UTF-8 в latin-1
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        # Тело получено целиком: его длина известна, даже если клиент слал chunked
+        'CONTENT_LENGTH': str(size),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers:
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def load_model_once():
+    """Модель и очередь заданий запускаются в каждом воркере uvicorn при старте"""
+    from app import routes
+    if routes.model is None:
+        routes.load_model()
+    # Очередь заданий — сразу при старте воркера, а не с первым запросом
+    if routes.jobs is not None:
+        routes.jobs.ensure_started(routes.run_job)
+
+
+application = WSGIBridge(
+    app,
+    max_body=app.config['ASYNC_MAX_BODY_MB'] * MB or body_limit(app.config['MAX_UPLOAD_MB'] * MB, base64_encoded=True),
+    spool_bytes=app.config['UPLOAD_SPOOL_MB'] * MB,
+    threads=app.config['ASYNC_HANDLER_THREADS'],
+    spool_dir=app.config['UPLOAD_SPOOL_DIR'],
+    on_startup=load_model_once,
+)
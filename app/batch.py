@@ -0,0 +1,194 @@
+"""
+Разбор пакетных запросов /predict/batch.
+
+Пакет приходит как multipart/form-data (каждый файл — отдельный элемент),
+zip-архив или JSON массив изображений в base64. Каждый элемент получает
+уникальное имя, по которому в ответе возвращается его результат. Ошибки
+отдельных элементов (битый base64, некорректный ROI) не прерывают пакет —
+они записываются в элемент и возвращаются в его результате.
+
+Байты изображения читаются лениво (load_item), когда до элемента доходит
+очередь: в потоковом режиме в памяти одновременно находятся только
+изображения обрабатываемых батчей.
+"""
+import io
+import base64
+import binascii
+import zipfile
+import zlib
+
+from app.imaging import ROIError, parse_roi
+
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+class BatchError(ValueError):
+    """Пакет целиком некорректен (формат, число элементов, размер)"""
+
+
+class ItemError(ValueError):
+    """Ошибка отдельного элемента пакета"""
+
+
+def make_item(name, load=None, roi=None, error=None):
+    """Элемент пакета; load() возвращает байты изображения"""
+    return {'name': name, 'load': load, 'roi': roi, 'error': error}
+
+
+def load_item(item):
+    """Байты изображения элемента. Ошибки чтения — ItemError"""
+    if item['error'] is not None:
+        raise ItemError(item['error'])
+    try:
+        image_bytes = item['load']()
+    except (binascii.Error, zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, OSError) as e:
+        raise ItemError(f"Не удалось прочитать изображение: {e}")
+    if not image_bytes:
+        raise ItemError('No image data provided')
+    return image_bytes
+
+
+def unique_name(name, seen):
+    """Имя элемента, уникальное в пределах пакета (повторы получают суффикс #n)"""
+    candidate = name
+    index = 1
+    while candidate in seen:
+        index += 1
+        candidate = f"{name}#{index}"
+    seen.add(candidate)
+    return candidate
+
+
+def _check_count(count, max_items):
+    if count > max_items:
+        raise BatchError(f"Слишком много изображений в пакете: {count}, максимум {max_items}")
+
+
+def _decode_base64(image_data):
+    return lambda: base64.b64decode(image_data, validate=True)
+
+
+def items_from_json(data, max_items):
+    """Элементы из JSON: {"images": [...]} или сам массив.
+
+    Элемент массива — строка base64 (data URL) или объект
+    {"name", "image", "roi"}; имя по умолчанию — индекс.
+    """
+    images = data.get('images') if isinstance(data, dict) else data
+    if not isinstance(images, list) or not images:
+        raise BatchError("Ожидается непустой массив images")
+    _check_count(len(images), max_items)
+
+    items = []
+    seen = set()
+    for index, entry in enumerate(images):
+        if isinstance(entry, dict):
+            name = unique_name(str(entry.get('name') or index), seen)
+            image_data = entry.get('image')
+            roi_value = entry.get('roi')
+        else:
+            name = unique_name(str(index), seen)
+            image_data = entry
+            roi_value = None
+
+        if not isinstance(image_data, str) or not image_data:
+            items.append(make_item(name, error='No image data provided'))
+            continue
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+
+        try:
+            roi = parse_roi(roi_value)
+        except ROIError as e:
+            items.append(make_item(name, error=str(e)))
+            continue
+        items.append(make_item(name, _decode_base64(image_data), roi))
+
+    return items
+
+
+def _zip_members(archive):
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+    ]
+
+
+def _open_zip(source):
+    try:
+        return zipfile.ZipFile(source)
+    except zipfile.BadZipFile as e:
+        raise BatchError(f"Некорректный zip-архив: {e}")
+
+
+def _zip_items(archive, members, roi, seen):
+    return [
+        make_item(unique_name(info.filename, seen), lambda info=info: archive.read(info), roi)
+        for info in members
+    ]
+
+
+def _check_unpacked_size(total, max_bytes):
+    # Размер после распаковки проверяется до чтения — защита от zip-бомб
+    if total > max_bytes:
+        raise BatchError(f"Архив после распаковки занимает {total / 1024 / 1024:.1f} MB, "
+                         f"максимум {max_bytes / 1024 / 1024:.0f} MB")
+
+
+def _check_total_size(total, max_bytes):
+    if total > max_bytes:
+        raise BatchError(f"Изображения пакета занимают {total / 1024 / 1024:.1f} MB, "
+                         f"максимум {max_bytes / 1024 / 1024:.0f} MB")
+
+
+def _part_size(upload):
+    """Размер части multipart: Werkzeug уже сохранил ее в памяти или во временном файле"""
+    stream = upload.stream
+    position = stream.tell()
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def items_from_zip(source, max_items, max_bytes, roi=None):
+    """Элементы из zip-архива: каждый файл (кроме каталогов) — изображение.
+
+    source — байты архива или путь к файлу (файл должен существовать, пока
+    элементы не прочитаны).
+    """
+    archive = _open_zip(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    members = _zip_members(archive)
+    _check_count(len(members), max_items)
+    _check_unpacked_size(sum(info.file_size for info in members), max_bytes)
+    return _zip_items(archive, members, roi, set())
+
+
+def items_from_files(files, max_items, max_bytes, roi=None):
+    """Элементы из multipart/form-data: каждый файл, zip-архивы распаковываются.
+
+    Werkzeug держит большие части во временных файлах, поэтому файлы
+    читаются только при обработке элемента.
+    """
+    items = []
+    seen = set()
+    # Суммарный размер изображений: файлы как есть, архивы — после распаковки
+    total = 0
+    for field, upload in files.items(multi=True):
+        if upload.mimetype in ZIP_MIMETYPES or (upload.filename or '').lower().endswith('.zip'):
+            archive = _open_zip(upload.stream)
+            members = _zip_members(archive)
+            _check_count(len(items) + len(members), max_items)
+            total += sum(info.file_size for info in members)
+            _check_total_size(total, max_bytes)
+            items.extend(_zip_items(archive, members, roi, seen))
+            continue
+
+        _check_count(len(items) + 1, max_items)
+        total += _part_size(upload)
+        _check_total_size(total, max_bytes)
+        items.append(make_item(unique_name(upload.filename or field, seen), upload.read, roi))
+
+    if not items:
+        raise BatchError("В запросе нет изображений")
+    return items
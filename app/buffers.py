@@ -0,0 +1,77 @@
+"""
+Пул заранее выделенных буферов входа модели.
+
+Вместо новых массивов 299x299x3 float32 на каждый запрос декодированные
+пиксели записываются прямо в слот буфера, а модель читает его на месте.
+Буферы выровнены по 64 байтам, чтобы TensorFlow мог использовать память
+без копирования.
+"""
+import queue
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_INPUT_SHAPE = (299, 299, 3)
+BUFFER_ALIGNMENT = 64
+
+
+def aligned_empty(shape, dtype=np.float32, alignment=BUFFER_ALIGNMENT):
+    """Неинициализированный массив, выровненный по alignment байт"""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = (-raw.ctypes.data) % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+class BufferPool:
+    """Пул переиспользуемых буферов формы (batch_size, 299, 299, 3)"""
+
+    def __init__(self, slots, batch_size=1, shape=MODEL_INPUT_SHAPE, dtype=np.float32):
+        self.batch_size = batch_size
+        self.shape = (batch_size,) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self._free = queue.LifoQueue()
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._overflow = 0
+
+        for _ in range(slots):
+            buffer = aligned_empty(self.shape, self.dtype)
+            self._owned.add(id(buffer))
+            self._free.put(buffer)
+
+        logger.info(f"📦 Пул буферов: {slots} x {self.shape}, "
+                    f"{slots * int(np.prod(self.shape)) * self.dtype.itemsize / 1024 / 1024:.1f} MB")
+
+    def acquire(self):
+        """Берет свободный буфер. Если пул исчерпан — выделяет временный"""
+        with self._lock:
+            self._acquired += 1
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._overflow += 1
+            return aligned_empty(self.shape, self.dtype)
+
+    def release(self, buffer):
+        """Возвращает буфер в пул (временные буферы просто освобождаются)"""
+        if id(buffer) in self._owned:
+            self._free.put(buffer)
+
+    def stats(self):
+        """Использование пула"""
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'free': self._free.qsize(),
+                'batch_size': self.batch_size,
+                'acquired': self._acquired,
+                'overflow': self._overflow,
+            }
@@ -0,0 +1,118 @@
+"""
+LRU-кэш результатов предсказаний в памяти процесса.
+
+Ключ — хэш декодированных байтов изображения и версия модели, поэтому
+повторная отправка того же файла возвращает результат до декодирования
+изображения, предобработки и инференса.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def image_hash(image_bytes):
+    """SHA-256 байтов файла изображения (hex).
+
+    У загрузки во временном файле (SpooledUpload) он уже посчитан при записи.
+    """
+    content_hash = getattr(image_bytes, 'hash', None)
+    if content_hash is not None:
+        return content_hash
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def cache_key(content_hash, model_version, roi=None):
+    """Ключ кэша: версия модели + хэш содержимого (+ ROI, если задан)"""
+    key = f"{model_version}:{content_hash}"
+    if roi is not None:
+        key += ":roi=" + ",".join(str(v) for v in roi)
+    return key
+
+
+class PredictionCache:
+    """Ограниченный LRU-кэш с TTL, лимитами по числу записей и объему"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Возвращает значение или None. Обращение поднимает запись в начало LRU"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if self.ttl and expires_at <= self._clock():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value, size):
+        """Сохраняет значение размером size байт, вытесняя старые записи"""
+        if not self.enabled or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (self._clock() + self.ttl, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Очищает кэш (счетчики сохраняются)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Заполненность кэша и доля попаданий"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
@@ -0,0 +1,181 @@
+"""
+Сжатые тела запросов (Content-Encoding: gzip, zstd).
+
+Несжатые TIFF микроскопии сжимаются в 3-5 раз, а загрузки идут по
+медленной сети лаборатории. WSGI-middleware подменяет wsgi.input потоком,
+который распаковывает тело по мере чтения, поэтому endpoints читают его
+как обычное; тело без Content-Length большие endpoints пишут на диск
+блоками (см. app.uploads). Распакованный объем ограничен — «бомба»
+обрывается с 413, битые данные — 400. zstd доступен, если установлен
+пакет zstandard.
+"""
+import io
+import gzip
+import json
+import zlib
+import threading
+import logging
+
+from werkzeug.wsgi import get_input_stream
+
+from app.uploads import UploadError, UploadTooLarge
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def _gzip_reader(raw):
+    return gzip.GzipFile(fileobj=raw, mode='rb')
+
+
+def _zstd_reader(raw):
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+
+# Content-Encoding -> функция, открывающая распаковывающий поток
+DECODERS = {'gzip': _gzip_reader, 'x-gzip': _gzip_reader}
+if zstandard is not None:
+    DECODERS['zstd'] = _zstd_reader
+
+DECODE_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def supported_encodings():
+    """Поддерживаемые Content-Encoding (для Accept-Encoding в ответе 415)"""
+    return [encoding for encoding in DECODERS if not encoding.startswith('x-')]
+
+
+class CountingReader(io.RawIOBase):
+    """Поток тела запроса со счетчиком прочитанных (сжатых) байтов"""
+
+    def __init__(self, stream, on_read):
+        self._stream = stream
+        self._on_read = on_read
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self._on_read(len(data))
+        return len(data)
+
+
+class DecodedStream(io.RawIOBase):
+    """Распаковка тела по мере чтения с ограничением распакованного объема"""
+
+    def __init__(self, raw, encoding, max_bytes, stats):
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self.size = 0
+        self._reader = DECODERS[encoding](CountingReader(raw, self._count_wire))
+
+    def _count_wire(self, size):
+        self.stats.add(self.encoding, wire=size)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._reader.read(len(buffer))
+        except DECODE_ERRORS as e:
+            raise UploadError(f"Не удалось распаковать тело запроса ({self.encoding}): {e}")
+
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.stats.add(self.encoding, rejected=1)
+            raise UploadTooLarge(f"Распакованное тело запроса больше {self.max_bytes / 1024 / 1024:.0f} MB")
+        self.stats.add(self.encoding, decoded=len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class CompressionStats:
+    """Счетчики сжатых запросов: байты по сети и после распаковки"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def add(self, encoding, requests=0, wire=0, decoded=0, rejected=0):
+        with self._lock:
+            counters = self._counters.setdefault(
+                encoding, {'requests': 0, 'wire_bytes': 0, 'decoded_bytes': 0, 'rejected': 0}
+            )
+            counters['requests'] += requests
+            counters['wire_bytes'] += wire
+            counters['decoded_bytes'] += decoded
+            counters['rejected'] += rejected
+
+    def stats(self):
+        with self._lock:
+            encodings = {}
+            for encoding, counters in self._counters.items():
+                encodings[encoding] = dict(counters)
+                if counters['wire_bytes']:
+                    encodings[encoding]['ratio'] = round(counters['decoded_bytes'] / counters['wire_bytes'], 3)
+            return {'supported': supported_encodings(), 'encodings': encodings}
+
+
+class DecompressionMiddleware:
+    """WSGI-middleware: тело с Content-Encoding отдается приложению распакованным.
+
+    Content-Length распакованного тела неизвестен, поэтому он удаляется, а
+    конец тела отмечается wsgi.input_terminated. Исходная кодировка и размер
+    по сети остаются в environ (flask_ml.content_encoding, flask_ml.wire_length).
+    """
+
+    def __init__(self, wsgi_app, max_bytes, limits=None):
+        self.wsgi_app = wsgi_app
+        self.max_bytes = max_bytes
+        self.limits = limits or {}
+        self.stats = CompressionStats()
+
+    def limit_for(self, path):
+        """Предел распакованного тела для пути: из limits или общий max_bytes.
+
+        Большой предел безопасен только там, где тело пишется на диск, а не
+        читается в память целиком.
+        """
+        return self.limits.get(path.rstrip('/') or '/', self.max_bytes)
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return self.wsgi_app(environ, start_response)
+
+        if encoding not in DECODERS:
+            return self._unsupported(encoding, start_response)
+
+        # Сжатое тело читается не дальше исходного Content-Length
+        raw = get_input_stream(environ)
+        self.stats.add(encoding, requests=1)
+        environ['flask_ml.content_encoding'] = encoding
+        environ['flask_ml.wire_length'] = environ.pop('CONTENT_LENGTH', None)
+        max_bytes = self.limit_for(environ.get('PATH_INFO', ''))
+        environ['wsgi.input'] = DecodedStream(raw, encoding, max_bytes, self.stats)
+        environ['wsgi.input_terminated'] = True
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.wsgi_app(environ, start_response)
+
+    def _unsupported(self, encoding, start_response):
+        """415 с перечнем поддерживаемых кодировок (RFC 7694)"""
+        logger.warning(f"⚠️  Неподдерживаемый Content-Encoding: {encoding}")
+        body = json.dumps({
+            'success': False,
+            'error': f"Неподдерживаемый Content-Encoding: {encoding}. "
+                     f"Поддерживаются: {', '.join(supported_encodings())}"
+        }).encode()
+        start_response('415 Unsupported Media Type', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Accept-Encoding', ', '.join(supported_encodings())),
+        ])
+        return [body]
@@ -0,0 +1,269 @@
+"""
+Декодирование изображений с поддержкой области интереса (ROI).
+
+Декодируется только нужная часть изображения:
+- несжатые TIFF (полосы и тайлы) — читаются только байты, попадающие в ROI;
+- JPEG — декодирование в уменьшенном масштабе (draft) и обрезка;
+- остальные форматы — полное декодирование и обрезка.
+
+Для изображений, не помещающихся в бюджет памяти, — уменьшенное
+декодирование целиком (open_reduced): JPEG через draft, несжатые TIFF —
+полосами, каждая из которых сразу уменьшается.
+"""
+import json
+import logging
+
+from PIL import Image
+
+from app.uploads import image_source
+
+logger = logging.getLogger(__name__)
+# Строки этапов запроса — в логгер app.stages с выборкой (фильтр задает app/routes.py)
+stage_logger = logging.getLogger('app.stages')
+
+# Размер входа модели: ROI не уменьшаем сильнее, чем до этого размера
+MODEL_INPUT_SIZE = (299, 299)
+
+# Режимы, которые Image.reduce уменьшает без конвертации
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK', 'YCbCr', 'I', 'F')
+
+# TIFF теги
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_PLANAR_CONFIG = 284
+
+
+class ROIError(ValueError):
+    """Некорректная область интереса"""
+
+
+def parse_roi(value):
+    """Разбор ROI из запроса.
+
+    Принимает {'x', 'y', 'width', 'height'}, [x, y, width, height] или
+    строку (JSON либо "x,y,width,height" — для query string и полей формы).
+    Возвращает (left, top, right, bottom) или None, если ROI не задан.
+    """
+    if value is None or value == '':
+        return None
+
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.lstrip().startswith(('{', '[')) else value.split(',')
+        except ValueError:
+            raise ROIError("ROI должен быть {'x', 'y', 'width', 'height'} или [x, y, width, height]")
+
+    try:
+        if isinstance(value, dict):
+            x, y = value['x'], value['y']
+            width, height = value['width'], value['height']
+        elif isinstance(value, (list, tuple)) and len(value) == 4:
+            x, y, width, height = value
+        else:
+            raise ValueError(value)
+        x, y, width, height = (int(v) for v in (x, y, width, height))
+    except (KeyError, TypeError, ValueError):
+        raise ROIError("ROI должен быть {'x', 'y', 'width', 'height'} или [x, y, width, height]")
+
+    if x < 0 or y < 0 or width <= 0 or height <= 0:
+        raise ROIError("ROI должен иметь неотрицательные координаты и положительный размер")
+
+    return (x, y, x + width, y + height)
+
+
+def clamp_roi(box, size):
+    """Ограничивает ROI границами изображения"""
+    left, top, right, bottom = box
+    width, height = size
+    clamped = (min(left, width), min(top, height), min(right, width), min(bottom, height))
+
+    if clamped[2] <= clamped[0] or clamped[3] <= clamped[1]:
+        raise ROIError(f"ROI {roi_to_dict(box)} находится за пределами изображения {width}x{height}")
+
+    return clamped
+
+
+def roi_to_dict(box):
+    """(left, top, right, bottom) -> {'x', 'y', 'width', 'height'}"""
+    left, top, right, bottom = box
+    return {'x': left, 'y': top, 'width': right - left, 'height': bottom - top}
+
+
+def open_image_region(image_bytes, roi):
+    """Открывает изображение и декодирует только область ROI.
+
+    Возвращает (image, info): загруженное PIL изображение области и словарь
+    с фактически использованным ROI (в координатах исходного изображения),
+    размером исходного изображения, масштабом и способом декодирования.
+    """
+    image = Image.open(image_source(image_bytes))
+    source_size = image.size
+    box = clamp_roi(roi, source_size)
+    scale = 1
+
+    if image.format == 'TIFF' and _restrict_raw_tiles(image, box):
+        # Список тайлов уже указывает только на байты ROI
+        image.load()
+        method = 'tiff_region'
+    elif image.format == 'JPEG':
+        scale = _draft_jpeg(image, box)
+        left, top, right, bottom = box
+        width, height = image.size
+        draft_box = (
+            left // scale,
+            top // scale,
+            min(-(-right // scale), width),
+            min(-(-bottom // scale), height),
+        )
+        image = image.crop(draft_box)
+        method = 'jpeg_draft' if scale > 1 else 'full'
+    else:
+        image = image.crop(box)
+        method = 'full'
+
+    stage_logger.info("✂️  ROI %s из %s: метод %s, масштаб 1/%s, декодировано %s",
+                      box, source_size, method, scale, image.size)
+
+    info = {
+        'roi': roi_to_dict(box),
+        'source_size': list(source_size),
+        'decode_scale': scale,
+        'decode_method': method,
+    }
+    return image, info
+
+
+def _draft_jpeg(image, box, target_size=MODEL_INPUT_SIZE):
+    """Уменьшенное декодирование JPEG так, чтобы ROI не стал меньше входа модели.
+
+    Возвращает фактический коэффициент уменьшения (1, 2, 4 или 8).
+    """
+    roi_width, roi_height = box[2] - box[0], box[3] - box[1]
+    factor = min(roi_width // target_size[0], roi_height // target_size[1])
+    if factor < 2:
+        return 1
+
+    width, height = image.size
+    result = image.draft(image.mode, (width // factor, height // factor))
+    if not result:
+        return 1
+
+    return max(1, round(width / image.size[0]))
+
+
+def _restrict_raw_tiles(image, box):
+    """Перестраивает список тайлов несжатого TIFF под ROI.
+
+    Каждый тайл (или полоса), пересекающий ROI, заменяется подпрямоугольником:
+    смещение указывает на первый пиксель пересечения, а stride остается
+    исходным, поэтому декодер пропускает байты вне ROI. Возвращает False,
+    если формат этого не позволяет (сжатие, planar-конфигурация и т.п.).
+    """
+    bytes_per_pixel = _raw_tiff_pixel_bytes(image)
+    if bytes_per_pixel is None:
+        return False
+
+    tiles = image.tile
+    left, top, right, bottom = box
+    region_tiles = []
+    for tile in tiles:
+        x0, y0, x1, y1 = tile[1]
+        rawmode, stride, ystep = tile[3]
+
+        ix0, iy0 = max(x0, left), max(y0, top)
+        ix1, iy1 = min(x1, right), min(y1, bottom)
+        if ix0 >= ix1 or iy0 >= iy1:
+            continue
+
+        stride = int(stride) or (x1 - x0) * bytes_per_pixel
+        offset = tile[2] + (iy0 - y0) * stride + (ix0 - x0) * bytes_per_pixel
+        extents = (ix0 - left, iy0 - top, ix1 - left, iy1 - top)
+        region_tiles.append(_replace_tile(tile, extents, offset, (rawmode, stride, 1)))
+
+    image.tile = region_tiles
+    image._size = (right - left, bottom - top)
+    return True
+
+
+def _raw_tiff_pixel_bytes(image):
+    """Байт на пиксель несжатого TIFF, который можно читать по частям; иначе None"""
+    tiles = image.tile
+    if image.format != 'TIFF' or not tiles or any(tile[0] != 'raw' for tile in tiles):
+        return None
+    if image.tag_v2.get(TIFF_PLANAR_CONFIG, 1) != 1:
+        return None
+    if any(tile[3][2] != 1 for tile in tiles):
+        return None
+
+    bits = image.tag_v2.get(TIFF_BITS_PER_SAMPLE, (1,))
+    bits = sum(bits) if isinstance(bits, tuple) else bits
+    if bits % 8:
+        return None
+    return bits // 8
+
+
+def reduction_method(image):
+    """Способ уменьшенного декодирования открытого изображения: 'jpeg_draft',
+    'tiff_bands' или None, если формат декодируется только целиком"""
+    if image.format == 'JPEG':
+        return 'jpeg_draft'
+    if _raw_tiff_pixel_bytes(image) is not None:
+        return 'tiff_bands'
+    return None
+
+
+def reduced_mode(mode):
+    """Режим уменьшенного изображения: Image.reduce работает не со всеми режимами"""
+    return mode if mode in REDUCIBLE_MODES else 'RGB'
+
+
+def open_reduced(image_bytes, factor, band_rows):
+    """Декодирует изображение целиком с уменьшением в factor раз.
+
+    JPEG — через draft (factor 2, 4 или 8), несжатый TIFF — полосами по
+    band_rows строк (кратно factor): полоса читается через список тайлов,
+    уменьшается усреднением и вставляется в итоговое изображение, поэтому
+    в памяти одновременно только одна полоса. Возвращает (image, info) —
+    как open_image_region, без ROI.
+    """
+    image = Image.open(image_source(image_bytes))
+    source_size = image.size
+    width, height = source_size
+    method = reduction_method(image)
+
+    if method == 'jpeg_draft':
+        image.draft(image.mode, (width // factor, height // factor))
+        image.load()
+        scale = max(1, round(width / image.size[0]))
+    elif method == 'tiff_bands':
+        out_width, out_height = width // factor, height // factor
+        mode = reduced_mode(image.mode)
+        reduced = Image.new(mode, (out_width, out_height))
+        band_rows = max(factor, band_rows // factor * factor)
+        for top in range(0, out_height * factor, band_rows):
+            bottom = min(top + band_rows, out_height * factor)
+            band = Image.open(image_source(image_bytes))
+            _restrict_raw_tiles(band, (0, top, out_width * factor, bottom))
+            band.load()
+            if band.mode != mode:
+                band = band.convert(mode)
+            reduced.paste(band.reduce(factor), (0, top // factor))
+        image = reduced
+        scale = factor
+    else:
+        raise ValueError(f"Формат {image.format} не поддерживает уменьшенное декодирование")
+
+    stage_logger.info("🪶 Уменьшенное декодирование %s: метод %s, масштаб 1/%s, декодировано %s",
+                      source_size, method, scale, image.size)
+    info = {
+        'source_size': list(source_size),
+        'decode_scale': scale,
+        'decode_method': method,
+    }
+    return image, info
+
+
+def _replace_tile(tile, extents, offset, args):
+    """Копия тайла с новыми границами (tuple в старых Pillow, namedtuple в новых)"""
+    if hasattr(tile, '_replace'):
+        return tile._replace(extents=extents, offset=offset, args=args)
+    return (tile[0], extents, offset, args)
@@ -0,0 +1,393 @@
+"""
+Асинхронные задания для долгих анализов (тайловые и многостраничные TIFF).
+
+POST /jobs сразу возвращает id задания, а обработка идет в ограниченном
+пуле фоновых потоков воркера, а не в потоке веб-запроса — интерактивные
+запросы не ждут, долгие анализы не упираются в timeout gunicorn.
+
+Очередь хранится в SQLite (WAL) на примонтированном томе, входные файлы —
+рядом в каталоге inputs/. Выполняемое задание держит аренду (lease), которую
+продлевает его процесс; если воркер перезапущен или упал, аренда истекает
+и задание возвращается в очередь (не больше max_attempts раз).
+"""
+import os
+import json
+import uuid
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+from app.uploads import SpooledUpload
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+
+class QueueFull(Exception):
+    """В очереди уже max_pending незавершенных заданий"""
+
+
+class JobQueue:
+    """Персистентная очередь заданий с пулом фоновых потоков"""
+
+    def __init__(self, directory, workers=1, max_pending=1000, lease=60.0, max_attempts=3,
+                 retention=24 * 3600, poll_interval=1.0, timeout=5.0, stale_tmp=3600.0):
+        self.directory = directory
+        self.path = os.path.join(directory, 'jobs.sqlite3')
+        self.inputs_dir = os.path.join(directory, 'inputs')
+        self.workers = workers
+        self.max_pending = max_pending
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        # Недописанные входные файлы (*.tmp) упавших submit старше stale_tmp удаляются
+        self.stale_tmp = stale_tmp
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._running = set()
+        self._pid = None
+        self._handler = None
+        self.worker_id = None
+        self._completed = 0
+        self._failed = 0
+        self._tmp_cleaned = 0.0
+
+        os.makedirs(self.inputs_dir, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        """Соединение на поток (и на процесс — после fork создается новое)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция с блокировкой записи сразу — захват задания атомарен между процессами"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def input_path(self, job_id):
+        return os.path.join(self.inputs_dir, job_id)
+
+    def ensure_started(self, handler):
+        """Запускает фоновые потоки в текущем процессе (после fork — заново).
+
+        handler(image_bytes, params) возвращает результат задания (dict).
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._handler = handler
+            self._running = set()
+            self._stopping.clear()
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            self._threads.append(threading.Thread(target=self._maintain, name='job-maintenance', daemon=True))
+            for thread in self._threads:
+                thread.start()
+        logger.info(f"🗂️  Очередь заданий запущена: {self.path}, потоков: {self.workers}")
+
+    def stop(self, timeout=5.0):
+        """Останавливает фоновые потоки (выполняемые задания дорабатывают)"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._threads = []
+            self._pid = None
+
+    def submit(self, image_bytes, params=None):
+        """Ставит задание в очередь и возвращает его описание.
+
+        image_bytes — байты или SpooledUpload (его файл копируется блоками).
+        """
+        job_id = uuid.uuid4().hex
+
+        # Входной файл пишется до записи в очередь: воркер не увидит задание без данных
+        fd, tmp_path = tempfile.mkstemp(dir=self.inputs_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(image_bytes, SpooledUpload):
+                    with open(image_bytes.path, 'rb') as source:
+                        shutil.copyfileobj(source, f)
+                else:
+                    f.write(image_bytes)
+            os.replace(tmp_path, self.input_path(job_id))
+        except BaseException:
+            # Процесс, упавший здесь, оставит *.tmp — его удалит _maintain
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        try:
+            with self._transaction() as conn:
+                pending = conn.execute(
+                    'SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)', (QUEUED, RUNNING)
+                ).fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f"В очереди {pending} заданий, максимум {self.max_pending}")
+                conn.execute(
+                    'INSERT INTO jobs (id, status, params, created) VALUES (?, ?, ?, ?)',
+                    (job_id, QUEUED, json.dumps(params or {}), time.time())
+                )
+        except BaseException:
+            self._remove_input(job_id)
+            raise
+
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Состояние задания (с результатом, если оно выполнено) или None"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT id, status, result, error, attempts, created, started, finished FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job_id, status, result, error, attempts, created, started, finished = row
+        job = {
+            'job_id': job_id,
+            'status': status,
+            'attempts': attempts,
+            'created': created,
+            'started': started,
+            'finished': finished,
+        }
+        if status == QUEUED:
+            job['position'] = conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?', (QUEUED, created)
+            ).fetchone()[0]
+        if result is not None:
+            job['result'] = json.loads(result)
+        if error is not None:
+            job['error'] = error
+        return job
+
+    def _claim(self):
+        """Забирает самое старое задание из очереди; возвращает (id, params) или None"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Задания упавших воркеров: аренда истекла — повтор или отказ
+            failed = [row[0] for row in conn.execute(
+                'SELECT id FROM jobs WHERE status = ? AND lease_until < ? AND attempts >= ?',
+                (RUNNING, now, self.max_attempts)
+            )]
+            conn.executemany(
+                'UPDATE jobs SET status = ?, error = ?, finished = ?, lease_until = NULL, worker = NULL '
+                'WHERE id = ?',
+                [(FAILED, 'Воркер остановился во время выполнения задания', now, job_id) for job_id in failed]
+            )
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND lease_until < ?',
+                (QUEUED, RUNNING, now)
+            )
+
+            row = conn.execute(
+                'SELECT id, params FROM jobs WHERE status = ? ORDER BY created LIMIT 1', (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started = ?, lease_until = ? '
+                    'WHERE id = ?',
+                    (RUNNING, self.worker_id, now, now + self.lease, row[0])
+                )
+
+        # Входы удаляются после фиксации транзакции: при откате задания остаются с данными
+        for job_id in failed:
+            logger.warning(f"⚠️  Задание {job_id} остановило воркер {self.max_attempts} раз, помечено failed")
+            self._remove_input(job_id)
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _complete(self, job_id, result=None, error=None):
+        """Записывает результат, если задание все еще за этим воркером"""
+        status = FAILED if error is not None else DONE
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (status, None if result is None else json.dumps(result), error, time.time(),
+                 job_id, self.worker_id, RUNNING)
+            )
+        if cursor.rowcount == 0:
+            # Аренда истекла и задание забрал другой воркер: его вход еще нужен
+            logger.warning(f"⚠️  Задание {job_id} уже не за этим воркером, результат отброшен")
+            return
+        self._remove_input(job_id)
+        with self._lock:
+            if error is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def _remove_input(self, job_id):
+        try:
+            os.remove(self.input_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _work(self):
+        """Поток-исполнитель: берет задания, пока очередь не пуста"""
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️  Ошибка очереди заданий: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, params = job
+            with self._lock:
+                self._running.add(job_id)
+            logger.info(f"🗂️  Задание {job_id} запущено")
+            started = time.perf_counter()
+            image_bytes = None
+            try:
+                # Вход не читается в память: обработчик открывает файл сам (mmap)
+                image_bytes = SpooledUpload.from_file(self.input_path(job_id))
+                result = self._handler(image_bytes, params)
+            except Exception as e:
+                logger.error(f"❌ Задание {job_id} завершилось ошибкой: {e}")
+                self._finish(job_id, error=str(e))
+            else:
+                logger.info(f"✅ Задание {job_id} выполнено за {time.perf_counter() - started:.2f} с")
+                self._finish(job_id, result=result)
+            finally:
+                if image_bytes is not None:
+                    image_bytes.close()
+                with self._lock:
+                    self._running.discard(job_id)
+
+    def _finish(self, job_id, result=None, error=None):
+        """_complete без выхода из потока при ошибке SQLite (например, database is locked):
+        задание остается за воркером и после истечения аренды выполняется снова"""
+        try:
+            self._complete(job_id, result=result, error=error)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Не удалось записать результат задания {job_id}: {e}")
+
+    def _maintain(self):
+        """Продление аренды выполняемых заданий и удаление старых завершенных"""
+        interval = max(self.lease / 3, 0.05)
+        while not self._stopping.wait(interval):
+            with self._lock:
+                running = list(self._running)
+            try:
+                now = time.time()
+                with self._transaction() as conn:
+                    conn.executemany(
+                        'UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ?',
+                        [(now + self.lease, job_id, self.worker_id) for job_id in running]
+                    )
+                    expired = [row[0] for row in conn.execute(
+                        'SELECT id FROM jobs WHERE status IN (?, ?) AND finished < ?',
+                        (DONE, FAILED, now - self.retention)
+                    )]
+                    conn.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in expired])
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️  Ошибка обслуживания очереди заданий: {e}")
+                continue
+
+            for job_id in expired:
+                self._remove_input(job_id)
+            if now - self._tmp_cleaned >= self.stale_tmp / 4:
+                self._tmp_cleaned = now
+                self._remove_stale_tmp(now)
+
+    def _remove_stale_tmp(self, now):
+        """Удаляет *.tmp, оставшиеся от submit, упавших до os.replace"""
+        try:
+            entries = list(os.scandir(self.inputs_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith('.tmp'):
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.stale_tmp:
+                    os.remove(entry.path)
+                    logger.info(f"🧹 Удален недописанный вход задания {entry.name}")
+            except OSError:
+                pass
+
+    def stats(self):
+        """Число заданий по статусам и счетчики этого воркера"""
+        try:
+            counts = dict(self._connect().execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+            ).fetchall())
+        except sqlite3.Error:
+            counts = {}
+
+        with self._lock:
+            return {
+                'enabled': True,
+                'path': self.path,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': counts.get(QUEUED, 0),
+                'running': counts.get(RUNNING, 0),
+                'done': counts.get(DONE, 0),
+                'failed': counts.get(FAILED, 0),
+                'running_here': len(self._running),
+                'completed_here': self._completed,
+                'failed_here': self._failed,
+            }
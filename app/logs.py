@@ -0,0 +1,132 @@
+"""
+Асинхронное логирование вне потока запроса.
+
+install() переносит обработчики корневого логгера за очередь: поток
+запроса только кладет запись в очередь (форматирование и запись в
+stderr/файл выполняет фоновый поток QueueListener). Очередь ограничена —
+при переполнении запись отбрасывается и считается, а не блокирует запрос.
+После fork (воркеры gunicorn) очередь и поток записи создаются заново.
+
+Подробные строки этапов (размеры, режимы, результаты) пишутся в логгер
+app.stages с фильтром SampledFilter — для доли запросов; одна
+структурированная запись на каждый запрос — в app.timing (app/tracing.py).
+"""
+import os
+import queue
+import atexit
+import random
+import threading
+import logging
+import logging.handlers
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке и без блокировки при переполнении"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Очередь в памяти процесса: запись передается как есть,
+        # сообщение форматирует поток записи
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampledFilter(logging.Filter):
+    """Пропускает долю rate записей.
+
+    decide() — решение для текущего запроса (True/False) или None, тогда
+    решение принимается для каждой записи отдельно.
+    """
+
+    def __init__(self, rate, decide=None, rng=random.random):
+        super().__init__()
+        self.rate = rate
+        self.decide = decide
+        self._rng = rng
+        self.passed = 0
+        self.suppressed = 0
+
+    def filter(self, record):
+        decision = self.decide() if self.decide is not None else None
+        if decision is None:
+            decision = self.rate >= 1 or (self.rate > 0 and self._rng() < self.rate)
+        if decision:
+            self.passed += 1
+        else:
+            self.suppressed += 1
+        return decision
+
+
+class AsyncLogging:
+    """Обработчики логгера за ограниченной очередью с фоновым потоком записи"""
+
+    def __init__(self, queue_size=10000):
+        self.queue_size = queue_size
+        self.handler = None
+        self.listener = None
+        self._logger = None
+        self._targets = []
+        self._lock = threading.Lock()
+
+    def install(self, logger=None):
+        """Переносит текущие обработчики logger (по умолчанию корневого) за очередь"""
+        with self._lock:
+            if self.handler is not None:
+                return
+            self._logger = logger or logging.getLogger()
+            self._targets = list(self._logger.handlers)
+            self.handler = AsyncQueueHandler(queue.Queue(self.queue_size))
+            for target in self._targets:
+                self._logger.removeHandler(target)
+            self._logger.addHandler(self.handler)
+            self._start_listener()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.stop)
+
+    def _start_listener(self):
+        self.listener = logging.handlers.QueueListener(self.handler.queue, *self._targets,
+                                                       respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self):
+        """В дочернем процессе поток записи не существует: новая очередь и поток"""
+        if self.handler is None:
+            return
+        self._lock = threading.Lock()
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.handler.dropped = 0
+        self._start_listener()
+
+    def stop(self):
+        """Дописывает очередь и возвращает обработчики логгеру"""
+        with self._lock:
+            if self.handler is None:
+                return
+            try:
+                self.listener.stop()
+            except Exception:
+                pass
+            self._logger.removeHandler(self.handler)
+            for target in self._targets:
+                self._logger.addHandler(target)
+            self.handler = None
+            self.listener = None
+
+    def stats(self):
+        handler = self.handler
+        if handler is None:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'queued': handler.queue.qsize(),
+            'queue_size': self.queue_size,
+            'dropped': handler.dropped,
+        }
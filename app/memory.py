@@ -0,0 +1,187 @@
+"""
+Память запроса: оценка до декодирования, бюджет и замеры по этапам.
+
+MemoryBudget по заголовку изображения (размер и режим — Pillow читает
+только заголовок) оценивает пиковую память декодирования. Если оценка
+больше бюджета запроса, изображение декодируется уменьшенным
+(JPEG — draft, несжатый TIFF — полосами; вход модели все равно 299x299),
+а если уменьшить нельзя или и это не помещается — запрос отклоняется с 413
+до декодирования.
+
+StageMemory (по желанию, tracemalloc заметно замедляет Python-код)
+замеряет для этапов пик tracemalloc (Python и numpy) и прирост RSS
+процесса (буферы Pillow и TensorFlow tracemalloc не видит). Пик
+tracemalloc общий для процесса: при одновременных запросах замер этапа
+приблизительный.
+"""
+import contextlib
+import tracemalloc
+import threading
+
+from PIL import Image
+
+from app.imaging import MODEL_INPUT_SIZE, clamp_roi, reduced_mode, reduction_method
+from app.metrics import rss_bytes
+from app.uploads import UploadTooLarge, image_source
+
+MB = 1024 * 1024
+
+# Байт на пиксель в памяти Pillow: 8-битные режимы — 1, 16-битные — 2, остальные — 4
+# (RGB хранится как 4 байта на пиксель)
+ONE_BYTE_MODES = ('1', 'L', 'P')
+TWO_BYTE_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N')
+
+# Наибольшее уменьшение JPEG через draft
+MAX_JPEG_FACTOR = 8
+
+
+class MemoryBudgetExceeded(UploadTooLarge):
+    """Декодирование изображения не помещается в бюджет памяти запроса"""
+
+
+def pixel_bytes(mode):
+    """Байт на пиксель декодированного изображения в памяти Pillow"""
+    if mode in ONE_BYTE_MODES:
+        return 1
+    if mode in TWO_BYTE_MODES:
+        return 2
+    return 4
+
+
+def estimate_decode_bytes(size, mode, image_format):
+    """Пиковая память полного декодирования (как в prepare_image), в байтах.
+
+    TIFF конвертируется в RGB и перекодируется в JPEG, который затем
+    декодируется снова; другие форматы декодируются и конвертируются в RGB.
+    """
+    pixels = size[0] * size[1]
+    decoded = pixels * pixel_bytes(mode)
+    rgb = pixels * 4 if mode != 'RGB' else 0
+    if image_format == 'TIFF':
+        # Исходные пиксели и их RGB-копия, затем — декодированный JPEG
+        return max(decoded + rgb, pixels * 4)
+    return decoded + rgb
+
+
+class MemoryBudget:
+    """Оценка памяти по заголовку: полное, уменьшенное декодирование или отказ"""
+
+    def __init__(self, budget_bytes=0, action='downgrade'):
+        if action not in ('downgrade', 'reject'):
+            raise ValueError(f"Неизвестное действие при превышении бюджета памяти: {action}")
+        self.budget_bytes = budget_bytes
+        self.action = action
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._downgraded = 0
+        self._rejected = 0
+        self._max_estimate = 0
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    def plan(self, image_bytes, roi=None):
+        """Решение для изображения до декодирования.
+
+        Возвращает None (полное декодирование) или (factor, band_rows) для
+        open_reduced. Если бюджет не выполним — MemoryBudgetExceeded.
+        """
+        if not self.enabled:
+            return None
+        with Image.open(image_source(image_bytes)) as image:
+            size, mode, image_format = image.size, image.mode, image.format
+            method = reduction_method(image)
+        if roi is not None:
+            # Декодируется только область: оценка по ее размеру
+            box = clamp_roi(roi, size)
+            size = (box[2] - box[0], box[3] - box[1])
+            method = None
+        estimate = estimate_decode_bytes(size, mode, image_format)
+        with self._lock:
+            self._checked += 1
+            self._max_estimate = max(self._max_estimate, estimate)
+        if estimate <= self.budget_bytes:
+            return None
+
+        plan = self._reduced_plan(size, mode, method) if self.action == 'downgrade' else None
+        with self._lock:
+            if plan is None:
+                self._rejected += 1
+            else:
+                self._downgraded += 1
+        if plan is None:
+            raise MemoryBudgetExceeded(
+                f"Изображение {size[0]}x{size[1]} ({mode}) требует около {estimate / MB:.0f} MB "
+                f"для декодирования, бюджет запроса — {self.budget_bytes / MB:.0f} MB"
+            )
+        return plan
+
+    def _reduced_plan(self, size, mode, method):
+        """Наименьшее уменьшение (степень двойки), при котором оценка в бюджете,
+        а изображение не меньше входа модели"""
+        if method is None:
+            return None
+        width, height = size
+        max_factor = min(width // MODEL_INPUT_SIZE[0], height // MODEL_INPUT_SIZE[1])
+        if method == 'jpeg_draft':
+            max_factor = min(max_factor, MAX_JPEG_FACTOR)
+        out_mode = reduced_mode(mode)
+        # Полоса TIFF занимает не больше четверти бюджета
+        band_budget = self.budget_bytes // 4
+        band_rows = band_budget // max(1, width * max(pixel_bytes(mode), pixel_bytes(out_mode)))
+
+        factor = 2
+        while factor <= max_factor:
+            pixels = (width // factor) * (height // factor)
+            estimate = pixels * pixel_bytes(out_mode) + (pixels * 4 if out_mode != 'RGB' else 0)
+            if method == 'tiff_bands':
+                if band_rows < factor:
+                    return None
+                estimate += band_budget
+            if estimate <= self.budget_bytes:
+                return factor, band_rows
+            factor *= 2
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'budget_mb': round(self.budget_bytes / MB, 1),
+                'action': self.action,
+                'checked': self._checked,
+                'downgraded': self._downgraded,
+                'rejected': self._rejected,
+                'max_estimate_mb': round(self._max_estimate / MB, 1),
+            }
+
+
+class StageMemory:
+    """Замеры памяти этапов: пик tracemalloc и прирост RSS"""
+
+    def __init__(self, enabled=False, frames=1):
+        self.enabled = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @contextlib.contextmanager
+    def measure(self, stage, report):
+        """Записывает {'traced_peak_bytes', 'rss_delta_bytes'} этапа в report (dict).
+
+        report=None — без замера (выключено или результат некуда вернуть).
+        """
+        if report is None or not self.enabled:
+            yield
+            return
+        rss_before = rss_bytes()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            report[stage] = {
+                'traced_peak_bytes': max(0, traced_peak - traced_before),
+                'rss_delta_bytes': rss_bytes() - rss_before,
+            }
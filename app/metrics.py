@@ -0,0 +1,334 @@
+"""
+Метрики в формате Prometheus (/metrics), общие для всех воркеров gunicorn.
+
+Каждый процесс считает счетчики и гистограммы в памяти и раз в
+flush_interval секунд (и перед ответом на /metrics) записывает их снимок
+в свой файл в общем каталоге. /metrics в любом воркере читает файлы всех
+процессов и складывает: счетчики и гистограммы суммируются (в том числе
+завершившихся воркеров — счетчики не убывают), а gauges (очередь, RSS)
+отдаются по процессу с меткой pid, только для живых процессов. Снимки
+завершившихся процессов складываются в один файл EXITED_FILE, поэтому
+число файлов не растет с перезапусками воркеров.
+"""
+import os
+import json
+import fcntl
+import time
+import uuid
+import atexit
+import resource
+import threading
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KB .. 1 GB
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+# Сумма снимков завершившихся процессов
+EXITED_FILE = 'exited.json'
+LOCK_FILE = '.lock'
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+GAUGE = 'gauge'
+
+
+class MetricsRegistry:
+    """Счетчики, гистограммы и gauges процесса со снимками в общем каталоге.
+
+    directory=None — без файлов: /metrics показывает только этот процесс.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0, prefix='flask_ml'):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._definitions = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atexit.register(self._flush_at_exit)
+
+    def _reset(self):
+        """Новые значения в каждом процессе (после fork счетчики мастера не наследуются)"""
+        self._pid = os.getpid()
+        self._file_id = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        self._counters = {}
+        self._histograms = {}
+        self._flusher = None
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self.directory and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            self._flusher.start()
+
+    def counter(self, name, help_text):
+        self._definitions[name] = (COUNTER, help_text, None)
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        self._definitions[name] = (HISTOGRAM, help_text, tuple(buckets))
+
+    def gauge(self, name, help_text):
+        self._definitions[name] = (GAUGE, help_text, None)
+
+    def add_collector(self, collect):
+        """collect() -> {имя gauge: значение или {метки (tuple пар): значение}}; вызывается при снимке"""
+        self._collectors.append(collect)
+
+    def inc(self, name, labels=None, value=1):
+        key = _label_key(labels)
+        with self._lock:
+            self._check_process()
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        buckets = self._definitions[name][2]
+        key = _label_key(labels)
+        with self._lock:
+            self._check_process()
+            series = self._histograms.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def snapshot(self):
+        """Значения этого процесса (гистограммы — по корзинам, не накопительно)"""
+        gauges = {}
+        for collect in self._collectors:
+            try:
+                for name, value in collect().items():
+                    series = value if isinstance(value, dict) else {(): value}
+                    gauges.setdefault(name, {}).update(series)
+            except Exception as e:
+                logger.warning(f"⚠️  Ошибка сбора метрик: {e}")
+        with self._lock:
+            self._check_process()
+            return _as_snapshot(self._pid, self._counters, self._histograms, gauges)
+
+    def flush(self):
+        """Записывает снимок процесса в его файл (атомарно)"""
+        if not self.directory:
+            return
+        data = json.dumps(self.snapshot())
+        path = os.path.join(self.directory, f"{self._file_id}.json")
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️  Не удалось записать метрики: {e}")
+
+    def clear(self):
+        """Удаляет снимки прошлых запусков: вызывается при старте сервера до запуска воркеров"""
+        clear_snapshots(self.directory)
+
+    def _flush_at_exit(self):
+        # Каталог могли удалить раньше (тесты, остановка контейнера)
+        if self.directory and os.path.isdir(self.directory):
+            self.flush()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _snapshots(self):
+        """Снимки всех процессов: свой — текущий, чужие — из файлов.
+
+        Снимки завершившихся процессов добавляются к EXITED_FILE и удаляются
+        (под блокировкой каталога: иначе два воркера сложили бы их дважды).
+        """
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots, exited, exited_paths = [], [], []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(entry.path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if entry.name == EXITED_FILE or not _alive(snapshot['pid']):
+                    exited.append(snapshot)
+                    if entry.name != EXITED_FILE:
+                        exited_paths.append(entry.path)
+                else:
+                    snapshots.append(snapshot)
+            if exited:
+                snapshots.append(self._fold(exited, exited_paths))
+        return snapshots
+
+    def _fold(self, exited, paths):
+        """Складывает снимки завершившихся процессов в EXITED_FILE"""
+        snapshot = _as_snapshot(None, *_merge(exited))
+        if not paths:
+            return snapshot
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, os.path.join(self.directory, EXITED_FILE))
+        except OSError as e:
+            logger.warning(f"⚠️  Не удалось записать метрики завершившихся процессов: {e}")
+            return snapshot
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return snapshot
+
+    def render(self, extra_gauges=None):
+        """Текст в формате экспозиции Prometheus, суммированный по процессам.
+
+        extra_gauges — значения, общие для всех воркеров (без метки pid).
+        """
+        snapshots = self._snapshots()
+        counters, histograms = _merge(snapshots)
+        gauges = {}
+        for snapshot in snapshots:
+            if snapshot['pid'] is not None and _alive(snapshot['pid']):
+                pid = str(snapshot['pid'])
+                for name, series in snapshot['gauges'].items():
+                    target = gauges.setdefault(name, {})
+                    for key, value in series:
+                        target[_label_key(key) + (('pid', pid),)] = value
+        for name, value in (extra_gauges or {}).items():
+            series = value if isinstance(value, dict) else {(): value}
+            gauges.setdefault(name, {}).update({_label_key(k): v for k, v in series.items()})
+
+        lines = []
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == COUNTER:
+                for key, value in sorted(counters.get(name, {}).items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+            elif kind == GAUGE:
+                for key, value in sorted(gauges.get(name, {}).items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+            else:
+                for key, entry in sorted(histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets, entry['buckets']):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} "
+                                     f"{cumulative}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key + (('le', '+Inf'),))} {entry['count']}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(entry['sum'])}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+def clear_snapshots(directory):
+    """Удаляет снимки (и сумму завершившихся процессов) из каталога метрик"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.endswith(('.json', '.tmp')):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _merge(snapshots):
+    """Сумма счетчиков и гистограмм снимков: ({имя: {метки: значение}}, {имя: {метки: корзины}})"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, series in snapshot['counters'].items():
+            target = counters.setdefault(name, {})
+            for key, value in series:
+                key = _label_key(key)
+                target[key] = target.get(key, 0) + value
+        for name, series in snapshot['histograms'].items():
+            target = histograms.setdefault(name, {})
+            for key, entry in series:
+                key = _label_key(key)
+                merged = target.setdefault(key, {'buckets': [0] * len(entry['buckets']), 'sum': 0.0, 'count': 0})
+                merged['buckets'] = [a + b for a, b in zip(merged['buckets'], entry['buckets'])]
+                merged['sum'] += entry['sum']
+                merged['count'] += entry['count']
+    return counters, histograms
+
+
+def _as_snapshot(pid, counters, histograms, gauges=None):
+    """Снимок в формате файла: метки — списками пар (JSON без tuple)"""
+    return {
+        'pid': pid,
+        'counters': {name: [[list(k), v] for k, v in s.items()] for name, s in counters.items()},
+        'histograms': {
+            name: [[list(k), dict(e, buckets=list(e['buckets']))] for k, e in s.items()]
+            for name, s in histograms.items()
+        },
+        'gauges': {name: [[list(k), v] for k, v in s.items()] for name, s in (gauges or {}).items()},
+    }
+
+
+def rss_bytes():
+    """Резидентная память процесса (Linux — текущая из /proc, иначе — пиковая)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _label_key(labels):
+    """Метки как отсортированный tuple пар (ключ словарей и JSON-снимков)"""
+    if not labels:
+        return ()
+    if isinstance(labels, dict):
+        labels = labels.items()
+    return tuple(sorted((str(k), str(v)) for k, v in labels))
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    pairs = (f'{name}="{_escape(value)}"' for name, value in key)
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
@@ -0,0 +1,179 @@
+"""
+Пул декодирования и предобработки изображений.
+
+Декодирование, конвертация в RGB и LANCZOS-ресайз выполняются в пуле
+(потоки — Pillow отпускает GIL при декодировании и ресайзе, либо процессы),
+пока модель обрабатывает предыдущий запрос. Пул также собирает время
+каждого этапа и глубину очереди.
+"""
+import os
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ('thread', 'process', 'inline')
+
+
+def _timed_call(fn, *args):
+    """Вызов fn в воркере с отметкой времени начала (для времени ожидания в очереди)"""
+    started = time.time()
+    result, timings = fn(*args)
+    return result, timings, started
+
+
+class PreprocessPipeline:
+    """Пул для подготовки входов модели параллельно с инференсом"""
+
+    def __init__(self, executor='thread', workers=None, on_record=None):
+        if executor not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим пула: {executor}. Доступные: {', '.join(EXECUTOR_MODES)}")
+
+        self.mode = executor
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._stages = {}
+        # on_record(stage, seconds) — дополнительно для каждого замера (гистограммы /metrics)
+        self._on_record = on_record
+
+    @property
+    def in_process(self):
+        """Задачи выполняются в этом процессе и видят его память"""
+        return self.mode != 'process'
+
+    def _get_executor(self):
+        """Пул создается лениво — уже в процессе воркера gunicorn, после fork"""
+        with self._lock:
+            if self._executor is None and self.mode != 'inline':
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='preprocess')
+                logger.info(f"🧵 Пул предобработки запущен: {self.mode}, воркеров: {self.workers}")
+            return self._executor
+
+    def run(self, fn, *args, inline=False):
+        """Выполняет fn(*args) в пуле и ждет результат.
+
+        fn должна возвращать (result, timings), где timings — словарь
+        {этап: секунды}; время этапов попадает в статистику пула.
+        inline=True — в вызывающем потоке (профилирование запроса).
+        """
+        executor = None if inline else self._get_executor()
+        submitted = time.time()
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if executor is None:
+                result, timings, started = _timed_call(fn, *args)
+            else:
+                result, timings, started = executor.submit(_timed_call, fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+
+        self.record('queue_wait', max(0.0, started - submitted))
+        for stage, seconds in timings.items():
+            self.record(stage, seconds)
+
+        return result
+
+    def submit(self, fn, items, inline=False):
+        """Ставит fn(*args) в пул для каждого набора аргументов из items, не дожидаясь.
+
+        Возвращает список задач для gather(). В режиме inline (или с
+        inline=True) задачи выполняются сразу.
+        """
+        executor = None if inline else self._get_executor()
+        with self._lock:
+            self._in_flight += len(items)
+
+        tasks = []
+        for args in items:
+            submitted = time.time()
+            if executor is None:
+                future = Future()
+                try:
+                    future.set_result(_timed_call(fn, *args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = executor.submit(_timed_call, fn, *args)
+            tasks.append((future, submitted))
+        return tasks
+
+    def gather(self, tasks):
+        """Ждет задачи из submit().
+
+        Ошибка одной задачи не прерывает остальные: возвращается список
+        (result, error) в порядке постановки.
+        """
+        outcomes = []
+        for future, submitted in tasks:
+            try:
+                result, timings, started = future.result()
+            except Exception as e:
+                outcomes.append((None, e))
+                continue
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._completed += 1
+
+            self.record('queue_wait', max(0.0, started - submitted))
+            for stage, seconds in timings.items():
+                self.record(stage, seconds)
+            outcomes.append((result, None))
+        return outcomes
+
+    def record(self, stage, seconds):
+        """Добавляет время выполнения этапа в статистику"""
+        with self._lock:
+            stats = self._stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+        if self._on_record is not None:
+            self._on_record(stage, seconds)
+
+    def average(self, stage):
+        """Среднее время этапа в секундах (0, если замеров еще нет)"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            return stats['total'] / stats['count'] if stats else 0.0
+
+    def stats(self):
+        """Глубина очереди и время этапов"""
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': s['count'],
+                    'avg_ms': round(s['total'] / s['count'] * 1000, 3),
+                    'max_ms': round(s['max'] * 1000, 3),
+                    'total_ms': round(s['total'] * 1000, 3),
+                }
+                for stage, s in self._stages.items()
+            }
+            return {
+                'executor': self.mode,
+                'workers': self.workers,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.workers),
+                'completed': self._completed,
+                'stages': stages,
+            }
+
+    def shutdown(self, wait=True):
+        """Останавливает пул"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
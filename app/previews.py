@@ -0,0 +1,178 @@
+"""
+Превью изображений по адресу содержимого: /images/<hash>/preview.
+
+Уменьшенная копия (не больше PREVIEW_MAX_SIZE по длинной стороне) создается
+один раз при первом анализе изображения и хранится в общем для воркеров
+каталоге. Имя файла однозначно определяется содержимым, поэтому превью
+неизменяемо и может кэшироваться клиентом сколь угодно долго.
+"""
+import os
+import re
+import tempfile
+import threading
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор превью: SHA-256 файла и, для ROI, координаты области
+PREVIEW_ID_RE = re.compile(r'^[0-9a-f]{64}(_\d+_\d+_\d+_\d+)?$')
+
+
+def preview_id(content_hash, roi_info=None):
+    """Идентификатор превью для изображения (или его ROI).
+
+    roi_info без 'roi' (уменьшенное декодирование целиком) — превью всего изображения.
+    """
+    if roi_info is None or 'roi' not in roi_info:
+        return content_hash
+    roi = roi_info['roi']
+    return f"{content_hash}_{roi['x']}_{roi['y']}_{roi['width']}_{roi['height']}"
+
+
+def preview_url(content_hash, roi_info=None):
+    """URL превью; ROI передается в query string"""
+    url = f"/images/{content_hash}/preview"
+    if roi_info is not None and 'roi' in roi_info:
+        roi = roi_info['roi']
+        url += f"?roi={roi['x']},{roi['y']},{roi['width']},{roi['height']}"
+    return url
+
+
+class PreviewStore:
+    """Каталог JPEG превью с ограничением числа файлов.
+
+    Лимит проверяется не на каждом сохранении, а раз в evict_every сохранений
+    (по умолчанию — 1% от max_files, не больше 100): листинг большого каталога
+    дорог, а превышение лимита на несколько файлов безвредно.
+
+    Использование превью (ответ из кэша, повторное вычисление, запрос
+    превью) обновляет mtime файла, поэтому вытесняются давно не
+    использованные превью, а не самые старые.
+    """
+
+    def __init__(self, directory, max_size=512, quality=85, max_files=10000, evict_every=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.quality = quality
+        self.max_files = max_files
+        if evict_every is None:
+            evict_every = min(100, max(1, max_files // 100))
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._created = 0
+        self._unchecked = 0
+        self._evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        # Число файлов: по последнему просмотру каталога и сохранениям этого воркера
+        self._files = self._count()
+
+    def path(self, pid):
+        """Путь к файлу превью или None для некорректного идентификатора"""
+        if not PREVIEW_ID_RE.match(pid):
+            return None
+        return os.path.join(self.directory, f"{pid}.jpg")
+
+    def exists(self, pid):
+        path = self.path(pid)
+        return path is not None and os.path.exists(path)
+
+    def touch(self, pid):
+        """Отмечает использование превью (mtime — порядок вытеснения). False — превью нет"""
+        path = self.path(pid)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    def save(self, pid, image):
+        """Создает превью из декодированного изображения, если его еще нет"""
+        path = self.path(pid)
+        if path is None or self.touch(pid):
+            return False
+
+        # Уменьшение без полной копии исходника
+        scale = min(1.0, self.max_size / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        thumbnail = image if size == image.size else image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        if thumbnail.mode != 'RGB':
+            thumbnail = thumbnail.convert('RGB')
+
+        # Запись через временный файл: другой воркер не увидит недописанное превью
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                thumbnail.save(f, format='JPEG', quality=self.quality)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            self._created += 1
+            self._files += 1
+            self._unchecked += 1
+            evict = self._unchecked >= self.evict_every
+            if evict:
+                self._unchecked = 0
+        # Одновременно каталог просматривает только один поток
+        if evict and self._evict_lock.acquire(blocking=False):
+            try:
+                self._evict()
+            finally:
+                self._evict_lock.release()
+        return True
+
+    def _evict(self):
+        """Удаляет давно не использованные превью сверх лимита"""
+        # Сначала только имена: stat нужен, лишь когда лимит превышен
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.jpg')]
+        except OSError:
+            return
+        excess = len(entries) - self.max_files
+        with self._lock:
+            self._files = len(entries) - max(0, excess)
+        if excess <= 0:
+            return
+
+        entries.sort(key=self._mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            with self._lock:
+                self._evictions += 1
+
+    def _count(self):
+        try:
+            return sum(1 for entry in os.scandir(self.directory) if entry.name.endswith('.jpg'))
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _mtime(entry):
+        try:
+            return entry.stat().st_mtime
+        except OSError:
+            # Файл уже удален другим воркером
+            return 0.0
+
+    def stats(self):
+        """Число превью (без листинга каталога — по последнему просмотру) и созданных этим воркером"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'files': self._files,
+                'max_files': self.max_files,
+                'max_size': self.max_size,
+                'created': self._created,
+                'evictions': self._evictions,
+            }
@@ -0,0 +1,246 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если в нем есть подписанный заголовок X-Profile
+(срок действия и HMAC-SHA256 от X-Request-ID и этого срока на
+PROFILE_SECRET — подсмотренную подпись нельзя использовать после срока,
+не больше MAX_SIGNATURE_TTL) или он попал в выборку
+PROFILE_SAMPLE_RATE. Обработчик выполняется под cProfile (для подписанных
+запросов с X-Profile-TF: 1 — еще и под профилировщиком TensorFlow), а
+результаты пишутся в каталог-кольцо: старые профили удаляются, когда их
+больше max_captures или они занимают больше max_bytes.
+
+В процессе одновременно профилируется не больше одного запроса: cProfile
+и профилировщик TensorFlow не допускают параллельных сессий, а нагрузка
+остается ограниченной. Запрос, пришедший во время другого профиля,
+выполняется как обычно.
+"""
+import os
+import io
+import re
+import hmac
+import time
+import random
+import shutil
+import pstats
+import hashlib
+import cProfile
+import threading
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Имя профиля: время и request ID (без разделителей пути)
+CAPTURE_NAME_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[A-Za-z0-9._-]{1,128}$')
+ARTIFACT_SUFFIXES = ('.prof', '.txt', '.tf.zip')
+
+# Строк в текстовой сводке профиля
+SUMMARY_LINES = 60
+
+
+# Наибольший срок действия подписи X-Profile, секунды
+MAX_SIGNATURE_TTL = 3600
+
+
+def profile_signature(secret, request_id, ttl=300, now=None):
+    """Значение X-Profile для запроса с данным X-Request-ID, действительное ttl секунд:
+    "<unix-время окончания>.<hex HMAC>"
+    """
+    expires = int((time.time() if now is None else now) + ttl)
+    return f"{expires}.{_sign(secret, request_id, expires)}"
+
+
+def _sign(secret, request_id, expires):
+    return hmac.new(secret.encode(), f"{request_id}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+class Capture:
+    """Профиль одного запроса: имя (для заголовка ответа) и файлы после завершения"""
+
+    def __init__(self, name, tf_trace):
+        self.name = name
+        self.tf_trace = tf_trace
+        self.files = []
+
+
+class RequestProfiler:
+    """Решает, профилировать ли запрос, и хранит профили в каталоге-кольце"""
+
+    def __init__(self, directory, secret='', sample_rate=0.0, max_captures=50, max_bytes=512 * 1024 * 1024,
+                 rng=random.random, clock=time.time):
+        self.directory = directory
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.max_captures = max_captures
+        self.max_bytes = max_bytes
+        self._rng = rng
+        self._clock = clock
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._captured = 0
+        self._sampled = 0
+        self._rejected = 0
+        self._skipped_busy = 0
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.secret) or self.sample_rate > 0
+
+    def authorized(self, authorization):
+        """Доступ к списку и файлам профилей: Authorization: Bearer <PROFILE_SECRET>"""
+        if not self.secret or not authorization or not authorization.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(authorization[len('Bearer '):].encode(), self.secret.encode())
+
+    def mode(self, request_id, signature=None, tf_requested=False):
+        """None — не профилировать, иначе {'tf_trace': bool}.
+
+        Подписанный запрос профилируется всегда (и с TF по запросу),
+        остальные — с вероятностью sample_rate, только cProfile.
+        """
+        if signature:
+            if self.secret and self._signature_valid(signature, request_id):
+                return {'tf_trace': bool(tf_requested)}
+            with self._lock:
+                self._rejected += 1
+            logger.warning(f"⚠️  Неверная или просроченная подпись X-Profile для запроса {request_id}")
+            return None
+        if self.sample_rate > 0 and self._rng() < self.sample_rate:
+            with self._lock:
+                self._sampled += 1
+            return {'tf_trace': False}
+        return None
+
+    def _signature_valid(self, signature, request_id):
+        """Подпись верна, срок не истек и не дальше MAX_SIGNATURE_TTL"""
+        expires, _, digest = signature.partition('.')
+        if not expires.isdigit():
+            return False
+        now = self._clock()
+        if not now <= int(expires) <= now + MAX_SIGNATURE_TTL:
+            return False
+        return hmac.compare_digest(digest, _sign(self.secret, request_id, int(expires)))
+
+    @contextlib.contextmanager
+    def capture(self, request_id, tf_trace=False):
+        """Контекст профилируемого обработчика. Отдает Capture или None, если процесс
+        уже профилирует другой запрос"""
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self._skipped_busy += 1
+            yield None
+            return
+        try:
+            name = f"{time.strftime('%Y%m%dT%H%M%S')}-{request_id.replace(':', '_')}"
+            capture = Capture(name, tf_trace and _start_tf_trace(self._path(name + '.tf')))
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield capture
+            finally:
+                profile.disable()
+                if capture.tf_trace:
+                    _stop_tf_trace()
+                self._save(capture, profile)
+        finally:
+            self._busy.release()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _save(self, capture, profile):
+        try:
+            profile.dump_stats(self._path(capture.name + '.prof'))
+            summary = io.StringIO()
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+            with open(self._path(capture.name + '.txt'), 'w') as f:
+                f.write(summary.getvalue())
+            capture.files = [capture.name + '.prof', capture.name + '.txt']
+            if capture.tf_trace:
+                trace_dir = self._path(capture.name + '.tf')
+                shutil.make_archive(trace_dir, 'zip', trace_dir)
+                shutil.rmtree(trace_dir, ignore_errors=True)
+                capture.files.append(capture.name + '.tf.zip')
+        except OSError as e:
+            logger.warning(f"⚠️  Не удалось сохранить профиль {capture.name}: {e}")
+            return
+        with self._lock:
+            self._captured += 1
+        logger.info(f"🔬 Профиль запроса сохранен: {capture.name}")
+        self._evict()
+
+    def list(self):
+        """Профили от новых к старым: [{'name', 'files', 'bytes', 'created'}]"""
+        captures = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return []
+        for entry in entries:
+            for suffix in ARTIFACT_SUFFIXES:
+                if entry.name.endswith(suffix):
+                    name = entry.name[:-len(suffix)]
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        break
+                    capture = captures.setdefault(name, {'name': name, 'files': [], 'bytes': 0, 'created': 0})
+                    capture['files'].append(entry.name)
+                    capture['bytes'] += stat.st_size
+                    capture['created'] = max(capture['created'], stat.st_mtime)
+                    break
+        return sorted(captures.values(), key=lambda c: c['created'], reverse=True)
+
+    def artifact_path(self, filename):
+        """Путь к файлу профиля или None, если имя недопустимо или файла нет"""
+        suffix = next((s for s in ARTIFACT_SUFFIXES if filename.endswith(s)), None)
+        if suffix is None or not CAPTURE_NAME_RE.match(filename[:-len(suffix)]):
+            return None
+        path = self._path(filename)
+        return path if os.path.isfile(path) else None
+
+    def _evict(self):
+        """Удаляет самые старые профили сверх max_captures и max_bytes"""
+        captures = self.list()
+        total = sum(c['bytes'] for c in captures)
+        while captures and (len(captures) > self.max_captures or total > self.max_bytes):
+            oldest = captures.pop()
+            total -= oldest['bytes']
+            for filename in oldest['files']:
+                try:
+                    os.remove(self._path(filename))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'captured': self._captured,
+                'sampled': self._sampled,
+                'rejected': self._rejected,
+                'skipped_busy': self._skipped_busy,
+            }
+
+
+def _start_tf_trace(logdir):
+    """Запускает профилировщик TensorFlow; False, если он недоступен"""
+    try:
+        import tensorflow as tf
+        tf.profiler.experimental.start(logdir)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️  Профилировщик TensorFlow недоступен: {e}")
+        return False
+
+
+def _stop_tf_trace():
+    try:
+        import tensorflow as tf
+        tf.profiler.experimental.stop()
+    except Exception as e:
+        logger.warning(f"⚠️  Ошибка остановки профилировщика TensorFlow: {e}")
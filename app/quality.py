@@ -0,0 +1,109 @@
+"""
+Проверка качества изображения перед инференсом.
+
+Пустые поля, расфокусированные и пересвеченные кадры отсекаются до прохода
+модели. Метрики считаются векторно по уже уменьшенному до 299x299 входу:
+- variance — дисперсия яркости (пустое поле ~ 0);
+- focus — дисперсия лапласиана (мера резкости);
+- saturation — доля пересвеченных пикселей;
+- foreground — доля пикселей, заметно отличающихся от фона (медианы).
+"""
+import threading
+
+import numpy as np
+
+# Веса яркости (ITU-R BT.601)
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Порог пересвета для нормализованных значений [0, 1]
+SATURATION_LEVEL = 250 / 255
+
+REASON_MESSAGES = {
+    'low_variance': 'пустое или однородное поле',
+    'out_of_focus': 'изображение не в фокусе',
+    'saturated': 'изображение пересвечено',
+    'no_foreground': 'не найдены клетки на фоне',
+}
+
+
+def compute_metrics(pixels, foreground_delta=0.1):
+    """Метрики качества для массива (H, W, 3) float32 со значениями [0, 1]"""
+    gray = pixels @ LUMA_WEIGHTS
+
+    laplacian = (4 * gray[1:-1, 1:-1]
+                 - gray[:-2, 1:-1] - gray[2:, 1:-1]
+                 - gray[1:-1, :-2] - gray[1:-1, 2:])
+    background = np.median(gray)
+
+    return {
+        'variance': float(gray.var()),
+        'focus': float(laplacian.var()),
+        'saturation': float(np.count_nonzero(pixels.max(axis=2) >= SATURATION_LEVEL) / gray.size),
+        'foreground': float(np.count_nonzero(np.abs(gray - background) > foreground_delta) / gray.size),
+    }
+
+
+class QualityGate:
+    """Порог качества перед инференсом и статистика его срабатываний"""
+
+    def __init__(self, enabled=False, min_variance=1e-4, min_focus=1e-5,
+                 max_saturation=0.5, min_foreground=0.005, foreground_delta=0.1):
+        self.enabled = enabled
+        self.min_variance = min_variance
+        self.min_focus = min_focus
+        self.max_saturation = max_saturation
+        self.min_foreground = min_foreground
+        self.foreground_delta = foreground_delta
+
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._rejected = 0
+        self._reasons = {}
+        self._saved_seconds = 0.0
+
+    def assess(self, pixels):
+        """Оценка качества: {'passed', 'reasons', 'metrics'}"""
+        metrics = compute_metrics(pixels, self.foreground_delta)
+
+        reasons = []
+        if metrics['variance'] < self.min_variance:
+            reasons.append('low_variance')
+        if metrics['focus'] < self.min_focus:
+            reasons.append('out_of_focus')
+        if metrics['saturation'] > self.max_saturation:
+            reasons.append('saturated')
+        if metrics['foreground'] < self.min_foreground:
+            reasons.append('no_foreground')
+
+        return {
+            'passed': not reasons,
+            'reasons': reasons,
+            'metrics': {name: round(value, 6) for name, value in metrics.items()},
+        }
+
+    def record(self, report, inference_seconds=0.0):
+        """Учитывает результат проверки; для отсеянных — сэкономленное время инференса"""
+        with self._lock:
+            self._checked += 1
+            if not report['passed']:
+                self._rejected += 1
+                self._saved_seconds += inference_seconds
+                for reason in report['reasons']:
+                    self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def stats(self):
+        """Доля отсеянных изображений и сэкономленное время инференса"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'checked': self._checked,
+                'rejected': self._rejected,
+                'hit_rate': round(self._rejected / self._checked, 4) if self._checked else 0.0,
+                'reasons': dict(self._reasons),
+                'inference_saved_ms': round(self._saved_seconds * 1000, 3),
+            }
+
+
+def describe(report):
+    """Человекочитаемое описание причин отказа"""
+    return ', '.join(REASON_MESSAGES.get(reason, reason) for reason in report['reasons'])
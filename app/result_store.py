@@ -0,0 +1,145 @@
+"""
+Общее хранилище результатов для всех воркеров gunicorn на хосте.
+
+SQLite в режиме WAL: воркеры читают параллельно, запись не блокирует
+чтение. Файл лежит на примонтированном томе, поэтому результаты переживают
+перезапуск воркеров и переключение контейнеров BlueGreenDeployer.
+Ключ — тот же, что у кэша в памяти: версия модели + хэш изображения.
+"""
+import os
+import json
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+class ResultStore:
+    """Персистентное хранилище результатов с вытеснением давно не использованных"""
+
+    def __init__(self, path, max_entries=100000, max_bytes=512 * 1024 * 1024, timeout=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._errors = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """Соединение на поток (и на процесс — после fork создается новое)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        """Возвращает сохраненный результат (dict) или None"""
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._count('_misses')
+                return None
+            with conn:
+                conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._count('_hits')
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Ошибка чтения хранилища результатов: {e}")
+            self._count('_errors')
+            return None
+
+    def put(self, key, value, payload=None):
+        """Сохраняет результат и вытесняет старые записи сверх лимитов.
+
+        payload — уже сериализованный в JSON value, если он есть у вызывающего.
+        """
+        if payload is None:
+            payload = json.dumps(value)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                    (key, payload, size, now, now)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Ошибка записи в хранилище результатов: {e}")
+            self._count('_errors')
+
+    def _evict(self, conn):
+        """Удаляет давно не использованные записи, пока не выполнены лимиты"""
+        entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        while entries > self.max_entries or total > self.max_bytes:
+            excess = max(entries - self.max_entries, 1)
+            rows = conn.execute(
+                'SELECT key, size FROM results ORDER BY accessed LIMIT ?', (excess,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany('DELETE FROM results WHERE key = ?', [(row[0],) for row in rows])
+            entries -= len(rows)
+            total -= sum(row[1] for row in rows)
+            with self._lock:
+                self._evictions += len(rows)
+
+    def stats(self):
+        """Заполненность хранилища и доля попаданий в этом воркере"""
+        try:
+            entries, total = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results'
+            ).fetchone()
+        except sqlite3.Error:
+            entries, total = None, None
+
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': True,
+                'path': self.path,
+                'entries': entries,
+                'bytes': total,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'errors': self._errors,
+            }
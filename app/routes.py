@@ -1,29 +1,241 @@
-from flask import request, jsonify, render_template
+from flask import (request, jsonify, render_template, send_file, Response, stream_with_context, g,
+                   has_request_context)
 # УБЕРИТЕ старые импорты tensorflow и добавьте эти:
 import tensorflow as tf
 import numpy as np
 from PIL import Image
 import io
+import json
 import base64
+import functools
+import random
 import logging
-from app import app
+import os
+import re
+import threading
+import time
+from app import app, async_logging
+from app.logs import SampledFilter
+from app.imaging import ROIError, parse_roi, open_image_region, open_reduced, roi_to_dict
+from app.pipeline import PreprocessPipeline
+from app.buffers import BufferPool
+from app.quality import QualityGate, describe as describe_quality
+from app.cache import PredictionCache, cache_key, image_hash
+from app.result_store import ResultStore
+from app.singleflight import SingleFlight
+from app.jobs import JobQueue, QueueFull, DONE, FAILED
+from app.compression import DecompressionMiddleware
+from app.admission import (AdmissionController, DeadlineExceeded, Overloaded, PriorityLock, ScheduleError,
+                           parse_priority, parse_timeout_ms)
+from app.uploads import (UploadError, UploadTooLarge, body_limit, close_upload, image_source,
+                         spool_json_image, spool_stream)
+from app.metrics import MetricsRegistry, BYTES_BUCKETS, SIZE_BUCKETS, rss_bytes
+from app.tracing import REQUEST_ID_HEADER, RequestTrace, request_id
+from app.profiling import RequestProfiler
+from app.memory import MemoryBudget, StageMemory
+from app.sampler import StackSampler
+from app.previews import PreviewStore, preview_id, preview_url
+from app.batch import (BatchError, ItemError, ZIP_MIMETYPES, load_item,
+                       items_from_json, items_from_zip, items_from_files)
 
 logger = logging.getLogger(__name__)
 
+# Структурированные записи о запросах (одна строка JSON на запрос)
+timing_logger = logging.getLogger('app.timing')
+
+# Подробные строки этапов — для выборки запросов (решение принимается на запрос,
+# вне запроса — для каждой записи); аргументы форматирует поток записи логов
+stage_logger = logging.getLogger('app.stages')
+stage_log_filter = SampledFilter(
+    app.config['LOG_STAGE_SAMPLE_RATE'],
+    decide=lambda: g.get('log_stages') if has_request_context() else None,
+)
+stage_logger.addFilter(stage_log_filter)
+
 # Глобальная переменная для модели
 model = None
+MODEL_PATH = 'app/models/classification_model.h5'
+
+# Версия модели — часть ключа кэша результатов
+model_version = 'unknown'
+
+# SHA-256 файла в hex
+IMAGE_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Идентификатор задания (uuid4 hex)
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+MB = 1024 * 1024
+
+# Превью неизменяемы (адрес определяется содержимым) — кэшируются клиентом на год
+PREVIEW_MAX_AGE = 365 * 24 * 3600
+
+# Метрики Prometheus, суммируемые по воркерам через общий каталог
+metrics = MetricsRegistry(
+    app.config['METRICS_DIR'] or None,
+    flush_interval=app.config['METRICS_FLUSH_SECONDS'],
+)
+metrics.histogram('stage_seconds', 'Время этапов обработки запроса')
+metrics.histogram('request_seconds', 'Время обработки запроса до начала ответа')
+metrics.counter('requests_total', 'Запросы по endpoint, методу и статусу')
+metrics.counter('request_errors_total', 'Ответы с ошибкой (статус 4xx/5xx)')
+metrics.histogram('request_bytes', 'Размер тела запроса по сети', buckets=BYTES_BUCKETS)
+metrics.histogram('batch_size', 'Число изображений в пакете /predict/batch', buckets=SIZE_BUCKETS)
+metrics.histogram('stage_memory_bytes', 'Память этапов: пик tracemalloc и прирост RSS', buckets=BYTES_BUCKETS)
+metrics.gauge('worker_rss_bytes', 'Резидентная память воркера')
+metrics.gauge('admission_in_flight', 'Вычисления, допущенные контролем допуска')
+metrics.gauge('admission_queued', 'Запросы в очереди допуска')
+metrics.gauge('pipeline_in_flight', 'Задачи в пуле предобработки')
+metrics.gauge('pipeline_queue_depth', 'Задачи, ожидающие свободного потока пула предобработки')
+metrics.gauge('jobs', 'Задания очереди /jobs по статусам')
+
+def record_stage(stage, seconds):
+    """Замер этапа: в гистограмму /metrics и в разбивку текущего запроса"""
+    metrics.observe('stage_seconds', seconds, {'stage': stage})
+    # Фоновые задания выполняются вне запроса — только в метрики
+    if has_request_context() and 'trace' in g:
+        g.trace.record(stage, seconds)
+
+# Бюджет памяти декодирования одного изображения (оценка по заголовку)
+memory_budget = MemoryBudget(app.config['MEMORY_BUDGET_MB'] * MB, action=app.config['MEMORY_BUDGET_ACTION'])
+
+# Замеры памяти этапов (tracemalloc и RSS), по умолчанию выключены
+stage_memory = StageMemory(app.config['MEMORY_TRACE_ENABLED'])
+
+# Пул декодирования и предобработки
+pipeline = PreprocessPipeline(
+    app.config['PREPROCESS_EXECUTOR'],
+    app.config['PREPROCESS_WORKERS'],
+    on_record=record_stage,
+)
+
+# Пул буферов входа модели
+input_buffers = BufferPool(app.config['INPUT_BUFFER_SLOTS'])
+
+# Буферы пакетного инференса: пока модель обрабатывает один, пул заполняет другой
+batch_buffers = BufferPool(app.config['BATCH_BUFFER_SLOTS'], batch_size=app.config['BATCH_SIZE'])
+
+# Проверка качества перед инференсом
+quality_gate = QualityGate(
+    enabled=app.config['QUALITY_GATE_ENABLED'],
+    min_variance=app.config['QUALITY_MIN_VARIANCE'],
+    min_focus=app.config['QUALITY_MIN_FOCUS'],
+    max_saturation=app.config['QUALITY_MAX_SATURATION'],
+    min_foreground=app.config['QUALITY_MIN_FOREGROUND'],
+)
+
+# Кэш результатов по хэшу изображения и версии модели
+prediction_cache = PredictionCache(
+    max_entries=app.config['PREDICTION_CACHE_SIZE'],
+    max_bytes=app.config['PREDICTION_CACHE_MAX_MB'] * 1024 * 1024,
+    ttl=app.config['PREDICTION_CACHE_TTL'],
+)
+
+# Общее для всех воркеров хранилище результатов (SQLite на примонтированном томе)
+result_store = None
+if app.config['RESULT_STORE_PATH']:
+    result_store = ResultStore(
+        app.config['RESULT_STORE_PATH'],
+        max_entries=app.config['RESULT_STORE_MAX_ENTRIES'],
+        max_bytes=app.config['RESULT_STORE_MAX_MB'] * 1024 * 1024,
+    )
+
+# Объединение одновременных запросов с одинаковым изображением
+inflight = SingleFlight()
+
+# Превью изображений по хэшу содержимого
+previews = PreviewStore(
+    app.config['PREVIEW_DIR'],
+    max_size=app.config['PREVIEW_MAX_SIZE'],
+    max_files=app.config['PREVIEW_MAX_FILES'],
+)
+
+# Очередь асинхронных заданий (SQLite на примонтированном томе)
+jobs = None
+if app.config['JOB_QUEUE_DIR']:
+    jobs = JobQueue(
+        app.config['JOB_QUEUE_DIR'],
+        workers=app.config['JOB_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+        lease=app.config['JOB_LEASE_SECONDS'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        retention=app.config['JOB_RETENTION_HOURS'] * 3600,
+    )
+
+# Распаковка тел с Content-Encoding до того, как их прочитает Flask.
+# Большой предел — только у endpoints, которые пишут тело на диск; пакеты
+# ограничены BATCH_MAX_MB в base64 (как несжатый JSON пакет), остальные
+# (JSON в памяти) — небольшим пределом
+decompression = DecompressionMiddleware(app.wsgi_app, body_limit(0), limits={
+    '/predict': app.config['MAX_DECOMPRESSED_MB'] * MB,
+    '/predict/upload': app.config['MAX_DECOMPRESSED_MB'] * MB,
+    '/jobs': app.config['MAX_DECOMPRESSED_MB'] * MB,
+    '/predict/batch': body_limit(app.config['BATCH_MAX_MB'] * MB, base64_encoded=True),
+})
+app.wsgi_app = decompression
+
+# Контроль допуска: ограниченное число вычислений и очередь, при перегрузке — 429
+admission = AdmissionController(
+    enabled=app.config['ADMISSION_ENABLED'],
+    limit=app.config['ADMISSION_CONCURRENCY'],
+    max_limit=app.config['ADMISSION_MAX_CONCURRENCY'],
+    max_queue=app.config['ADMISSION_MAX_QUEUE'],
+    queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+    adaptive=app.config['ADMISSION_ADAPTIVE'],
+    tolerance=app.config['ADMISSION_LATENCY_TOLERANCE'],
+)
+
+# Профилирование отдельных запросов (подписанный X-Profile или выборка)
+profiler = RequestProfiler(
+    app.config['PROFILE_DIR'],
+    secret=app.config['PROFILE_SECRET'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    max_captures=app.config['PROFILE_MAX_CAPTURES'],
+    max_bytes=app.config['PROFILE_MAX_MB'] * MB,
+)
+
+# Постоянная выборка стеков воркера (flamegraph в /profiles/stacks)
+stack_sampler = StackSampler(
+    hz=app.config['SAMPLER_HZ'],
+    max_overhead=app.config['SAMPLER_MAX_OVERHEAD'],
+    include_idle=app.config['SAMPLER_INCLUDE_IDLE'],
+    directory=app.config['SAMPLER_DIR'] or None,
+)
+
+def worker_gauges():
+    """Gauges воркера для снимка метрик"""
+    admission_stats = admission.stats()
+    pipeline_stats = pipeline.stats()
+    return {
+        'worker_rss_bytes': rss_bytes(),
+        'admission_in_flight': admission_stats['in_flight'],
+        'admission_queued': {
+            (('priority', priority),): count
+            for priority, count in admission_stats['queued_by_priority'].items()
+        },
+        'pipeline_in_flight': pipeline_stats['in_flight'],
+        'pipeline_queue_depth': pipeline_stats['queue_depth'],
+    }
+
+metrics.add_collector(worker_gauges)
+
+# Инференс выполняется по одному запросу за раз, в порядке приоритета запросов
+inference_lock = PriorityLock()
 
 def load_model():
     """Загрузка модели .h5"""
-    global model
+    global model, model_version
     try:
         # Используем tf.keras вместо отдельных импортов
         model = tf.keras.models.load_model(
-            'app/models/classification_model.h5',
+            MODEL_PATH,
             custom_objects=None,
             compile=False
         )
-        logger.info("✅ Модель загружена успешно")
+        # Версия из окружения или из размера и времени изменения файла модели
+        stat = os.stat(MODEL_PATH)
+        model_version = app.config['MODEL_VERSION'] or f"{int(stat.st_mtime)}-{stat.st_size}"
+        logger.info(f"✅ Модель загружена успешно (версия {model_version})")
        
         # Компилируем модель для предсказаний
         model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy']) 
@@ -31,44 +243,45 @@ def load_model():
         logger.error(f"❌ Ошибка загрузки модели: {e}")
         raise e
 
-def preprocess_image(image):
-    """Предобработка изображения для модели (299x299) с поддержкой TIFF"""
+def preprocess_image(image, out=None):
+    """Предобработка изображения для модели (299x299) с поддержкой TIFF
+
+    Если передан out (буфер (1, 299, 299, 3) float32 из пула), результат
+    записывается прямо в него, без промежуточных float32 массивов.
+    """
     try:
-        logger.info(f"📥 Начало предобработки. Размер: {image.size}, режим: {image.mode}")
+        stage_logger.info("📥 Начало предобработки. Размер: %s, режим: %s", image.size, image.mode)
        
         # Всегда изменяем размер до 299x299
         image = image.resize((299, 299), Image.Resampling.LANCZOS)
-        image_array = np.array(image, dtype=np.float32) / 255.0
+        pixels = np.asarray(image)
        
-        logger.info(f"📊 Размер массива после resize: {image_array.shape}")
+        stage_logger.info("📊 Размер массива после resize: %s", pixels.shape)
        
-        # Обработка разных форматов изображений
-        if len(image_array.shape) == 2:
+        # Обработка разных форматов изображений: недостающие каналы
+        # дополняются broadcasting'ом при записи в буфер
+        if pixels.ndim == 2:
             # Grayscale -> RGB
-            image_array = np.stack([image_array] * 3, axis=-1)
-            logger.info("🔄 Конвертировано из Grayscale в RGB")
-        elif image_array.shape[2] == 4:
+            pixels = pixels[:, :, np.newaxis]
+            stage_logger.info("🔄 Конвертировано из Grayscale в RGB")
+        elif pixels.shape[2] == 4:
             # RGBA -> RGB
-            image_array = image_array[:, :, :3]
-            logger.info("🔄 Конвертировано из RGBA в RGB")
-        elif image_array.shape[2] == 1:
+            pixels = pixels[:, :, :3]
+            stage_logger.info("🔄 Конвертировано из RGBA в RGB")
+        elif pixels.shape[2] == 1:
             # Single channel -> RGB
-            image_array = np.stack([image_array.squeeze()] * 3, axis=-1)
-            logger.info("🔄 Конвертировано из single channel в RGB")
+            stage_logger.info("🔄 Конвертировано из single channel в RGB")
+        elif pixels.shape[2] != 3:
+            logger.warning(f"⚠️  Неожиданное число каналов: {pixels.shape}. Используем первый канал")
+            pixels = pixels[:, :, :1]
        
-        # Финальная проверка размера
-        if image_array.shape != (299, 299, 3):
-            logger.warning(f"⚠️  Неправильный размер: {image_array.shape}. Принудительно изменяем на (299, 299, 3)")
-            # Создаем новое изображение с правильным размером
-            temp_img = Image.fromarray((image_array * 255).astype(np.uint8))
-            temp_img = temp_img.resize((299, 299), Image.Resampling.LANCZOS)
-            image_array = np.array(temp_img, dtype=np.float32) / 255.0
+        # Нормализация сразу в буфер с batch dimension
+        if out is None:
+            out = np.empty((1, 299, 299, 3), dtype=np.float32)
+        np.divide(pixels, np.float32(255.0), out=out[0], dtype=np.float32)
        
-        # Добавляем batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-       
-        logger.info(f"✅ Предобработка завершена. Финальный размер: {image_array.shape}")
-        return image_array
+        stage_logger.info("✅ Предобработка завершена. Финальный размер: %s", out.shape)
+        return out
        
     except Exception as e:
         logger.error(f"❌ Ошибка в preprocess_image: {e}")
@@ -78,7 +291,7 @@ def convert_tiff_to_jpeg(image_bytes):
     """Конвертирует TIFF в JPEG"""
     try:
         # Открываем TIFF изображение
-        image = Image.open(io.BytesIO(image_bytes))
+        image = Image.open(image_source(image_bytes))
        
         # Конвертируем в RGB если нужно
         if image.mode != 'RGB':
@@ -89,93 +302,1040 @@ def convert_tiff_to_jpeg(image_bytes):
         image.save(jpeg_buffer, format='JPEG', quality=95)
         jpeg_buffer.seek(0)
        
-        logger.info("✅ TIFF успешно конвертирован в JPEG")
+        stage_logger.info("✅ TIFF успешно конвертирован в JPEG")
         return jpeg_buffer.getvalue()
    
     except Exception as e:
         logger.error(f"❌ Ошибка конвертации TIFF в JPEG: {e}")
         raise e
 
+def prepare_image(image_bytes, roi=None, out=None, content_hash=None, memory=None):
+    """Декодирование и предобработка изображения.
+
+    Выполняется в пуле пайплайна, параллельно с инференсом других запросов.
+    out — буфер из пула, в который записывается вход модели.
+    По content_hash из декодированного изображения один раз создается превью.
+    memory — словарь для замеров памяти этапов (при MEMORY_TRACE_ENABLED;
+    в пуле process замеры остаются в процессе пула).
+    Возвращает ((processed_image, roi_info, quality), timings),
+    где quality — отчет проверки качества или None, если она выключена.
+    """
+    timings = {}
+    roi_info = None
+   
+    # Оценка памяти по заголовку до декодирования: уменьшенное декодирование или 413
+    plan = memory_budget.plan(image_bytes, roi)
+    stage_start = time.perf_counter()
+   
+    # Определяем формат по сигнатурам файлов (у загрузки на диске — через mmap)
+    is_tiff = bytes(image_bytes[:4]) in (b'II*\x00', b'MM\x00*')
+    if roi is None and plan is None and is_tiff:
+        stage_logger.info("🔍 Обнаружен TIFF формат, конвертируем в JPEG...")
+        with stage_memory.measure('tiff_convert', memory):
+            image_bytes = convert_tiff_to_jpeg(image_bytes)
+        timings['tiff_convert'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+   
+    with stage_memory.measure('decode', memory):
+        if roi is not None:
+            # Декодируем только область интереса, без конвертации всего TIFF
+            image, roi_info = open_image_region(image_bytes, roi)
+            file_format = f"ROI ({roi_info['decode_method']})"
+        elif plan is not None:
+            # Полное декодирование не помещается в бюджет памяти: уменьшенное целиком
+            image, roi_info = open_reduced(image_bytes, *plan)
+            file_format = f"reduced ({roi_info['decode_method']})"
+        else:
+            file_format = 'TIFF (converted to JPEG)' if is_tiff else 'JPEG/PNG'
+            # Открываем изображение с помощью PIL
+            image = Image.open(image_source(image_bytes))
+       
+        stage_logger.info("📐 Исходный размер: %s, режим: %s, формат: %s", image.size, image.mode, file_format)
+       
+        # Конвертируем в RGB если нужно
+        if image.mode != 'RGB':
+            original_mode = image.mode
+            image = image.convert('RGB')
+            stage_logger.info("🔄 Конвертирован из %s в RGB", original_mode)
+        image.load()
+    timings['decode'] = time.perf_counter() - stage_start
+   
+    # Превью для /images/<hash>/preview, пока декодированное изображение в памяти
+    if content_hash is not None:
+        stage_start = time.perf_counter()
+        if previews.save(preview_id(content_hash, roi_info), image):
+            timings['preview'] = time.perf_counter() - stage_start
+   
+    # Предобработка для модели
+    stage_start = time.perf_counter()
+    with stage_memory.measure('preprocess', memory):
+        processed_image = preprocess_image(image, out=out)
+    timings['preprocess'] = time.perf_counter() - stage_start
+   
+    # Проверка качества по уменьшенному входу модели
+    quality = None
+    if quality_gate.enabled:
+        stage_start = time.perf_counter()
+        quality = quality_gate.assess(processed_image[0])
+        timings['quality_gate'] = time.perf_counter() - stage_start
+   
+    return (processed_image, roi_info, quality), timings
+
+def lookup_cached(key):
+    """Ищет результат в кэше процесса, затем в общем хранилище. Возвращает словарь или None"""
+    cached = prediction_cache.get(key)
+    if cached is not None:
+        return with_preview(cached)
+   
+    if result_store is not None:
+        cached = result_store.get(key)
+        if cached is not None:
+            # Результат посчитан другим воркером или до перезапуска
+            prediction_cache.put(key, cached, len(json.dumps(cached)))
+            return with_preview(cached)
+   
+    return None
+
+def with_preview(cached):
+    """Результат из кэша: превью отмечается как использованное, вытесненное — без preview_url.
+
+    Кэш и хранилище результатов держат больше записей, чем каталог превью.
+    """
+    if 'preview_url' not in cached or previews.touch(preview_id(cached['image_hash'], cached)):
+        return cached
+    return {name: value for name, value in cached.items() if name != 'preview_url'}
+
+def remember_result(key, response_data):
+    """Сохраняет результат в кэш процесса и в общее хранилище"""
+    payload = json.dumps(response_data)
+    prediction_cache.put(key, response_data, len(payload))
+    if result_store is not None:
+        result_store.put(key, response_data, payload=payload)
+    return response_data
+
+def unusable_response(content_hash, quality, roi_info=None):
+    """Ответ для изображения, отсеянного проверкой качества"""
+    message = f"Изображение непригодно для анализа: {describe_quality(quality)}"
+    stage_logger.info("🚫 %s. Метрики: %s", message, quality['metrics'])
+    response_data = {
+        'success': True,
+        'usable': False,
+        'predictions': None,
+        'quality': quality,
+        'message': message,
+        'image_hash': content_hash,
+        'preview_url': preview_url(content_hash, roi_info)
+    }
+    if roi_info is not None:
+        response_data.update(roi_info)
+    return response_data
+
+def prediction_response(content_hash, results, roi_info=None, quality=None):
+    """Ответ с результатом инференса одного изображения"""
+    # Изображение для отображения — по ссылке на превью, а не копией в ответе
+    response_data = {
+        'success': True,
+        'predictions': results,
+        'processed_shape': (1,) + input_buffers.shape[1:],
+        'image_hash': content_hash,
+        'preview_url': preview_url(content_hash, roi_info)
+    }
+    if quality is not None:
+        response_data['usable'] = True
+        response_data['quality'] = quality
+    if roi_info is not None:
+        # Фактически использованный ROI и способ его декодирования
+        response_data.update(roi_info)
+    return response_data
+
+def compute_prediction(image_bytes, content_hash, roi=None):
+    """Декодирование, предобработка и инференс одного изображения.
+
+    Возвращает словарь ответа /predict (без флагов кэша).
+    """
+    # Вход модели пишется прямо в слот пула буферов
+    input_buffer = input_buffers.acquire()
+    try:
+        # Декодирование и предобработка в пуле, параллельно с инференсом других запросов.
+        # Процессы пула не видят память буфера — их результат копируется в слот
+        inline = profiling_active()
+        out = input_buffer if pipeline.in_process or inline else None
+        memory = {} if stage_memory.enabled else None
+        processed_image, roi_info, quality = pipeline.run(prepare_image, image_bytes, roi, out, content_hash,
+                                                          memory, inline=inline)
+       
+        # Непригодное изображение не тратит проход модели
+        if quality is not None:
+            quality_gate.record(quality, pipeline.average('inference'))
+            if not quality['passed']:
+                return unusable_response(content_hash, quality, roi_info)
+        if processed_image is not input_buffer:
+            np.copyto(input_buffer, processed_image)
+       
+        stage_logger.info("🔮 Выполняем предсказание...")
+       
+        # Предсказание: модель обрабатывает один запрос за раз,
+        # пока пул готовит входы для следующих
+        with inference_lock.hold(*inference_schedule()):
+            stage_start = time.perf_counter()
+            with stage_memory.measure('inference', memory):
+                prediction = model.predict(input_buffer, verbose=0)
+            pipeline.record('inference', time.perf_counter() - stage_start)
+    finally:
+        input_buffers.release(input_buffer)
+        record_memory(memory)
+    results = prediction.tolist()[0]
+   
+    stage_logger.info("✅ Предсказание завершено. Результаты: %s", results)
+   
+    return prediction_response(content_hash, results, roi_info, quality)
+
+def record_memory(memory):
+    """Замеры памяти этапов: в гистограммы /metrics и в запись app.timing запроса"""
+    for stage, usage in (memory or {}).items():
+        metrics.observe('stage_memory_bytes', usage['traced_peak_bytes'], {'stage': stage, 'kind': 'traced_peak'})
+        metrics.observe('stage_memory_bytes', max(0, usage['rss_delta_bytes']), {'stage': stage, 'kind': 'rss_delta'})
+        if has_request_context() and 'trace' in g:
+            g.trace.record_memory(stage, usage)
+
+def submit_batch(jobs):
+    """Ставит декодирование элементов чанка в пул; входы пишутся в строки буфера.
+
+    Возвращает (jobs, buffer, tasks) для finish_chunk().
+    """
+    buffer = batch_buffers.acquire()
+    inline = profiling_active()
+    args = []
+    for row, job in enumerate(jobs):
+        out = buffer[row:row + 1] if pipeline.in_process or inline else None
+        args.append((job['image_bytes'], job['roi'], out, job['hash']))
+    return jobs, buffer, pipeline.submit(prepare_image, args, inline=inline)
+
+def infer_batch(jobs, buffer, tasks):
+    """Дожидается подготовки чанка и выполняет один проход модели на все его входы.
+
+    Возвращает ответы в порядке jobs; ошибки отдельных изображений — в их ответах.
+    """
+    responses = [None] * len(jobs)
+    ready = []
+    for row, (job, (prepared, error)) in enumerate(zip(jobs, pipeline.gather(tasks))):
+        if error is not None:
+            logger.warning(f"⚠️  Изображение {job['names'][0]} не обработано: {error}")
+            responses[row] = {'success': False, 'error': str(error), 'image_hash': job['hash']}
+            continue
+       
+        processed_image, roi_info, quality = prepared
+        if quality is not None:
+            quality_gate.record(quality, pipeline.average('inference'))
+            if not quality['passed']:
+                responses[row] = unusable_response(job['hash'], quality, roi_info)
+                continue
+        if not pipeline.in_process:
+            np.copyto(buffer[row:row + 1], processed_image)
+        ready.append((row, roi_info, quality))
+   
+    if not ready:
+        return responses
+   
+    # Строки с ошибками в батч не попадают
+    rows = [row for row, _, _ in ready]
+    batch = buffer[:len(jobs)] if len(rows) == len(jobs) else buffer[rows]
+   
+    with inference_lock.hold(*inference_schedule()):
+        stage_start = time.perf_counter()
+        predictions = model.predict(batch, batch_size=len(batch), verbose=0)
+        pipeline.record('batch_inference', time.perf_counter() - stage_start)
+   
+    for (row, roi_info, quality), results in zip(ready, predictions.tolist()):
+        responses[row] = prediction_response(jobs[row]['hash'], results, roi_info, quality)
+    return responses
+
+def finish_chunk(pending, chunk, buffer, tasks):
+    """Инференс подготовленного чанка; выдает (имя, ответ) для всех его элементов"""
+    try:
+        responses = infer_batch(chunk, buffer, tasks)
+    except Exception as e:
+        logger.error(f"❌ Ошибка пакетного инференса: {e}")
+        responses = [{'success': False, 'error': str(e), 'image_hash': job['hash']} for job in chunk]
+    finally:
+        batch_buffers.release(buffer)
+   
+    for job, response_data in zip(chunk, responses):
+        if response_data.get('success'):
+            remember_result(job['key'], response_data)
+        del pending[job['key']]
+        for name in job['names']:
+            yield name, dict(response_data, cached=False)
+
+def iter_batch(items):
+    """Обработка пакета: кэш, дедупликация внутри пакета, батчи размера BATCH_SIZE.
+
+    Генератор (имя элемента, ответ): результаты выдаются, как только закончен
+    инференс батча с этим элементом. Пока модель обрабатывает один батч,
+    пул декодирует следующий; в памяти — только изображения этих двух батчей.
+    """
+    batch_size = batch_buffers.batch_size
+    pending = {}
+    chunk = []
+    submitted = None
+    try:
+        for item in items:
+            name = item['name']
+            try:
+                image_bytes = load_item(item)
+            except ItemError as e:
+                yield name, {'success': False, 'error': str(e)}
+                continue
+           
+            content_hash = image_hash(image_bytes)
+            key = cache_key(content_hash, model_version, item['roi'])
+           
+            # Одинаковые изображения в пакете обрабатываются один раз
+            job = pending.get(key)
+            if job is not None:
+                job['names'].append(name)
+                continue
+           
+            cached = lookup_cached(key)
+            if cached is not None:
+                yield name, dict(cached, cached=True)
+                continue
+           
+            job = {'key': key, 'hash': content_hash, 'image_bytes': image_bytes,
+                   'roi': item['roi'], 'names': [name]}
+            pending[key] = job
+            chunk.append(job)
+            if len(chunk) < batch_size:
+                continue
+           
+            # Чанк уходит на декодирование, предыдущий тем временем проходит модель
+            previous, submitted = submitted, submit_batch(chunk)
+            chunk = []
+            if previous is not None:
+                yield from finish_chunk(pending, *previous)
+       
+        if chunk:
+            previous, submitted = submitted, submit_batch(chunk)
+            if previous is not None:
+                yield from finish_chunk(pending, *previous)
+        if submitted is not None:
+            previous, submitted = submitted, None
+            yield from finish_chunk(pending, *previous)
+    finally:
+        # Клиент отключился посреди потока: дожидаемся пула и возвращаем буфер
+        if submitted is not None:
+            pipeline.gather(submitted[2])
+            batch_buffers.release(submitted[1])
+
+def stream_batch(items, batch_start, release=None):
+    """NDJSON: строка на элемент по мере готовности, в конце — итоговая строка.
+
+    release — освобождение места допуска, вызывается по окончании потока.
+    """
+    failed = 0
+    try:
+        for name, result in iter_batch(items):
+            failed += not result.get('success')
+            yield json.dumps(dict(result, name=name)) + '\n'
+    except Exception as e:
+        logger.error(f"❌ Error in batch prediction: {e}")
+        yield json.dumps({'done': True, 'success': False, 'error': str(e)}) + '\n'
+        return
+    finally:
+        if release is not None:
+            release()
+   
+    elapsed = time.perf_counter() - batch_start
+    logger.info(f"✅ Пакет обработан за {elapsed:.2f} с ({len(items) / elapsed:.1f} изобр./с), "
+                f"ошибок: {failed}")
+    yield json.dumps({
+        'done': True,
+        'success': True,
+        'count': len(items),
+        'failed': failed,
+        'elapsed_ms': round(elapsed * 1000, 3)
+    }) + '\n'
+
+def encode_original(image_bytes, roi=None):
+    """Полноразмерная копия изображения (или ROI) в JPEG data URL.
+
+    Отдельный проход декодирования и кодирования — только по запросу клиента.
+    """
+    stage_start = time.perf_counter()
+    if roi is not None:
+        image, _ = open_image_region(image_bytes, roi)
+    else:
+        image = Image.open(image_source(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+   
+    buffered_original = io.BytesIO()
+    image.save(buffered_original, format='JPEG', quality=95)
+    original_base64 = base64.b64encode(buffered_original.getvalue()).decode('utf-8')
+    pipeline.record('encode', time.perf_counter() - stage_start)
+    return f"data:image/jpeg;base64,{original_base64}"
+
+def flag_enabled(value):
+    """Булев флаг из JSON, формы или query string (include_image, stream)"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def request_schedule(default_priority=None):
+    """Класс приоритета и крайний срок запроса: (priority, deadline).
+
+    Приоритет — заголовок X-Priority (или ?priority=), срок — X-Deadline-Ms,
+    сколько миллисекунд клиент готов ждать ответ. Разбирается один раз на запрос.
+    """
+    if 'schedule' not in g:
+        priority = parse_priority(request.headers.get('X-Priority', request.args.get('priority')),
+                                  default_priority or app.config['ADMISSION_DEFAULT_PRIORITY'])
+        g.schedule = (priority, admission.deadline(parse_timeout_ms(request.headers.get('X-Deadline-Ms'))))
+    return g.schedule
+
+def inference_schedule():
+    """Приоритет и срок в очереди к модели: запроса или bulk вне запроса (задания)"""
+    if has_request_context() and 'schedule' in g:
+        return g.schedule
+    return 'bulk', None
+
+def compute_admitted(image_bytes, content_hash, roi=None):
+    """compute_prediction после контроля допуска; при перегрузке — Overloaded,
+    при истекшем сроке запроса — DeadlineExceeded (до декодирования)"""
+    priority, deadline = request_schedule()
+    wait_start = time.perf_counter()
+    with admission.admit(priority=priority, deadline=deadline):
+        pipeline.record('admission_wait', time.perf_counter() - wait_start)
+        return compute_prediction(image_bytes, content_hash, roi)
+
+def predict_result(image_bytes, roi=None, admit=True):
+    """Ответ для изображения: из кэша или вычисленный с объединением дубликатов.
+
+    admit=False — без контроля допуска (фоновые задания, их число и так ограничено).
+    """
+    # Повторно присланное изображение отдается из кэша до декодирования
+    content_hash = image_hash(image_bytes)
+    key = cache_key(content_hash, model_version, roi)
+    cached = lookup_cached(key)
+    if cached is not None:
+        stage_logger.info("⚡ Результат для %.12s найден в кэше", content_hash)
+        return dict(cached, cached=True)
+   
+    # Одновременные запросы с тем же изображением ждут первый из них
+    compute = compute_admitted if admit else compute_prediction
+    # Отказ допуска ведущего (его приоритет и срок) не передается ожидающим:
+    # они проходят допуск сами
+    response_data, coalesced = inflight.do(
+        key,
+        lambda: remember_result(key, compute(image_bytes, content_hash, roi)),
+        retry_on=(Overloaded, DeadlineExceeded)
+    )
+    if coalesced:
+        stage_logger.info("🔗 Запрос для %.12s объединен с уже выполняющимся", content_hash)
+    return dict(response_data, cached=False, coalesced=coalesced)
+
+def predict_image_bytes(image_bytes, roi=None, include_image=False):
+    """Общая часть /predict и /predict/upload: кэш, объединение дубликатов, инференс.
+
+    include_image — добавить в ответ полноразмерную копию изображения (original_image).
+    """
+    try:
+        response_data = predict_result(image_bytes, roi)
+    except ROIError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+   
+    if include_image:
+        response_data['original_image'] = encode_original(image_bytes, roi)
+    stage_start = time.perf_counter()
+    response = jsonify(response_data)
+    pipeline.record('response_encode', time.perf_counter() - stage_start)
+    return response
+
+@app.errorhandler(UploadTooLarge)
+def upload_too_large(e):
+    """Тело запроса больше лимита — в том числе после распаковки в любом endpoint"""
+    return jsonify({'success': False, 'error': str(e)}), 413
+
+@app.errorhandler(UploadError)
+def upload_error(e):
+    """Некорректное или битое (сжатое) тело запроса"""
+    return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.errorhandler(ScheduleError)
+def schedule_error(e):
+    """Некорректный X-Priority или X-Deadline-Ms"""
+    return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    """Срок запроса истек в очереди: декодирование и инференс не выполнялись"""
+    logger.warning(f"⏰ {e}")
+    return jsonify({'success': False, 'error': str(e)}), 504
+
+def overloaded_response(e):
+    """429 с Retry-After, рассчитанным по очереди и задержке"""
+    logger.warning(f"🚦 {e}, повтор через {e.retry_after} с")
+    response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def run_job(image_bytes, params):
+    """Обработчик задания из очереди: тот же путь, что у /predict, без HTTP запроса"""
+    if model is None:
+        raise RuntimeError('Модель не загружена')
+    return predict_result(image_bytes, parse_roi(params.get('roi')), admit=False)
+
+@app.before_request
+def start_job_workers():
+    """Запасной запуск очереди заданий (обычно — хуком post_fork gunicorn или при старте ASGI)"""
+    if jobs is not None:
+        jobs.ensure_started(run_job)
+
+@app.before_request
+def start_stack_sampler():
+    """Поток выборки стеков запускается в каждом воркере после fork"""
+    if app.config['SAMPLER_ENABLED']:
+        stack_sampler.ensure_started()
+
+@app.before_request
+def start_request_trace():
+    """Request ID (X-Request-ID клиента или новый) и разбивка времени по этапам"""
+    g.trace = RequestTrace(request_id(request.headers.get(REQUEST_ID_HEADER)))
+    # Подробные строки этапов пишутся целиком для выбранного запроса
+    g.log_stages = random.random() < stage_log_filter.rate
+
+@app.after_request
+def record_request_metrics(response):
+    """Счетчики запросов и ошибок, время и размер тела — по шаблону маршрута, не по URL"""
+    if not app.config['METRICS_ENABLED']:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+    metrics.inc('requests_total', labels)
+    if response.status_code >= 400:
+        metrics.inc('request_errors_total', labels)
+    if 'trace' in g:
+        metrics.observe('request_seconds', g.trace.elapsed(), {'endpoint': endpoint})
+    # Сжатое тело — по размеру до распаковки
+    size = request.environ.get('flask_ml.wire_length') or request.content_length
+    if size:
+        metrics.observe('request_bytes', int(size), {'endpoint': endpoint})
+    return response
+
+@app.after_request
+def add_trace_headers(response):
+    """X-Request-ID и Server-Timing в ответе, запись app.timing — после отправки тела.
+
+    У потоковых ответов (NDJSON) заголовок содержит этапы до начала потока,
+    а запись в логе — все этапы, включая инференс батчей.
+    """
+    if 'trace' not in g:
+        return response
+    trace = g.trace
+    response.headers[REQUEST_ID_HEADER] = trace.request_id
+    response.headers['Server-Timing'] = trace.server_timing()
+    # Разбивка видна в Resource Timing и для страниц с другого origin
+    response.headers['Timing-Allow-Origin'] = '*'
+    if app.config['REQUEST_TIMING_LOG']:
+        fields = {'method': request.method, 'path': request.path, 'status': response.status_code}
+        response.call_on_close(lambda: timing_logger.info(trace.log_record(**fields)))
+    return response
+
+def profiling_active():
+    """Текущий запрос профилируется: подготовка изображений выполняется в его потоке,
+    чтобы попасть в профиль cProfile"""
+    return has_request_context() and g.get('profile') is not None
+
+def profiled(view):
+    """Обработчик под cProfile (и профилировщиком TensorFlow), если запрос выбран для профиля.
+
+    Имя профиля возвращается в заголовке X-Profile-Id.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = None
+        if profiler.enabled:
+            mode = profiler.mode(g.trace.request_id, request.headers.get('X-Profile'),
+                                 flag_enabled(request.headers.get('X-Profile-TF')))
+        if mode is None:
+            return view(*args, **kwargs)
+        with profiler.capture(g.trace.request_id, tf_trace=mode['tf_trace']) as capture:
+            g.profile = capture
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            finally:
+                g.profile = None
+        if capture is not None:
+            response.headers['X-Profile-Id'] = capture.name
+        return response
+    return wrapper
+
 @app.route('/predict', methods=['POST'])
+@profiled
 def predict():
+    image_bytes = None
     try:
         if model is None:
             return jsonify({'success': False, 'error': 'Модель не загружена'}), 500
+       
+        # При перегрузке или истекшем сроке тело не читается вовсе
+        admission.check(*request_schedule())
+       
+        max_bytes = app.config['MAX_UPLOAD_MB'] * MB
+        check_content_length(body_limit(max_bytes, base64_encoded=True))
            
-        data = request.get_json()
-        if not data or 'image' not in data:
-            return jsonify({'success': False, 'error': 'No image data provided'}), 400
+        stage_start = time.perf_counter()
+        if request.is_json and spool_needed():
+            # Большой JSON не разбирается в памяти: тело пишется на диск,
+            # base64 поля image декодируется по блокам во временный файл
+            image_bytes, data = spool_json_image(request.stream, max_bytes, app.config['UPLOAD_SPOOL_DIR'])
+            pipeline.record('body_spool', time.perf_counter() - stage_start)
+        else:
+            data = request.get_json()
+            pipeline.record('body_parse', time.perf_counter() - stage_start)
+            if not data or 'image' not in data:
+                return jsonify({'success': False, 'error': 'No image data provided'}), 400
+       
+        try:
+            roi = parse_roi(data.get('roi'))
+        except ROIError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+       
+        stage_logger.info("📨 Получен запрос на предсказание...")
        
-        logger.info("📨 Получен запрос на предсказание...")
+        if image_bytes is None:
+            # Извлекаем base64 данные
+            image_data = data['image']
+            if ',' in image_data:
+                image_data = image_data.split(',')[1]
            
-        # Извлекаем base64 данные
-        image_data = data['image']
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
+            stage_start = time.perf_counter()
+            image_bytes = base64.b64decode(image_data)
+            pipeline.record('base64_decode', time.perf_counter() - stage_start)
+       
+        return predict_image_bytes(image_bytes, roi, flag_enabled(data.get('include_image')))
+       
+    except Overloaded as e:
+        return overloaded_response(e)
+    except (UploadError, ScheduleError, DeadlineExceeded):
+        # 400/413/504 отвечает обработчик ошибок приложения
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error in prediction: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        close_upload(image_bytes)
+
+def check_content_length(max_bytes):
+    """Тело больше лимита отклоняется по Content-Length, до чтения"""
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise UploadTooLarge(f"Тело запроса больше {max_bytes / MB:.0f} MB")
+
+def spool_needed():
+    """Большое тело (или тело без Content-Length) пишется во временный файл, а не в память"""
+    length = request.content_length
+    return length is None or length > app.config['UPLOAD_SPOOL_MB'] * MB
+
+def read_upload():
+    """Байты изображения и ROI из сырого тела image/* или из multipart/form-data.
+
+    Большое тело не читается в память: оно копируется блоками во временный
+    файл, и вместо байтов возвращается SpooledUpload (закрывается вызывающим
+    через close_upload). Больше MAX_UPLOAD_MB — UploadTooLarge.
+    Возвращает (image_bytes, roi) или None, если тип содержимого не поддерживается.
+    """
+    max_bytes = app.config['MAX_UPLOAD_MB'] * MB
+    spool_dir = app.config['UPLOAD_SPOOL_DIR']
+   
+    if request.mimetype == 'multipart/form-data':
+        check_content_length(body_limit(max_bytes))
+        upload = request.files.get('image')
+        roi = request.form.get('roi', request.args.get('roi'))
+        if not upload:
+            return b'', roi
+        if spool_needed():
+            return spool_stream(upload.stream, max_bytes, spool_dir), roi
+        return upload.read(), roi
+   
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        # Тело читается один раз, без JSON и base64
+        check_content_length(max_bytes)
+        if spool_needed():
+            return spool_stream(request.stream, max_bytes, spool_dir), request.args.get('roi')
+        return request.get_data(cache=False), request.args.get('roi')
+   
+    return None
+
+@app.route('/predict/upload', methods=['POST'])
+@profiled
+def predict_upload():
+    """Классификация изображения, переданного как есть: сырое тело или multipart.
+
+    В отличие от /predict нет data URL (+33% к размеру), разбора большого
+    JSON и копии base64 — файл читается из тела запроса один раз.
+    """
+    image_bytes = None
+    try:
+        if model is None:
+            return jsonify({'success': False, 'error': 'Модель не загружена'}), 500
        
-        image_bytes = base64.b64decode(image_data)
+        admission.check(*request_schedule())
        
-        # Определяем формат по сигнатурам файлов
-        is_tiff = image_bytes.startswith(b'II*\x00') or image_bytes.startswith(b'MM\x00*')
+        stage_start = time.perf_counter()
+        upload = read_upload()
+        pipeline.record('body_parse', time.perf_counter() - stage_start)
+        if upload is None:
+            return jsonify({
+                'success': False,
+                'error': f'Неподдерживаемый тип содержимого: {request.mimetype}. '
+                         f'Ожидается image/*, application/octet-stream или multipart/form-data'
+            }), 415
        
-        if is_tiff:
-            logger.info("🔍 Обнаружен TIFF формат, конвертируем в JPEG...")
-            # Конвертируем TIFF в JPEG
-            image_bytes = convert_tiff_to_jpeg(image_bytes)
-            file_format = 'TIFF (converted to JPEG)'
-        else:
-            file_format = 'JPEG/PNG'
+        image_bytes, roi_value = upload
+        if not image_bytes:
+            return jsonify({'success': False, 'error': 'No image data provided'}), 400
        
-        # Открываем изображение с помощью PIL
-        image = Image.open(io.BytesIO(image_bytes))
+        try:
+            roi = parse_roi(roi_value)
+        except ROIError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
        
-        logger.info(f"📐 Исходный размер: {image.size}, режим: {image.mode}, формат: {file_format}")
+        stage_logger.info("📨 Получен файл на предсказание: %.2f MB", len(image_bytes) / 1024 / 1024)
        
-        # Конвертируем в RGB если нужно
-        if image.mode != 'RGB':
-            original_mode = image.mode
-            image = image.convert('RGB')
-            logger.info(f"🔄 Конвертирован из {original_mode} в RGB")
+        include_image = request.form.get('include_image', request.args.get('include_image'))
+        return predict_image_bytes(image_bytes, roi, flag_enabled(include_image))
+       
+    except Overloaded as e:
+        return overloaded_response(e)
+    except (UploadError, ScheduleError, DeadlineExceeded):
+        # 400/413/504 отвечает обработчик ошибок приложения
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error in prediction: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        close_upload(image_bytes)
+
+@app.route('/predict/batch', methods=['POST'])
+@profiled
+def predict_batch():
+    """Пакетная классификация: multipart/form-data, zip-архив или JSON массив.
+
+    Изображения декодируются параллельно в пуле, модель вызывается батчами
+    по BATCH_SIZE. Результаты возвращаются по именам элементов; ошибка одного
+    изображения не прерывает пакет. С ?stream=1 (или Accept: application/x-ndjson)
+    результаты передаются потоком NDJSON по мере готовности батчей.
+    """
+    archive = None
+    try:
+        if model is None:
+            return jsonify({'success': False, 'error': 'Модель не загружена'}), 500
        
-        # Предобработка для модели
-        processed_image = preprocess_image(image)
+        # Пакеты по умолчанию — класс bulk: интерактивные запросы обслуживаются раньше
+        priority, deadline = request_schedule('bulk')
+        admission.check(priority, deadline)
        
-        logger.info(f"🔮 Выполняем предсказание...")
+        batch_start = time.perf_counter()
+        max_items = app.config['BATCH_MAX_ITEMS']
+        max_bytes = app.config['BATCH_MAX_MB'] * 1024 * 1024
+        try:
+            if request.mimetype == 'multipart/form-data':
+                # Части пишутся Werkzeug во временные файлы: тело ограничено до разбора,
+                # суммарный размер изображений — в items_from_files
+                check_content_length(body_limit(max_bytes))
+                roi = parse_roi(request.form.get('roi', request.args.get('roi')))
+                items = items_from_files(request.files, max_items, max_bytes, roi)
+            elif request.mimetype in ZIP_MIMETYPES:
+                roi = parse_roi(request.args.get('roi'))
+                # Архив пишется на диск блоками, элементы читаются из файла по мере обработки
+                check_content_length(body_limit(max_bytes))
+                archive = spool_stream(request.stream, body_limit(max_bytes), app.config['UPLOAD_SPOOL_DIR'])
+                items = items_from_zip(archive.path, max_items, max_bytes, roi)
+            elif request.is_json:
+                # JSON разбирается в памяти целиком: тело ограничено BATCH_MAX_MB в base64
+                check_content_length(body_limit(max_bytes, base64_encoded=True))
+                items = items_from_json(request.get_json(silent=True), max_items)
+            else:
+                return jsonify({
+                    'success': False,
+                    'error': f'Неподдерживаемый тип содержимого: {request.mimetype}. '
+                             f'Ожидается multipart/form-data, application/zip или application/json'
+                }), 415
+        except (BatchError, ROIError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        pipeline.record('body_parse', time.perf_counter() - batch_start)
        
-        # Предсказание
-        prediction = model.predict(processed_image, verbose=0)
-        results = prediction.tolist()[0]
+        if not items:
+            return jsonify({'success': False, 'error': 'В запросе нет изображений'}), 400
        
-        logger.info(f"✅ Предсказание завершено. Результаты: {results}")
+        logger.info(f"📦 Получен пакет из {len(items)} изображений")
+        metrics.observe('batch_size', len(items))
        
-        # Конвертируем оригинальное изображение в base64 для отображения
-        buffered_original = io.BytesIO()
-        image.save(buffered_original, format='JPEG', quality=95)
-        original_base64 = base64.b64encode(buffered_original.getvalue()).decode('utf-8')
-        original_image_data = f"data:image/jpeg;base64,{original_base64}"
+        stream = (flag_enabled(request.args.get('stream'))
+                  or request.accept_mimetypes.best == 'application/x-ndjson')
+        # Пакет занимает одно место допуска на все время обработки;
+        # задержка в статистике допуска — в пересчете на изображение
+        wait_start = time.perf_counter()
+        release = admission.releaser(admission.acquire(priority, deadline), weight=len(items))
+        pipeline.record('admission_wait', time.perf_counter() - wait_start)
+        if stream:
+            finish = batch_finisher(release, archive)
+            # Файл архива теперь удаляет поток по окончании
+            archive = None
+            response = Response(
+                stream_with_context(stream_batch(items, batch_start, finish)),
+                mimetype='application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+            # Запасной путь: поток не был прочитан, но сервер закрыл ответ
+            response.call_on_close(finish)
+            return response
        
-        response_data = {
-            'success': True,
-            'predictions': results,
-            'processed_shape': processed_image.shape,
-            'original_image': original_image_data
-        }
+        try:
+            results = dict(iter_batch(items))
+        finally:
+            release()
        
-        return jsonify(response_data)
+        failed = sum(1 for result in results.values() if not result.get('success'))
+        elapsed = time.perf_counter() - batch_start
+        logger.info(f"✅ Пакет обработан за {elapsed:.2f} с ({len(items) / elapsed:.1f} изобр./с), "
+                    f"ошибок: {failed}")
+       
+        return jsonify({
+            'success': True,
+            'count': len(items),
+            'failed': failed,
+            'names': [item['name'] for item in items],
+            'results': results
+        })
        
+    except Overloaded as e:
+        return overloaded_response(e)
+    except (UploadError, ScheduleError, DeadlineExceeded):
+        # 400/413/504 отвечает обработчик ошибок приложения
+        raise
     except Exception as e:
-        logger.error(f"❌ Error in prediction: {e}")
+        logger.error(f"❌ Error in batch prediction: {e}")
         import traceback
         logger.error(traceback.format_exc())
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    finally:
+        close_upload(archive)
+
+def batch_finisher(release, archive):
+    """Окончание потокового пакета: освобождает место допуска и удаляет файл архива"""
+    def finish():
+        release()
+        close_upload(archive)
+    return finish
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Асинхронный анализ: тело как у /predict/upload, ответ 202 с id задания"""
+    image_bytes = None
+    try:
+        if jobs is None:
+            return jsonify({'success': False, 'error': 'Очередь заданий выключена (JOB_QUEUE_DIR)'}), 503
+       
+        upload = read_upload()
+        if upload is None:
+            return jsonify({
+                'success': False,
+                'error': f'Неподдерживаемый тип содержимого: {request.mimetype}. '
+                         f'Ожидается image/*, application/octet-stream или multipart/form-data'
+            }), 415
+       
+        image_bytes, roi_value = upload
+        if not image_bytes:
+            return jsonify({'success': False, 'error': 'No image data provided'}), 400
+       
+        try:
+            roi = parse_roi(roi_value)
+        except ROIError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+       
+        try:
+            job = jobs.submit(image_bytes, {'roi': roi_to_dict(roi) if roi is not None else None})
+        except QueueFull as e:
+            response = jsonify({'success': False, 'error': str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+       
+        jobs.ensure_started(run_job)
+        logger.info(f"🗂️  Задание {job['job_id']} поставлено в очередь "
+                    f"({len(image_bytes) / 1024 / 1024:.2f} MB)")
+       
+        status_url = f"/jobs/{job['job_id']}"
+        response = jsonify(dict(job, success=True, status_url=status_url, result_url=f"{status_url}/result"))
+        response.headers['Location'] = status_url
+        return response, 202
+       
+    except (UploadError, ScheduleError, DeadlineExceeded):
+        # 400/413/504 отвечает обработчик ошибок приложения
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error submitting job: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    finally:
+        close_upload(image_bytes)
+
+def find_job(job_id):
+    """Задание по id или ответ с ошибкой"""
+    if jobs is None:
+        return None, (jsonify({'success': False, 'error': 'Очередь заданий выключена (JOB_QUEUE_DIR)'}), 503)
+    job = jobs.get(job_id) if JOB_ID_RE.match(job_id) else None
+    if job is None:
+        return None, (jsonify({'success': False, 'error': 'Задание не найдено'}), 404)
+    return job, None
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Статус задания: queued (с позицией в очереди), running, done (с результатом) или failed"""
+    job, error = find_job(job_id)
+    if error is not None:
+        return error
+    return jsonify(dict(job, success=True))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """Результат задания: 200 — готов, 202 — еще выполняется, 500 — ошибка"""
+    job, error = find_job(job_id)
+    if error is not None:
+        return error
+   
+    if job['status'] == DONE:
+        return jsonify(job['result'])
+    if job['status'] == FAILED:
+        return jsonify({'success': False, 'status': FAILED, 'error': job.get('error')}), 500
+   
+    response = jsonify({'success': True, 'status': job['status'], 'position': job.get('position')})
+    response.headers['Retry-After'] = '5'
+    return response, 202
+
+@app.route('/predict/lookup', methods=['POST'])
+def predict_lookup():
+    """Проверка по хэшу файла, посчитанному клиентом: есть ли готовый результат.
+
+    Позволяет не загружать изображение повторно: при промахе клиент
+    отправляет файл в /predict.
+    """
+    data = request.get_json(silent=True) or {}
+    content_hash = str(data.get('hash', '')).lower()
+    if not IMAGE_HASH_RE.match(content_hash):
+        return jsonify({'success': False, 'error': 'Ожидается SHA-256 файла (64 hex символа)'}), 400
+   
+    try:
+        roi = parse_roi(data.get('roi'))
+    except ROIError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+   
+    cached = lookup_cached(cache_key(content_hash, model_version, roi))
+    if cached is None:
+        return jsonify({'success': True, 'found': False, 'image_hash': content_hash})
+   
+    stage_logger.info("⚡ Результат для %.12s отдан по хэшу без загрузки файла", content_hash)
+    return jsonify(dict(cached, found=True, cached=True))
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/images/<content_hash>/preview')
+def image_preview(content_hash):
+    """Превью изображения по SHA-256 содержимого (и ROI, если он был задан)"""
+    content_hash = content_hash.lower()
+    if not IMAGE_HASH_RE.match(content_hash):
+        return jsonify({'success': False, 'error': 'Некорректный хэш изображения'}), 400
+   
+    roi_info = None
+    try:
+        roi = parse_roi(request.args.get('roi'))
+    except ROIError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if roi is not None:
+        roi_info = {'roi': roi_to_dict(roi)}
+   
+    pid = preview_id(content_hash, roi_info)
+    if not previews.touch(pid):
+        return jsonify({'success': False, 'error': 'Превью не найдено'}), 404
+   
+    # ETag по содержимому: повторный запрос с If-None-Match получает 304
+    response = send_file(
+        previews.path(pid),
+        mimetype='image/jpeg',
+        etag=f"{pid}-{previews.max_size}",
+        max_age=PREVIEW_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus, суммированные по всем воркерам"""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'success': False, 'error': 'Метрики выключены'}), 404
+    shared = {}
+    if jobs is not None:
+        # Очередь заданий общая (SQLite): одно значение без метки pid
+        job_stats = jobs.stats()
+        shared['jobs'] = {(('status', status),): job_stats[status] for status in ('queued', 'running')}
+    return Response(metrics.render(shared), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/profiles')
+def list_profiles():
+    """Сохраненные профили запросов (Authorization: Bearer <PROFILE_SECRET>)"""
+    if not profiler.authorized(request.headers.get('Authorization')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'profiles': profiler.list(), 'stats': profiler.stats()})
+
+@app.route('/profiles/stacks')
+def list_stack_profiles():
+    """Воркеры с выборкой стеков и затраты выборки в отвечающем воркере"""
+    if not profiler.authorized(request.headers.get('Authorization')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'pid': os.getpid(), 'workers': stack_sampler.workers(),
+                    'stats': stack_sampler.stats()})
+
+@app.route('/profiles/stacks/<int:pid>')
+def stack_profile(pid):
+    """Свернутые стеки воркера (collapsed: flamegraph.pl, speedscope, inferno)"""
+    if not profiler.authorized(request.headers.get('Authorization')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    collapsed = stack_sampler.collapsed_for(pid)
+    if collapsed is None:
+        return jsonify({'success': False, 'error': 'Нет стеков воркера'}), 404
+    return Response(collapsed, content_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename=stacks-{pid}.folded'})
+
+@app.route('/profiles/<filename>')
+def download_profile(filename):
+    """Файл профиля: .prof (pstats), .txt (сводка) или .tf.zip (трасса TensorFlow)"""
+    if not profiler.authorized(request.headers.get('Authorization')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    path = profiler.artifact_path(filename)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Профиль не найден'}), 404
+    return send_file(path, as_attachment=True, download_name=filename)
+
 @app.route('/health')
 def health():
     """Проверка статуса API"""
@@ -193,5 +1353,21 @@ def health():
     return jsonify({
         'status': 'healthy',
         'model_loaded': model is not None,
-        'model_info': model_info
+        'model_info': model_info,
+        'pipeline': pipeline.stats(),
+        'input_buffers': input_buffers.stats(),
+        'batch_buffers': batch_buffers.stats(),
+        'quality_gate': quality_gate.stats(),
+        'prediction_cache': prediction_cache.stats(),
+        'result_store': result_store.stats() if result_store is not None else {'enabled': False},
+        'inflight': inflight.stats(),
+        'previews': previews.stats(),
+        'jobs': jobs.stats() if jobs is not None else {'enabled': False},
+        'compression': decompression.stats.stats(),
+        'admission': admission.stats(),
+        'profiling': profiler.stats(),
+        'stack_sampler': stack_sampler.stats(),
+        'memory_budget': memory_budget.stats(),
+        'logging': dict(async_logging.stats(), stage_lines_passed=stage_log_filter.passed,
+                        stage_lines_suppressed=stage_log_filter.suppressed)
     })
\ No newline at end of file
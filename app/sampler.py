@@ -0,0 +1,219 @@
+"""
+Постоянный профилировщик воркера по выборке стеков.
+
+Фоновый поток с частотой hz снимает стеки всех потоков процесса через
+sys._current_frames() и считает свернутые стеки (формат collapsed для
+flamegraph.pl, speedscope, inferno): "поток;модуль:функция;... число".
+Потоки, ожидающие на блокировках, в очередях и в select, по умолчанию не
+учитываются — профиль показывает, куда уходит CPU.
+
+Время, потраченное на выборки, измеряется: если оно превышает
+max_overhead от времени работы, частота снижается. Раз в flush_interval
+секунд стеки записываются в общий каталог (файл на воркер), откуда их
+отдает /profiles/stacks любого воркера.
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Верхние кадры ожидающих потоков: (файл, функция)
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socketserver.py', 'serve_forever'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('thread.py', '_worker'),
+    ('connection.py', '_recv'),
+    ('sampler.py', '_run'),
+}
+
+# Стек сверх max_stacks различных стеков
+TRUNCATED = '[truncated]'
+
+# Номер потока в имени (preprocess_3, Thread-12) не различает стеки
+THREAD_NUMBER_RE = re.compile(r'[-_ ]\(?\d+\)?$')
+
+FOLDED_SUFFIX = '.folded'
+
+
+class StackSampler:
+    """Выборка стеков потоков процесса в фоновом потоке"""
+
+    def __init__(self, hz=19.0, max_overhead=0.01, max_stacks=10000, include_idle=False,
+                 directory=None, flush_interval=30.0):
+        self.hz = hz
+        self.min_hz = min(hz, 1.0)
+        self.max_overhead = max_overhead
+        self.max_stacks = max_stacks
+        self.include_idle = include_idle
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _reset(self):
+        self._stacks = {}
+        self._samples = 0
+        self._dropped = 0
+        self._sampling_time = 0.0
+        self._started = None
+        self._interval = 1.0 / self.hz
+
+    def ensure_started(self):
+        """Запускает поток выборки в текущем процессе (после fork — заново)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._reset()
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+            logger.info(f"🔥 Профилировщик стеков запущен: {self.hz:g} Гц, воркер {self._pid}")
+
+    def _run(self):
+        pid = self._pid
+        last_flush = time.monotonic()
+        while self._pid == pid:
+            time.sleep(self._interval)
+            started = time.perf_counter()
+            self.sample()
+            with self._lock:
+                self._sampling_time += time.perf_counter() - started
+                self._adjust_rate()
+            if self.directory and time.monotonic() - last_flush >= self.flush_interval:
+                last_flush = time.monotonic()
+                self.flush()
+
+    def _adjust_rate(self):
+        """Снижает частоту, если выборка занимает больше max_overhead времени"""
+        if self._overhead() > self.max_overhead and self._interval < 1.0 / self.min_hz:
+            self._interval = min(self._interval * 2, 1.0 / self.min_hz)
+            logger.warning(f"⚠️  Профилировщик стеков: затраты {self._overhead():.2%}, "
+                           f"частота снижена до {1.0 / self._interval:g} Гц")
+
+    def _overhead(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return self._sampling_time / elapsed if elapsed > 0 else 0.0
+
+    def sample(self):
+        """Одна выборка стеков всех потоков, кроме собственного"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        collected = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = fold(frame, THREAD_NUMBER_RE.sub('', names.get(ident, 'unknown')), self.include_idle)
+            if stack is not None:
+                collected.append(stack)
+        with self._lock:
+            self._samples += 1
+            for stack in collected:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    self._dropped += 1
+                    stack = TRUNCATED
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def collapsed(self):
+        """Свернутые стеки: строка "стек число" на стек, по убыванию числа"""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def flush(self):
+        """Записывает свернутые стеки воркера в общий каталог (атомарно)"""
+        if not self.directory:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.collapsed())
+            os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}{FOLDED_SUFFIX}"))
+        except OSError as e:
+            logger.warning(f"⚠️  Не удалось записать стеки: {e}")
+
+    def clear(self):
+        """Удаляет стеки прошлых запусков: вызывается при старте сервера до запуска воркеров"""
+        clear_stacks(self.directory)
+
+    def workers(self):
+        """Воркеры со стеками в общем каталоге: [{'pid', 'bytes', 'updated'}]"""
+        if not self.directory:
+            return [{'pid': os.getpid(), 'bytes': None, 'updated': time.time()}]
+        self.flush()
+        result = []
+        for entry in os.scandir(self.directory):
+            pid = entry.name[:-len(FOLDED_SUFFIX)]
+            if entry.name.endswith(FOLDED_SUFFIX) and pid.isdigit():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                result.append({'pid': int(pid), 'bytes': stat.st_size, 'updated': stat.st_mtime})
+        return sorted(result, key=lambda worker: worker['pid'])
+
+    def collapsed_for(self, pid):
+        """Стеки воркера pid: свои — текущие, чужие — последний записанный файл (None — нет)"""
+        if pid == os.getpid():
+            return self.collapsed()
+        if not self.directory:
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{int(pid)}{FOLDED_SUFFIX}")) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._pid == os.getpid(),
+                'hz': round(1.0 / self._interval, 2),
+                'samples': self._samples,
+                'stacks': len(self._stacks),
+                'dropped': self._dropped,
+                'overhead': round(self._overhead(), 5),
+                'max_overhead': self.max_overhead,
+            }
+
+
+def clear_stacks(directory):
+    """Удаляет файлы стеков воркеров из общего каталога"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.endswith((FOLDED_SUFFIX, '.tmp')):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def fold(frame, thread_name, include_idle=False):
+    """Стек потока от корня к вершине: "поток;модуль:функция;..."; None — поток ожидает"""
+    code = frame.f_code
+    if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+        frames.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    frames.append(thread_name)
+    # Разделители формата collapsed внутри имен заменяются
+    return ';'.join(part.replace(';', ':').replace(' ', '_') for part in reversed(frames))
@@ -0,0 +1,36 @@
+"""
+Хуки gunicorn (gunicorn.conf.py в корне проекта и run.py в production).
+
+on_starting (в мастере, до запуска воркеров) удаляет снимки метрик и
+стеки прошлого запуска: иначе их счетчики складывались бы с новыми.
+
+post_fork запускает фоновые потоки воркера сразу после fork: без него
+очередь заданий стартовала бы только с первым HTTP-запросом к воркеру,
+и после перезапуска задания ждали бы, пока воркер не получит запрос.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def on_starting(server):
+    """Общие каталоги метрик и стеков очищаются до запуска воркеров"""
+    # Как и в run.py, приложение импортируется в мастере (модель загружают воркеры)
+    from app import app
+    from app.metrics import clear_snapshots
+    from app.sampler import clear_stacks
+    clear_snapshots(app.config['METRICS_DIR'])
+    clear_stacks(app.config['SAMPLER_DIR'])
+    logger.info("🧹 Снимки метрик и стеки прошлого запуска удалены")
+
+
+def post_fork(server, worker):
+    """Очередь заданий запускается в воркере до первого запроса"""
+    from app import routes
+    if routes.jobs is None:
+        return
+    # Задания выполняются моделью: без нее они завершались бы ошибкой
+    if routes.model is None:
+        routes.load_model()
+    routes.jobs.ensure_started(routes.run_job)
+    logger.info(f"🗂️  Воркер {worker.pid}: очередь заданий запущена после fork")
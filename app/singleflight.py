@@ -0,0 +1,71 @@
+"""
+Объединение одновременных одинаковых запросов (single-flight).
+
+Первый запрос с данным ключом выполняет работу, остальные, пришедшие пока
+она идет, ждут его future и получают тот же результат (или ту же ошибку).
+Ошибки, зависящие от самого запроса (retry_on — например, отказ допуска
+по приоритету или сроку ведущего), ожидающим не передаются: они
+выполняют вызов сами.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Дедупликация выполняющихся вызовов по ключу"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+        self._retried = 0
+
+    def do(self, key, fn, retry_on=()):
+        """Выполняет fn() один раз на ключ среди одновременных вызовов.
+
+        Возвращает (result, coalesced): coalesced=True, если результат получен
+        от чужого вызова. Если чужой вызов завершился исключением из retry_on,
+        ожидающий повторяет попытку со своим fn (становится ведущим или
+        присоединяется к новому вызову).
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._calls[key] = future
+                    self._executed += 1
+                else:
+                    self._coalesced += 1
+
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except retry_on:
+                with self._lock:
+                    self._retried += 1
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        """Число выполненных и объединенных вызовов"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self._executed,
+                'coalesced': self._coalesced,
+                'retried': self._retried,
+            }
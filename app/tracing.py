@@ -0,0 +1,79 @@
+"""
+Идентификатор запроса и разбивка времени по этапам.
+
+Каждый запрос получает request ID (X-Request-ID клиента или новый) и
+RequestTrace, в который складывается время этапов, замеренных в потоке
+запроса. По окончании разбивка уходит в заголовок Server-Timing (видна в
+инструментах разработчика браузера) и одной структурированной записью в
+лог app.timing — по request ID их можно сопоставить с логом доступа
+gunicorn и проверками деплойера.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import threading
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Допустимый ID клиента: попадает в заголовки и логи без экранирования
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+def request_id(incoming=None):
+    """ID клиента, если он допустим, иначе новый (uuid4 hex)"""
+    if incoming and REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+class RequestTrace:
+    """Время этапов одного запроса (этапы из нескольких потоков и повторы суммируются)"""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self._stages = {}
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            total, count = self._stages.get(stage, (0.0, 0))
+            self._stages[stage] = (total + seconds, count + 1)
+
+    def record_memory(self, stage, usage):
+        """Замер памяти этапа: {'traced_peak_bytes', 'rss_delta_bytes'}"""
+        with self._lock:
+            self._memory[stage] = dict(usage)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stages_ms(self):
+        """{этап: миллисекунды} в порядке первого замера"""
+        with self._lock:
+            return {stage: round(total * 1000, 3) for stage, (total, _) in self._stages.items()}
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing: этапы, total и request ID"""
+        entries = [f"{stage};dur={ms}" for stage, ms in self.stages_ms().items()]
+        entries.append(f"total;dur={round(self.elapsed() * 1000, 3)}")
+        entries.append(f'request;desc="{self.request_id}"')
+        return ', '.join(entries)
+
+    def log_record(self, **fields):
+        """Одна строка JSON с разбивкой для лога app.timing"""
+        record = {
+            'event': 'request',
+            'request_id': self.request_id,
+            **fields,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            'stages_ms': self.stages_ms(),
+            'pid': os.getpid(),
+        }
+        with self._lock:
+            if self._memory:
+                record['memory_bytes'] = dict(self._memory)
+        return json.dumps(record, ensure_ascii=False)
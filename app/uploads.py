@@ -0,0 +1,253 @@
+"""
+Прием больших загрузок без копий тела запроса в памяти.
+
+Тело запроса больше UPLOAD_SPOOL_MB читается из WSGI-потока блоками прямо
+во временный файл, SHA-256 считается по ходу записи. Из JSON /predict поле
+image декодируется из base64 тоже по блокам — строка целиком в память не
+попадает. Дальше изображение открывается по пути к файлу: Pillow читает
+его с диска блоками, а несжатые данные отображает в память (mmap), поэтому
+пиковая память запроса близка к размеру декодированных пикселей, а не к
+кратному размеру загрузки. Размер изображения ограничен MAX_UPLOAD_MB.
+"""
+import io
+import os
+import re
+import json
+import mmap
+import hashlib
+import binascii
+import tempfile
+
+# Размер блока чтения тела запроса и декодирования base64
+CHUNK_SIZE = 1 << 20
+
+# Запас на остальные поля JSON/формы и границы multipart сверх размера изображения
+FIELDS_OVERHEAD = 1 << 20
+
+IMAGE_FIELD_RE = re.compile(rb'"image"\s*:\s*"')
+
+# Escape-последовательности JSON, допустимые внутри base64: \/ и переводы строк
+JSON_ESCAPE_RE = re.compile(rb'\\(.)', re.DOTALL)
+JSON_ESCAPES = {b'/': b'/', b'n': b'', b'r': b'', b't': b''}
+
+BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+NOT_BASE64 = bytes(b for b in range(256) if b not in BASE64_ALPHABET)
+
+
+class UploadError(Exception):
+    """Некорректное тело загрузки.
+
+    Не ValueError: парсер форм Werkzeug и get_json(silent=True) молча
+    проглатывают ValueError, а ошибка чтения тела должна дойти до endpoint.
+    """
+
+
+class UploadTooLarge(UploadError):
+    """Загрузка больше MAX_UPLOAD_MB"""
+
+
+class SpooledUpload:
+    """Загрузка во временном файле.
+
+    Ведет себя как байты изображения там, где это нужно (len, срезы —
+    через mmap), а Pillow открывает ее по пути (image_source). SHA-256
+    посчитан при записи. В процессы пула передается только путь.
+    """
+
+    def __init__(self, path, content_hash, size, owned=True):
+        self.path = path
+        self.hash = content_hash
+        self.size = size
+        self.owned = owned
+        self._map = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Существующий файл (вход задания): хэш считается блоками, файл не удаляется"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        return cls(path, digest.hexdigest(), size, owned=False)
+
+    @property
+    def data(self):
+        """Содержимое файла, отображенное в память (только чтение)"""
+        if self.size == 0:
+            return b''
+        if self._map is None:
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __reduce__(self):
+        # Копия в другом процессе не владеет файлом и отображает его заново
+        return (SpooledUpload, (self.path, self.hash, self.size, False))
+
+    def close(self):
+        """Снимает отображение и удаляет файл, если он принадлежит загрузке"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self.owned:
+            self.owned = False
+            _remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def image_source(image_bytes):
+    """Источник для Image.open: путь к файлу загрузки или BytesIO для байтов в памяти"""
+    if isinstance(image_bytes, SpooledUpload):
+        return image_bytes.path
+    return io.BytesIO(image_bytes)
+
+
+def close_upload(image_bytes):
+    """Удаляет временный файл загрузки (для байтов в памяти ничего не делает)"""
+    if isinstance(image_bytes, SpooledUpload):
+        image_bytes.close()
+
+
+def body_limit(max_bytes, base64_encoded=False):
+    """Предел размера тела запроса с изображением не больше max_bytes"""
+    if base64_encoded:
+        max_bytes = -(-max_bytes // 3) * 4
+    return max_bytes + FIELDS_OVERHEAD
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _spool(chunks, max_bytes, directory=None):
+    """Записывает блоки во временный файл, считая SHA-256 и проверяя лимит"""
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='upload-', dir=directory or None)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Изображение больше {max_bytes / 1024 / 1024:.0f} MB")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        _remove(path)
+        raise
+    return SpooledUpload(path, digest.hexdigest(), size)
+
+
+def spool_stream(stream, max_bytes, directory=None):
+    """Копирует поток (тело запроса, файл из multipart) во временный файл блоками"""
+    return _spool(iter(lambda: stream.read(CHUNK_SIZE), b''), max_bytes, directory)
+
+
+def spool_json_image(stream, max_bytes, directory=None):
+    """Тело JSON /predict с изображением в base64, без разбора строки в памяти.
+
+    Тело пишется во временный файл, поле image находится в нем через mmap
+    и декодируется по блокам во второй файл. Возвращает (upload, fields),
+    где fields — остальные поля JSON.
+    """
+    with spool_stream(stream, body_limit(max_bytes, base64_encoded=True), directory) as body:
+        data = body.data
+        start, end, fields = _find_image_field(data)
+        if start == end:
+            raise UploadError('No image data provided')
+        upload = _spool(_decode_base64(data, start, end), max_bytes, directory)
+    if not upload:
+        upload.close()
+        raise UploadError('No image data provided')
+    return upload, fields
+
+
+def _find_image_field(data):
+    """Границы строки image верхнего уровня и остальные поля JSON.
+
+    Остаток JSON без значения image небольшой и разбирается обычным
+    json.loads — так же проверяется, что найденный ключ верхнего уровня.
+    """
+    for match in IMAGE_FIELD_RE.finditer(data):
+        start = match.end()
+        end = data.find(b'"', start)
+        while end > start and _escaped(data, end):
+            end = data.find(b'"', end + 1)
+        if end < 0:
+            break
+        try:
+            fields = json.loads(bytes(data[:start]) + bytes(data[end:]))
+        except ValueError:
+            continue
+        if isinstance(fields, dict) and fields.get('image') == '':
+            del fields['image']
+            return start, end, fields
+    raise UploadError('No image data provided')
+
+
+def _escaped(data, pos):
+    """Символ в позиции pos экранирован нечетным числом обратных слэшей"""
+    count = 0
+    while pos - count - 1 >= 0 and data[pos - count - 1] == ord('\\'):
+        count += 1
+    return count % 2 == 1
+
+
+def _unescape(match):
+    try:
+        return JSON_ESCAPES[match.group(1)]
+    except KeyError:
+        raise UploadError('Недопустимая escape-последовательность в base64 изображения')
+
+
+def _decode_base64(data, start, end):
+    """Декодирует base64 из data[start:end] блоками (префикс data URL отбрасывается)"""
+    comma = data.find(b',', start, end)
+    if comma >= 0:
+        start = comma + 1
+
+    pending = b''
+    pos = start
+    while pos < end:
+        chunk = data[pos:min(pos + CHUNK_SIZE, end)]
+        pos += len(chunk)
+        # Escape-последовательность не разрывается между блоками
+        while chunk.endswith(b'\\') and pos < end:
+            chunk += data[pos:pos + 1]
+            pos += 1
+        if b'\\' in chunk:
+            chunk = JSON_ESCAPE_RE.sub(_unescape, chunk)
+
+        # Как base64.b64decode: символы вне алфавита пропускаются
+        chunk = pending + chunk.translate(None, NOT_BASE64)
+        usable = len(chunk) - len(chunk) % 4
+        pending = chunk[usable:]
+        if usable:
+            yield _a2b(chunk[:usable])
+    if pending:
+        yield _a2b(pending)
+
+
+def _a2b(chunk):
+    try:
+        return binascii.a2b_base64(chunk)
+    except binascii.Error as e:
+        raise UploadError(f"Некорректный base64 изображения: {e}")
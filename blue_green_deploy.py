@@ -36,6 +36,9 @@ class BlueGreenDeployer:
         self.image_green = f"{app_name}:green"
         self.image_latest = f"{app_name}:latest"
         
+        # Общий том для хранилища результатов: переживает смену контейнеров
+        self.data_volume = f"{app_name}-data"
+        
         # Конфигурация
         self.health_timeout = health_timeout
         self.graceful_shutdown_time = 30
@@ -305,6 +308,7 @@ class BlueGreenDeployer:
             f"docker run -d "
             f"--name {container_name} "
             f"-p {port}:5000 "
+            f"-v {self.data_volume}:/app/data "
             f"--restart unless-stopped "
             f"--memory=2g "
             f"--cpus=1.0 "
@@ -334,6 +338,13 @@ class BlueGreenDeployer:
         
         return True
     
+    def check_headers(self, purpose):
+        """
+        X-Request-ID проверки: по нему запрос находится в логах приложения
+        (app.timing, лог доступа gunicorn)
+        """
+        return {'X-Request-ID': f"deploy-{purpose}-{uuid.uuid4().hex[:12]}"}
+    
     def wait_for_health(self, environment, timeout=None):
         """
         Ожидание готовности окружения
@@ -350,8 +361,9 @@ class BlueGreenDeployer:
         check_interval = 5
         
         while time.time() - start_time < timeout:
+            headers = self.check_headers(f"health-{environment}")
             try:
-                response = requests.get(url, timeout=10)
+                response = requests.get(url, headers=headers, timeout=10)
                 
                 if response.status_code == 200:
                     health_data = response.json()
@@ -369,7 +381,8 @@ class BlueGreenDeployer:
                         return True
                 
                 elapsed = time.time() - start_time
-                print(f"     Ожидание... ({elapsed:.0f}/{timeout} сек)")
+                print(f"     Ожидание... ({elapsed:.0f}/{timeout} сек, "
+                      f"статус {response.status_code}, {headers['X-Request-ID']})")
                 
             except requests.exceptions.ConnectionError:
                 elapsed = time.time() - start_time
@@ -400,16 +413,18 @@ class BlueGreenDeployer:
         for endpoint, method in validation_endpoints:
             url = f"http://localhost:{port}{endpoint}"
             
+            headers = self.check_headers(f"validate-{environment}")
             try:
                 if method == 'GET':
-                    response = requests.get(url, timeout=10)
+                    response = requests.get(url, headers=headers, timeout=10)
                 else:
                     # Отправляем тестовые данные
                     test_data = {"test": "validation"}
-                    response = requests.post(url, json=test_data, timeout=10)
+                    response = requests.post(url, json=test_data, headers=headers, timeout=10)
                 
                 if response.status_code in [200, 400, 422]:
-                    print(f"    Endpoint {endpoint} отвечает (статус: {response.status_code})")
+                    print(f"    Endpoint {endpoint} отвечает (статус: {response.status_code}, "
+                          f"{headers['X-Request-ID']})")
                     return True
                 
             except Exception as e:
@@ -450,6 +465,7 @@ class BlueGreenDeployer:
                 f"docker run -d "
                 f"--name {new_container} "
                 f"-p {self.main_port}:5000 "
+                f"-v {self.data_volume}:/app/data "
                 f"--restart unless-stopped "
                 f"--memory=2g "
                 f"--cpus=1.0 "
@@ -490,7 +506,7 @@ class BlueGreenDeployer:
         
         while time.time() - start_time < timeout:
             try:
-                response = requests.get(url, timeout=5)
+                response = requests.get(url, headers=self.check_headers('health-main'), timeout=5)
                 if response.status_code == 200:
                     health_data = response.json()
                     if health_data.get('status') == 'healthy':
@@ -0,0 +1,2 @@
+# gunicorn.conf.py — читается gunicorn из рабочего каталога (CMD в Dockerfile)
+from app.server_hooks import on_starting, post_fork  # noqa: F401
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Клиент сервиса классификации для пакетной обработки со станции.
+
+Вместо цикла requests.post с новым соединением на каждый вызов клиент
+держит пул соединений (requests.Session), отправляет до parallelism
+запросов одновременно и сам группирует изображения в вызовы
+/predict/batch (по batch_size, результаты приходят потоком NDJSON). Если
+сервер не поддерживает пакеты, клиент переходит на /predict/upload. Ответы
+429/503 и обрывы соединения повторяются с экспоненциальной задержкой (или
+через Retry-After сервера). Результаты возвращаются итератором по мере
+готовности, в памяти клиента — только изображения отправляемых пакетов.
+
+Не импортирует приложение (Flask, TensorFlow) — нужен только requests.
+
+    from predict_client import PredictClient
+
+    client = PredictClient('http://server:5000', parallelism=8)
+    for name, result in client.predict_directory('scans/'):
+        print(name, result.get('predictions'))
+
+Или из командной строки (NDJSON в stdout):
+
+    python predict_client.py scans/ --url http://server:5000 --parallelism 8
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg', '.bmp')
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Маркер окончания потока результатов
+_DONE = object()
+
+
+class ClientError(Exception):
+    """Запрос не выполнен после всех повторов"""
+
+
+class PredictClient:
+    """Клиент /predict/batch и /predict/upload с пулом соединений и повторами"""
+
+    def __init__(self, base_url='http://localhost:5000', parallelism=4, batch_size=16, max_retries=5,
+                 backoff=0.5, max_backoff=30.0, timeout=300.0, priority='bulk', session=None, sleep=time.sleep):
+        self.base_url = base_url.rstrip('/')
+        self.parallelism = parallelism
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.priority = priority
+        self._sleep = sleep
+        # None — неизвестно, пока не ответит /predict/batch
+        self.batch_supported = None if batch_size > 1 else False
+
+        self.session = session or requests.Session()
+        # По соединению на поток: повторные запросы не открывают новые TCP-соединения
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=parallelism)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if priority:
+            self.session.headers['X-Priority'] = priority
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _delay(self, attempt, response=None):
+        """Задержка перед повтором: Retry-After сервера или экспонента с разбросом"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+
+    def _post(self, path, **kwargs):
+        """POST с повторами при 429/503 и ошибках соединения.
+
+        kwargs['files'] может быть функцией, открывающей файлы заново для
+        каждой попытки.
+        """
+        make_files = kwargs.pop('files', None)
+        for attempt in range(self.max_retries + 1):
+            files = make_files() if callable(make_files) else make_files
+            try:
+                response = self.session.post(f"{self.base_url}{path}", files=files, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise ClientError(f"{path}: {e}")
+                self._sleep(self._delay(attempt))
+                continue
+            finally:
+                _close_files(files)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = self._delay(attempt, response)
+            response.close()
+            self._sleep(delay)
+        raise ClientError(f"{path}: повторы исчерпаны")
+
+    def predict(self, image, name=None):
+        """Одно изображение (путь или байты) через /predict/upload"""
+        name = name or (image if isinstance(image, str) else 'image')
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        data = _read(image)
+        response = self._post('/predict/upload', data=data, headers={'Content-Type': content_type})
+        return _result(response)
+
+    def _predict_chunk(self, chunk, results):
+        """Пакет через /predict/batch?stream=1; результаты кладутся в results по мере прихода"""
+        remaining = list(chunk)
+        for attempt in range(self.max_retries + 1):
+            if self.batch_supported is False:
+                break
+            # stream=True: строки NDJSON читаются по мере прихода, а обрыв тела
+            # возникает при чтении, где повторяются только изображения без результата
+            try:
+                response = self._post('/predict/batch', params={'stream': 1}, stream=True,
+                                      files=lambda: [('images', (name, _open(image))) for name, image in remaining])
+            except ClientError as e:
+                for name, _ in remaining:
+                    results.put((name, {'success': False, 'error': str(e)}))
+                return
+            if response.status_code in (404, 405, 415):
+                # Сервер без пакетного endpoint: дальше — по одному изображению
+                self.batch_supported = False
+                response.close()
+                break
+            if response.status_code != 200:
+                error = _result(response)
+                for name, _ in remaining:
+                    results.put((name, error))
+                return
+            self.batch_supported = True
+
+            done = False
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    if entry.get('done'):
+                        if not entry.get('success', True):
+                            raise ClientError(entry.get('error', 'Ошибка пакета'))
+                        done = True
+                        continue
+                    name = entry.pop('name')
+                    remaining = [(n, image) for n, image in remaining if n != name]
+                    results.put((name, entry))
+                if not done:
+                    raise ClientError('Поток результатов оборвался')
+            except (requests.RequestException, ClientError, ValueError) as e:
+                # Обрыв посреди потока: повторяются только изображения без результата
+                if attempt == self.max_retries:
+                    for name, _ in remaining:
+                        results.put((name, {'success': False, 'error': str(e)}))
+                    return
+                self._sleep(self._delay(attempt))
+                continue
+            finally:
+                response.close()
+            # Имена, переименованные сервером (повторы в пакете получают суффикс #n)
+            for name, _ in remaining:
+                results.put((name, {'success': False, 'error': 'Сервер не вернул результат'}))
+            return
+
+        for name, image in remaining:
+            try:
+                results.put((name, self.predict(image, name)))
+            except ClientError as e:
+                results.put((name, {'success': False, 'error': str(e)}))
+
+    def predict_many(self, images):
+        """Итератор (имя, результат) для изображений по мере готовности.
+
+        images — пути или пары (имя, байты/путь). Изображения группируются
+        в пакеты по batch_size; одновременно выполняется до parallelism
+        пакетов, следующие пакеты формируются по мере освобождения мест,
+        поэтому весь список в память не читается.
+        """
+        results = queue.Queue()
+        slots = threading.BoundedSemaphore(self.parallelism)
+        stop = threading.Event()
+        errors = []
+
+        def run(chunk):
+            try:
+                self._predict_chunk(chunk, results)
+            except Exception as e:
+                for name, _ in chunk:
+                    results.put((name, {'success': False, 'error': str(e)}))
+            finally:
+                slots.release()
+
+        def produce(executor):
+            futures = []
+            try:
+                for chunk in _chunks(images, self.batch_size):
+                    # Следующий пакет читается, только когда есть свободное место
+                    slots.acquire()
+                    if stop.is_set():
+                        slots.release()
+                        break
+                    futures.append(executor.submit(run, chunk))
+                for future in futures:
+                    future.result()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                results.put(_DONE)
+
+        with ThreadPoolExecutor(max_workers=self.parallelism + 1, thread_name_prefix='predict-client') as executor:
+            executor.submit(produce, executor)
+            try:
+                while True:
+                    item = results.get()
+                    if item is _DONE:
+                        break
+                    yield item
+            finally:
+                # Итератор закрыт раньше времени: новые пакеты не отправляются
+                stop.set()
+        if errors:
+            raise errors[0]
+
+    def predict_directory(self, directory, extensions=IMAGE_EXTENSIONS):
+        """Все изображения каталога (рекурсивно); имя — путь относительно каталога"""
+        def paths():
+            for root, _, files in os.walk(directory):
+                for filename in sorted(files):
+                    if filename.lower().endswith(extensions):
+                        path = os.path.join(root, filename)
+                        yield os.path.relpath(path, directory), path
+        return self.predict_many(paths())
+
+
+def _chunks(images, size):
+    """Пакеты по size пар (имя, изображение); путь без имени — имя и изображение"""
+    chunk = []
+    for entry in images:
+        chunk.append(entry if isinstance(entry, tuple) else (entry, entry))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read(image):
+    if isinstance(image, str):
+        with open(image, 'rb') as f:
+            return f.read()
+    return image
+
+
+def _open(image):
+    """Файл для multipart: путь открывается (requests читает его блоками), байты — как есть"""
+    return open(image, 'rb') if isinstance(image, str) else image
+
+
+def _close_files(files):
+    for _, (_, content) in files or ():
+        if hasattr(content, 'close'):
+            content.close()
+
+
+def _result(response):
+    """Тело ответа как dict; не-JSON ответ — ошибка со статусом"""
+    try:
+        data = response.json()
+    except ValueError:
+        data = {'success': False, 'error': f"HTTP {response.status_code}"}
+    finally:
+        response.close()
+    if response.status_code != 200 and isinstance(data, dict):
+        data.setdefault('success', False)
+        data.setdefault('status', response.status_code)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Классификация каталога изображений')
+    parser.add_argument('directory', help='Каталог с изображениями (обходится рекурсивно)')
+    parser.add_argument('--url', default=os.getenv('PREDICT_URL', 'http://localhost:5000'))
+    parser.add_argument('--parallelism', type=int, default=4, help='Одновременных запросов')
+    parser.add_argument('--batch-size', type=int, default=16, help='Изображений в вызове /predict/batch')
+    parser.add_argument('--priority', default='bulk', help='X-Priority: interactive | normal | bulk')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = failed = 0
+    with PredictClient(args.url, parallelism=args.parallelism, batch_size=args.batch_size,
+                       priority=args.priority) as client:
+        for name, result in client.predict_directory(args.directory):
+            count += 1
+            failed += not result.get('success')
+            print(json.dumps(dict(result, name=name), ensure_ascii=False), flush=True)
+
+    elapsed = time.perf_counter() - started
+    print(f"Обработано {count} изображений за {elapsed:.1f} с "
+          f"({count / elapsed if elapsed else 0:.1f} изобр./с), ошибок: {failed}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
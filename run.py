@@ -3,7 +3,8 @@ import os
 import sys
 import logging
 from app import app
-from app.routes import load_model
+from app.routes import load_model, metrics, stack_sampler
+from app.server_hooks import post_fork
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,8 +18,30 @@ def main():
     """Запуск приложения"""
     
     env = os.getenv('FLASK_ENV', 'development')
+    # sync — gunicorn (поток на запрос), async — uvicorn (app/asgi.py)
+    server_mode = os.getenv('SERVER_MODE', 'sync')
     
     try:
+        if env == 'production':
+            # Счетчики /metrics и стеки прошлого запуска не смешиваются с новыми воркерами
+            metrics.clear()
+            stack_sampler.clear()
+        
+        if env == 'production' and server_mode == 'async':
+            # Воркеры uvicorn — отдельные процессы: модель загружает каждый при старте (lifespan)
+            logger.info("🚀 Запуск в production режиме (async, uvicorn)")
+            import uvicorn
+            
+            uvicorn.run(
+                'app.asgi:application',
+                host='0.0.0.0',
+                port=5000,
+                workers=4,
+                timeout_keep_alive=30,
+                log_level='info'
+            )
+            return
+        
         # Загружаем модель
         logger.info("🚀 Загружаем ML модель...")
         load_model()
@@ -49,7 +72,12 @@ def main():
                 'workers': 4,
                 'threads': 2,
                 'timeout': 120,
-                'loglevel': 'info'
+                'loglevel': 'info',
+                # Лог доступа с X-Request-ID ответа — для сопоставления с записями app.timing
+                'accesslog': '-',
+                'access_log_format': '%(h)s "%(r)s" %(s)s %(b)s %(M)sms request_id=%({x-request-id}o)s',
+                # Очередь заданий стартует в воркере сразу, а не с первым запросом
+                'post_fork': post_fork
             }
             
             FlaskApplication(app, options).run()
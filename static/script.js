@@ -18,6 +18,20 @@ function checkAnswerBlockVisibility() {
 }
 
 
+// Разбивка времени сервера по этапам (заголовок Server-Timing) и request ID —
+// по нему запрос находится в логах сервера
+function logServerTiming(response) {
+    const header = response.headers.get('Server-Timing');
+    if (!header) return;
+    const stages = {};
+    for (const entry of header.split(',')) {
+        const [name, ...params] = entry.trim().split(';');
+        const dur = params.find(param => param.startsWith('dur='));
+        if (dur) stages[name] = `${parseFloat(dur.slice(4)).toFixed(1)} мс`;
+    }
+    console.log(`⏱️ Запрос ${response.headers.get('X-Request-ID')}, этапы на сервере:`, stages);
+}
+
 // Проверка доступности API
 async function checkAPIHealth() {
     try {
@@ -54,56 +68,124 @@ function createTIFFPreview() {
     return 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KICA8cmVjdCB3aWR0aD0iMjAwIiBoZWlnaHQ9IjIwMCIgZmlsbD0iI2Y1ZjVmNSIvPgogIDx0ZXh0IHg9IjEwMCIgeT0iMTAwIiB0ZXh0LWFuY2hvcj0ibWlkZGxlIiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiM5OTkiPlRJRkYgSW1hZ2U8L3RleHQ+Cjwvc3ZnPg==';
 }
 
+// SHA-256 файла (hex) через SubtleCrypto; null, если API недоступно (не https/localhost)
+async function hashFile(file) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+        .map(byte => byte.toString(16).padStart(2, '0'))
+        .join('');
+}
+
+// Несжатые TIFF сжимаются в 3-5 раз: gzip в браузере (CompressionStream) перед отправкой.
+// Возвращает сжатый Blob или null, если сжатие недоступно или не уменьшило файл
+async function compressTiff(file) {
+    const isTiff = file.type === 'image/tiff' || /\.tiff?$/i.test(file.name);
+    if (!isTiff || !window.CompressionStream) {
+        return null;
+    }
+    
+    const compressed = await new Response(
+        file.stream().pipeThrough(new CompressionStream('gzip'))
+    ).blob();
+    return compressed.size < file.size ? compressed : null;
+}
+
+// Отправка файла телом запроса; сжатый вариант — с Content-Encoding: gzip
+function uploadFile(file, compressed) {
+    const headers = {
+        'Content-Type': file.type || 'application/octet-stream',
+        // Запросы из интерфейса обслуживаются раньше пакетных
+        'X-Priority': 'interactive',
+    };
+    if (compressed) {
+        headers['Content-Encoding'] = 'gzip';
+    }
+    
+    return fetch(`${API_URL}/predict/upload`, {
+        method: 'POST',
+        headers: headers,
+        body: compressed || file
+    });
+}
+
+// Проверка, есть ли на сервере готовый результат для файла с этим хэшем
+async function lookupCachedResult(hash) {
+    try {
+        const response = await fetch(`${API_URL}/predict/lookup`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                hash: hash
+            })
+        });
+        
+        if (!response.ok) {
+            return null;
+        }
+        
+        const result = await response.json();
+        return result.found ? result : null;
+    } catch (error) {
+        console.warn('⚠️ Проверка по хэшу недоступна:', error);
+        return null;
+    }
+}
+
 // Отправка изображения на сервер для предсказания
 async function processImage(file) {
     try {
         console.log(`📁 Обрабатываем файл: ${file.name}, тип: ${file.type}, размер: ${(file.size / 1024 / 1024).toFixed(2)} MB`);
         
-        return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            
-            reader.onload = async function(event) {
-                try {
-                    const imageData = event.target.result;
-                    
-                    console.log(`📤 Отправляем изображение на сервер...`);
-                    
-                    const response = await fetch(`${API_URL}/predict`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            image: imageData
-                        })
-                    });
-                    
-                    if (!response.ok) {
-                        const errorText = await response.text();
-                        throw new Error(`HTTP error! status: ${response.status}, details: ${errorText}`);
-                    }
-                    
-                    const result = await response.json();
-                    
-                    if (!result.success) {
-                        throw new Error(result.error);
-                    }
-                    
-                    console.log(`✅ Предсказание получено:`, result.predictions);
-                    resolve(result);
-                    
-                } catch (error) {
-                    reject(error);
-                }
-            };
-            
-            reader.onerror = function() {
-                reject(new Error('Ошибка чтения файла'));
-            };
-            
-            // Читаем файл как Data URL
-            reader.readAsDataURL(file);
-        });
+        // Сначала проверяем по хэшу: если файл уже анализировался, не загружаем его
+        const hash = await hashFile(file);
+        if (hash) {
+            const cached = await lookupCachedResult(hash);
+            if (cached) {
+                console.log(`⚡ Результат найден по хэшу ${hash.slice(0, 12)}, загрузка не нужна`);
+                return cached;
+            }
+        }
+        
+        console.log(`📤 Отправляем изображение на сервер...`);
+        const uploadStart = performance.now();
+        
+        // Файл уходит телом запроса: без data URL, base64 (+33%) и JSON, TIFF — в gzip
+        const compressed = await compressTiff(file);
+        const compressMs = performance.now() - uploadStart;
+        let response = await uploadFile(file, compressed);
+        let wireBytes = compressed ? compressed.size : file.size;
+        
+        // Сервер без поддержки сжатия: повторяем без него
+        if (compressed && response.status === 415) {
+            response = await uploadFile(file, null);
+            wireBytes = file.size;
+        }
+        
+        console.log(`📶 По сети: ${(wireBytes / 1024 / 1024).toFixed(2)} MB ` +
+                    `из ${(file.size / 1024 / 1024).toFixed(2)} MB` +
+                    (compressed ? ` (gzip ${compressMs.toFixed(0)} мс)` : '') +
+                    `, ответ за ${(performance.now() - uploadStart).toFixed(0)} мс`);
+        logServerTiming(response);
+        
+        if (!response.ok) {
+            const errorText = await response.text();
+            throw new Error(`HTTP error! status: ${response.status}, details: ${errorText}`);
+        }
+        
+        const result = await response.json();
+        
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+        
+        console.log(`✅ Предсказание получено:`, result.predictions);
+        return result;
         
     } catch (error) {
         console.error('Ошибка при обработке изображения:', error);
@@ -126,14 +208,29 @@ function displayResults(result, fileName) {
         return;
     }
 
-    // Показываем оригинальное изображение
-    answerImg.src = result.original_image;
+    // Показываем изображение: превью по ссылке (кэшируется браузером)
+    // или полноразмерную копию, если она была запрошена
+    if (result.preview_url) {
+        answerImg.src = `${API_URL}${result.preview_url}`;
+    } else if (result.original_image) {
+        answerImg.src = result.original_image;
+    }
     
     // Добавляем информацию о файле
     if (fileInfo) {
         fileInfo.textContent = `Файл: ${fileName}`;
     }
 
+    // Изображение отсеяно проверкой качества до инференса
+    if (result.usable === false) {
+        answerText.textContent = 'Изображение непригодно для анализа';
+        answerAccuracy.textContent = result.message || '';
+        console.log('🚫 Проверка качества не пройдена:', result.quality);
+        answerBlock.style.visibility = 'visible';
+        checkAnswerBlockVisibility();
+        return;
+    }
+
     // Анализируем результаты
     let accuracy, className;
     const results = result.predictions;
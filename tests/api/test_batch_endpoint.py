@@ -0,0 +1,255 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+import shutil
+import zipfile
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.buffers import BufferPool
+import app.routes as routes
+
+
+def mean_predict(batch, batch_size=None, verbose=0):
+    """Модель-заглушка: вероятность = средняя яркость строки батча"""
+    means = batch.reshape(len(batch), -1).mean(axis=1)
+    return np.stack([means, 1 - means], axis=1).astype(np.float32)
+
+
+class TestBatchEndpoint(unittest.TestCase):
+    """API тесты /predict/batch"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        # Маленький батч, чтобы проверить разбиение на чанки
+        self.buffers_patcher = patch.object(routes, 'batch_buffers', BufferPool(2, batch_size=2))
+        self.buffers_patcher.start()
+
+    def tearDown(self):
+        self.buffers_patcher.stop()
+        routes.prediction_cache.clear()
+
+    def _image_bytes(self, value, image_format='PNG'):
+        buffered = io.BytesIO()
+        Image.new('RGB', (320, 240), color=(value, value, value)).save(buffered, format=image_format)
+        return buffered.getvalue()
+
+    def _assert_mean(self, result, value):
+        self.assertTrue(result['success'], result)
+        self.assertAlmostEqual(result['predictions'][0], value / 255.0, places=2)
+
+    @patch('app.routes.model')
+    def test_multipart_batched_inference(self, mock_model):
+        """Файлы multipart обрабатываются батчами, результаты — по именам файлов"""
+        mock_model.predict.side_effect = mean_predict
+        values = [20, 60, 100, 140, 180]
+
+        response = self.app.post('/predict/batch', data={
+            'images': [(io.BytesIO(self._image_bytes(v)), f'img_{v}.png') for v in values]
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['failed'], 0)
+        self.assertEqual(data['names'], [f'img_{v}.png' for v in values])
+        for v in values:
+            self._assert_mean(data['results'][f'img_{v}.png'], v)
+
+        batch_sizes = [len(call.args[0]) for call in mock_model.predict.call_args_list]
+        self.assertEqual(batch_sizes, [2, 2, 1])
+
+    @patch('app.routes.model')
+    def test_zip_archive(self, mock_model):
+        """zip-архив: каждый файл — элемент пакета, каталоги пропускаются"""
+        mock_model.predict.side_effect = mean_predict
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('scans/', '')
+            zf.writestr('scans/a.png', self._image_bytes(30))
+            zf.writestr('scans/b.tiff', self._image_bytes(90, 'TIFF'))
+
+        response = self.app.post('/predict/batch', data=archive.getvalue(), content_type='application/zip')
+
+        data = json.loads(response.data)
+        self.assertEqual(sorted(data['results']), ['scans/a.png', 'scans/b.tiff'])
+        self._assert_mean(data['results']['scans/a.png'], 30)
+        self._assert_mean(data['results']['scans/b.tiff'], 90)
+
+    @patch('app.routes.model')
+    def test_zip_spooled_to_disk(self, mock_model):
+        """zip-архив читается из временного файла, который удаляется после потока"""
+        mock_model.predict.side_effect = mean_predict
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            for v in (40, 80, 120):
+                zf.writestr(f'{v}.png', self._image_bytes(v))
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+
+        with patch.dict(app.config, {'UPLOAD_SPOOL_DIR': spool_dir}):
+            response = self.app.post('/predict/batch?stream=1', data=archive.getvalue(),
+                                     content_type='application/zip')
+            chunks = iter(response.response)
+            first = json.loads(next(chunks))
+            self.assertEqual(len(os.listdir(spool_dir)), 1)
+            lines = [first] + [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+            response.close()
+
+            self.assertEqual(os.listdir(spool_dir), [])
+            self.assertEqual(lines[-1]['count'], 3)
+            self._assert_mean(first, int(first['name'].split('.')[0]))
+
+            self.app.post('/predict/batch', data=archive.getvalue(), content_type='application/zip')
+            self.app.post('/predict/batch', data=b'not a zip', content_type='application/zip')
+            self.assertEqual(os.listdir(spool_dir), [])
+
+    @patch('app.routes.model')
+    def test_item_errors_do_not_fail_batch(self, mock_model):
+        """Битый base64, не-изображение и некорректный ROI — ошибки только своих элементов"""
+        mock_model.predict.side_effect = mean_predict
+        good = base64.b64encode(self._image_bytes(50)).decode()
+
+        response = self.app.post('/predict/batch', data=json.dumps({'images': [
+            {'name': 'good', 'image': 'data:image/png;base64,' + good},
+            {'name': 'bad_base64', 'image': '###'},
+            {'name': 'not_image', 'image': base64.b64encode(b'hello').decode()},
+            {'name': 'bad_roi', 'image': good, 'roi': [5000, 5000, 10, 10]},
+            {'name': 'good_roi', 'image': good, 'roi': [0, 0, 100, 100]},
+        ]}), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['failed'], 3)
+        self._assert_mean(data['results']['good'], 50)
+        self._assert_mean(data['results']['good_roi'], 50)
+        for name in ('bad_base64', 'not_image', 'bad_roi'):
+            self.assertFalse(data['results'][name]['success'])
+            self.assertIn('error', data['results'][name])
+
+    @patch('app.routes.model')
+    def test_duplicates_and_cache(self, mock_model):
+        """Одинаковые изображения считаются один раз, повторный пакет — из кэша"""
+        mock_model.predict.side_effect = mean_predict
+        image = base64.b64encode(self._image_bytes(70)).decode()
+        payload = json.dumps([image, image, image])
+
+        first = json.loads(self.app.post('/predict/batch', data=payload, content_type='application/json').data)
+        second = json.loads(self.app.post('/predict/batch', data=payload, content_type='application/json').data)
+
+        self.assertEqual(first['names'], ['0', '1', '2'])
+        self.assertEqual(mock_model.predict.call_count, 1)
+        self.assertEqual(len(mock_model.predict.call_args.args[0]), 1)
+        self.assertTrue(all(r['cached'] for r in second['results'].values()))
+
+    @patch('app.routes.model')
+    def test_ndjson_stream(self, mock_model):
+        """Потоковый режим: строка на элемент по мере готовности батчей и итоговая строка"""
+        mock_model.predict.side_effect = mean_predict
+        values = [25, 65, 105, 145, 185]
+        payload = json.dumps({'images': [
+            {'name': f'img_{v}', 'image': base64.b64encode(self._image_bytes(v)).decode()} for v in values
+        ] + [{'name': 'broken', 'image': '###'}]})
+
+        response = self.app.post('/predict/batch?stream=1', data=payload, content_type='application/json')
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertFalse(response.is_sequence)
+        lines = []
+        calls_seen = []
+        for chunk in response.response:
+            for line in chunk.decode().splitlines():
+                lines.append(json.loads(line))
+                calls_seen.append(mock_model.predict.call_count)
+        response.close()
+
+        # Первые результаты отдаются до инференса последнего батча
+        self.assertEqual(calls_seen[0], 1)
+        self.assertEqual(calls_seen[-1], 3)
+
+        summary = lines[-1]
+        self.assertEqual(summary['done'], True)
+        self.assertEqual(summary['count'], 6)
+        self.assertEqual(summary['failed'], 1)
+        results = {line['name']: line for line in lines[:-1]}
+        self.assertEqual(sorted(results), sorted([f'img_{v}' for v in values] + ['broken']))
+        for v in values:
+            self._assert_mean(results[f'img_{v}'], v)
+        self.assertFalse(results['broken']['success'])
+
+    @patch('app.routes.model')
+    def test_stream_client_disconnect(self, mock_model):
+        """Обрыв потока клиентом возвращает буферы в пул"""
+        mock_model.predict.side_effect = mean_predict
+        images = [base64.b64encode(self._image_bytes(v)).decode() for v in (11, 22, 33, 44, 55, 66)]
+
+        response = self.app.post('/predict/batch?stream=1', data=json.dumps(images),
+                                 content_type='application/json')
+        next(iter(response.response))
+        response.close()
+
+        self.assertLess(mock_model.predict.call_count, 3)
+        self.assertEqual(routes.batch_buffers.stats()['free'], 2)
+
+    @patch('app.routes.model')
+    def test_stream_via_accept_header(self, mock_model):
+        """Accept: application/x-ndjson включает потоковый режим"""
+        mock_model.predict.side_effect = mean_predict
+        image = base64.b64encode(self._image_bytes(35)).decode()
+
+        response = self.app.post('/predict/batch', data=json.dumps([image]), content_type='application/json',
+                                 headers={'Accept': 'application/x-ndjson'})
+
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        response.close()
+        self.assertEqual([line.get('name') for line in lines], ['0', None])
+        self.assertEqual(routes.batch_buffers.stats()['free'], 2)
+
+    @patch('app.routes.model')
+    def test_invalid_requests(self, mock_model):
+        """Пустой или слишком большой пакет -> 400, неподдерживаемый тип -> 415"""
+        image = base64.b64encode(self._image_bytes(10)).decode()
+        with patch.dict(app.config, {'BATCH_MAX_ITEMS': 2}):
+            too_many = self.app.post('/predict/batch', data=json.dumps([image] * 3),
+                                     content_type='application/json')
+        empty = self.app.post('/predict/batch', data=json.dumps({'images': []}),
+                              content_type='application/json')
+        bad_zip = self.app.post('/predict/batch', data=b'not a zip', content_type='application/zip')
+        text = self.app.post('/predict/batch', data='hello', content_type='text/plain')
+
+        self.assertEqual(too_many.status_code, 400)
+        self.assertEqual(empty.status_code, 400)
+        self.assertEqual(bad_zip.status_code, 400)
+        self.assertEqual(text.status_code, 415)
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.model')
+    def test_multipart_size_limits(self, mock_model):
+        """Multipart пакет: тело больше BATCH_MAX_MB -> 413 до разбора, сумма файлов -> 400"""
+        part = os.urandom(600 * 1024)
+        with patch.dict(app.config, {'BATCH_MAX_MB': 1}):
+            too_many_bytes = self.app.post('/predict/batch', data={
+                'images': [(io.BytesIO(part), f'{i}.png') for i in range(3)]
+            }, content_type='multipart/form-data')
+            too_large = self.app.post('/predict/batch', data={
+                'images': [(io.BytesIO(part), f'{i}.png') for i in range(4)]
+            }, content_type='multipart/form-data')
+
+        self.assertEqual(too_many_bytes.status_code, 400)
+        self.assertIn('MB', json.loads(too_many_bytes.data)['error'])
+        self.assertEqual(too_large.status_code, 413)
+        mock_model.predict.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
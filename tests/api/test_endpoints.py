@@ -68,7 +68,7 @@ class TestAPIEndpointsFixed(unittest.TestCase):
             # В тестовом окружении success может быть False
             if data.get('success'):
                 self.assertIn('predictions', data)
-                self.assertIn('original_image', data)
+                self.assertIn('preview_url', data)
         else:
             # Если модель не загружена, это ожидаемо в тестах
             self.assertIn(response.status_code, [200, 500])
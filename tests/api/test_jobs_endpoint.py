@@ -0,0 +1,111 @@
+import unittest
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.jobs import JobQueue
+import app.routes as routes
+
+
+class TestJobsEndpoint(unittest.TestCase):
+    """API тесты асинхронных заданий /jobs"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        self.directory = tempfile.mkdtemp()
+        self.queue = JobQueue(self.directory, poll_interval=0.05)
+        self.jobs_patcher = patch.object(routes, 'jobs', self.queue)
+        self.jobs_patcher.start()
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (360, 280), color=(5, 120, 200)).save(buffered, format='TIFF')
+        self.image_bytes = buffered.getvalue()
+
+    def tearDown(self):
+        self.queue.stop()
+        self.jobs_patcher.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        routes.prediction_cache.clear()
+
+    def _wait(self, status_url, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            data = json.loads(self.app.get(status_url).data)
+            if data['status'] in ('done', 'failed'):
+                return data
+            time.sleep(0.02)
+        raise AssertionError(f"Задание не завершилось: {data}")
+
+    @patch('app.routes.model')
+    def test_submit_poll_result(self, mock_model):
+        """Отправка возвращает 202 и id сразу, результат доступен после выполнения"""
+        mock_model.predict.return_value = np.array([[0.35, 0.65]], dtype=np.float32)
+
+        response = self.app.post('/jobs?roi=10,10,200,200', data=self.image_bytes,
+                                 content_type='image/tiff')
+
+        self.assertEqual(response.status_code, 202)
+        submitted = json.loads(response.data)
+        self.assertEqual(response.headers['Location'], f"/jobs/{submitted['job_id']}")
+
+        status = self._wait(submitted['status_url'])
+        self.assertEqual(status['status'], 'done')
+        np.testing.assert_allclose(status['result']['predictions'], [0.35, 0.65], rtol=1e-6)
+        self.assertEqual(status['result']['roi'], {'x': 10, 'y': 10, 'width': 200, 'height': 200})
+
+        result = self.app.get(submitted['result_url'])
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(json.loads(result.data)['success'])
+
+    @patch('app.routes.model')
+    def test_result_pending_and_failed(self, mock_model):
+        """Незавершенное задание — 202 с Retry-After, ошибка обработки — 500"""
+        job = self.queue.submit(b'not an image', {'roi': None})
+        pending = self.app.get(f"/jobs/{job['job_id']}/result")
+        self.assertEqual(pending.status_code, 202)
+        self.assertIn('Retry-After', pending.headers)
+
+        self.queue.ensure_started(routes.run_job)
+        self._wait(f"/jobs/{job['job_id']}")
+        failed = self.app.get(f"/jobs/{job['job_id']}/result")
+
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(json.loads(failed.data)['status'], 'failed')
+        mock_model.predict.assert_not_called()
+
+    def test_unknown_job_and_bad_requests(self):
+        """Неизвестное задание -> 404, пустое тело -> 400, неподдерживаемый тип -> 415"""
+        self.assertEqual(self.app.get(f"/jobs/{'0' * 32}").status_code, 404)
+        self.assertEqual(self.app.get('/jobs/../etc').status_code, 404)
+        self.assertEqual(self.app.post('/jobs', data=b'', content_type='image/png').status_code, 400)
+        self.assertEqual(self.app.post('/jobs', data='x', content_type='text/plain').status_code, 415)
+
+    def test_queue_full(self):
+        """Переполненная очередь -> 503 с Retry-After"""
+        self.queue.max_pending = 0
+        response = self.app.post('/jobs', data=self.image_bytes, content_type='image/tiff')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_disabled(self):
+        """Без JOB_QUEUE_DIR API заданий отвечает 503"""
+        with patch.object(routes, 'jobs', None):
+            response = self.app.post('/jobs', data=self.image_bytes, content_type='image/tiff')
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+import hashlib
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+import app.routes as routes
+
+
+class TestLookupEndpoint(unittest.TestCase):
+    """API тесты /predict/lookup"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (330, 260), color=(30, 60, 90)).save(buffered, format='PNG')
+        self.image_bytes = buffered.getvalue()
+        self.image_hash = hashlib.sha256(self.image_bytes).hexdigest()
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+
+    def _lookup(self, payload):
+        return self.app.post('/predict/lookup', data=json.dumps(payload), content_type='application/json')
+
+    def test_lookup_miss(self):
+        """Неизвестный хэш — промах, клиент должен загрузить файл"""
+        response = self._lookup({'hash': self.image_hash})
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertFalse(data['found'])
+
+    @patch('app.routes.model')
+    def test_lookup_hit_after_predict(self, mock_model):
+        """После анализа результат доступен по хэшу, посчитанному клиентом"""
+        mock_model.predict.return_value = np.array([[0.25, 0.75]], dtype=np.float32)
+        self.app.post('/predict', data=json.dumps({
+            'image': 'data:image/png;base64,' + base64.b64encode(self.image_bytes).decode()
+        }), content_type='application/json')
+
+        data = json.loads(self._lookup({'hash': self.image_hash.upper()}).data)
+
+        self.assertTrue(data['found'])
+        self.assertTrue(data['cached'])
+        self.assertEqual(data['image_hash'], self.image_hash)
+        np.testing.assert_allclose(data['predictions'], [0.25, 0.75], rtol=1e-6)
+        mock_model.predict.assert_called_once()
+
+    def test_lookup_roi_is_part_of_key(self):
+        """Результат для ROI не совпадает с результатом для всего изображения"""
+        routes.remember_result(
+            routes.cache_key(self.image_hash, routes.model_version),
+            {'success': True, 'predictions': [1.0, 0.0]}
+        )
+
+        full = json.loads(self._lookup({'hash': self.image_hash}).data)
+        region = json.loads(self._lookup({'hash': self.image_hash, 'roi': [0, 0, 10, 10]}).data)
+
+        self.assertTrue(full['found'])
+        self.assertFalse(region['found'])
+
+    def test_lookup_invalid_hash(self):
+        """Некорректный хэш -> 400"""
+        for payload in [{}, {'hash': 'abc'}, {'hash': 'z' * 64}]:
+            with self.subTest(payload=payload):
+                response = self._lookup(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(json.loads(response.data)['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
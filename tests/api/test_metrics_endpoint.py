@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import io
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+import app.routes as routes
+
+
+def sample(text, line_start):
+    """Значение строки экспозиции, начинающейся с line_start (None — строки нет)"""
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """API тесты /metrics"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+
+    def _metrics(self):
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        return response.get_data(as_text=True)
+
+    @patch('app.routes.model')
+    def test_stage_histograms_and_request_counts(self, mock_model):
+        """После предсказания видны этапы, счетчик запросов и размер тела"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+        buffered = io.BytesIO()
+        Image.new('RGB', (64, 48), color=(1, 2, 3)).save(buffered, format='TIFF')
+
+        label = 'flask_ml_requests_total{endpoint="/predict/upload",method="POST",status="200"}'
+        before = sample(self._metrics(), label) or 0
+        response = self.app.post('/predict/upload', data=buffered.getvalue(), content_type='image/tiff')
+        self.assertEqual(response.status_code, 200)
+
+        text = self._metrics()
+        self.assertEqual(sample(text, label), before + 1)
+        for stage in ('body_parse', 'tiff_convert', 'decode', 'preprocess', 'inference', 'response_encode'):
+            self.assertGreater(sample(text, f'flask_ml_stage_seconds_count{{stage="{stage}"}}') or 0, 0, stage)
+        self.assertGreater(sample(text, 'flask_ml_request_bytes_count{endpoint="/predict/upload"}'), 0)
+        self.assertIn(f'flask_ml_worker_rss_bytes{{pid="{os.getpid()}"}}', text)
+        self.assertIn('flask_ml_admission_queued{priority="bulk"', text)
+
+    def test_errors_counted_by_route_template(self):
+        """Ошибки считаются отдельно; метка endpoint — шаблон маршрута, а не URL"""
+        label = 'flask_ml_request_errors_total{endpoint="/jobs/<job_id>",method="GET",status="503"}'
+        before = sample(self._metrics(), label) or 0
+        self.app.get('/jobs/' + '0' * 32)  # очередь заданий выключена — 503
+        self.assertEqual(sample(self._metrics(), label), before + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import sys
+import os
+import io
+import json
+import shutil
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from flask import Flask, Response, request, jsonify
+from werkzeug.serving import make_server
+from PIL import Image
+import numpy as np
+from app import app
+import app.routes as routes
+from predict_client import PredictClient
+
+
+def mean_predict(batch, batch_size=None, verbose=0):
+    """Модель-заглушка: вероятность = средняя яркость строки батча"""
+    means = batch.reshape(len(batch), -1).mean(axis=1)
+    return np.stack([means, 1 - means], axis=1).astype(np.float32)
+
+
+class Server:
+    """WSGI-приложение на свободном порту в фоновом потоке"""
+
+    def __init__(self, wsgi_app):
+        self.server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join(5)
+
+
+def image_bytes(value):
+    buffered = io.BytesIO()
+    Image.new('RGB', (64, 48), color=(value, value, value)).save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+class TestPredictClient(unittest.TestCase):
+    """Клиент против настоящего приложения и серверов-заглушек"""
+
+    def setUp(self):
+        routes.prediction_cache.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _serve(self, wsgi_app):
+        server = Server(wsgi_app)
+        self.addCleanup(server.stop)
+        return server.url
+
+    @patch('app.routes.model')
+    def test_directory_batched(self, mock_model):
+        """Каталог отправляется пакетами через /predict/batch, результаты — по всем файлам"""
+        mock_model.predict.side_effect = mean_predict
+        values = [10, 40, 70, 100, 130]
+        os.makedirs(os.path.join(self.directory, 'sub'))
+        for v in values:
+            with open(os.path.join(self.directory, 'sub', f'{v}.png'), 'wb') as f:
+                f.write(image_bytes(v))
+        with open(os.path.join(self.directory, 'notes.txt'), 'w') as f:
+            f.write('не изображение')
+
+        url = self._serve(app)
+        with PredictClient(url, parallelism=2, batch_size=2, priority='bulk') as client:
+            results = dict(client.predict_directory(self.directory))
+
+        self.assertEqual(sorted(results), sorted(os.path.join('sub', f'{v}.png') for v in values))
+        for v in values:
+            result = results[os.path.join('sub', f'{v}.png')]
+            self.assertTrue(result['success'], result)
+            self.assertAlmostEqual(result['predictions'][0], v / 255.0, places=2)
+        self.assertTrue(client.batch_supported)
+
+    def test_retry_and_fallback(self):
+        """429 повторяется через Retry-After; без /predict/batch — по одному изображению"""
+        stub = Flask('stub')
+        calls = {'upload': 0, 'priority': set()}
+
+        @stub.route('/predict/upload', methods=['POST'])
+        def upload():
+            calls['upload'] += 1
+            calls['priority'].add(request.headers.get('X-Priority'))
+            if calls['upload'] == 1:
+                response = jsonify({'success': False, 'error': 'перегружен'})
+                response.headers['Retry-After'] = '2'
+                return response, 429
+            return jsonify({'success': True, 'size': len(request.get_data())})
+
+        sleeps = []
+        url = self._serve(stub)
+        with PredictClient(url, parallelism=1, batch_size=4, sleep=sleeps.append) as client:
+            results = dict(client.predict_many([('a', b'12'), ('b', b'345')]))
+
+        self.assertFalse(client.batch_supported)
+        self.assertEqual(results, {'a': {'success': True, 'size': 2}, 'b': {'success': True, 'size': 3}})
+        self.assertEqual(sleeps, [2.0])
+        self.assertEqual(calls['upload'], 3)
+        self.assertEqual(calls['priority'], {'bulk'})
+
+    def test_retries_exhausted(self):
+        """После max_retries повторов 503 возвращается как ошибка элемента"""
+        stub = Flask('stub')
+
+        @stub.route('/predict/batch', methods=['POST'])
+        def batch():
+            return jsonify({'success': False, 'error': 'очередь заполнена'}), 503
+
+        url = self._serve(stub)
+        with PredictClient(url, max_retries=2, sleep=lambda delay: None) as client:
+            results = dict(client.predict_many([('a', b'1')]))
+
+        self.assertEqual(results['a']['status'], 503)
+        self.assertFalse(results['a']['success'])
+
+    def test_broken_stream_retries_missing(self):
+        """Обрыв потока NDJSON: полученные результаты сохраняются, повторяются только остальные"""
+        stub = Flask('stub')
+        calls = []
+
+        @stub.route('/predict/batch', methods=['POST'])
+        def batch():
+            names = [upload.filename for upload in request.files.getlist('images')]
+            calls.append(names)
+
+            def generate():
+                yield json.dumps({'name': names[0], 'success': True}) + '\n'
+                if len(calls) == 1:
+                    raise RuntimeError('обрыв соединения')
+                for name in names[1:]:
+                    yield json.dumps({'name': name, 'success': True}) + '\n'
+                yield json.dumps({'done': True, 'success': True}) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        url = self._serve(stub)
+        with PredictClient(url, batch_size=4, sleep=lambda delay: None) as client:
+            results = dict(client.predict_many([('a', b'1'), ('b', b'2')]))
+
+        self.assertEqual(results, {'a': {'success': True}, 'b': {'success': True}})
+        self.assertEqual(calls, [['a', 'b'], ['b']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.previews import PreviewStore
+import app.routes as routes
+
+
+class TestPreviewEndpoint(unittest.TestCase):
+    """API тесты превью /images/<hash>/preview и опционального original_image"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        self.directory = tempfile.mkdtemp()
+        self.previews_patcher = patch.object(routes, 'previews', PreviewStore(self.directory, max_size=128))
+        self.previews_patcher.start()
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (800, 400), color=(120, 30, 60)).save(buffered, format='PNG')
+        self.image_bytes = buffered.getvalue()
+
+    def tearDown(self):
+        self.previews_patcher.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        routes.prediction_cache.clear()
+
+    def _predict(self, **extra):
+        payload = dict(extra, image='data:image/png;base64,' + base64.b64encode(self.image_bytes).decode())
+        return json.loads(self.app.post('/predict', data=json.dumps(payload),
+                                        content_type='application/json').data)
+
+    @patch('app.routes.model')
+    def test_response_references_preview(self, mock_model):
+        """По умолчанию ответ содержит ссылку на превью, а не base64 копию"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        data = self._predict()
+
+        self.assertNotIn('original_image', data)
+        self.assertEqual(data['preview_url'], f"/images/{data['image_hash']}/preview")
+
+        response = self.app.get(data['preview_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (128, 64))
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(response.cache_control.max_age, routes.PREVIEW_MAX_AGE)
+
+    @patch('app.routes.model')
+    def test_etag_revalidation(self, mock_model):
+        """Повторный запрос с If-None-Match получает 304 без тела"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+        url = self._predict()['preview_url']
+
+        etag = self.app.get(url).headers['ETag']
+        response = self.app.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    @patch('app.routes.model')
+    def test_roi_preview(self, mock_model):
+        """Для ROI превью строится по области, ROI передается в URL"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        data = self._predict(roi=[0, 0, 300, 200])
+        response = self.app.get(data['preview_url'])
+
+        self.assertIn('?roi=0,0,300,200', data['preview_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(io.BytesIO(response.data)).size, (128, 85))
+
+    @patch('app.routes.model')
+    def test_original_image_opt_in(self, mock_model):
+        """Полноразмерная копия возвращается только по include_image, в том числе из кэша"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        first = self._predict(include_image=True)
+        cached = self._predict(include_image=True)
+        plain = self._predict()
+
+        for data in (first, cached):
+            self.assertTrue(data['original_image'].startswith('data:image/jpeg;base64,'))
+            encoded = data['original_image'].split(',')[1]
+            self.assertEqual(Image.open(io.BytesIO(base64.b64decode(encoded))).size, (800, 400))
+        self.assertTrue(cached['cached'])
+        self.assertNotIn('original_image', plain)
+        mock_model.predict.assert_called_once()
+
+    @patch('app.routes.model')
+    def test_cached_result_with_evicted_preview(self, mock_model):
+        """Ответ из кэша не ссылается на вытесненное превью"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+        data = self._predict()
+        os.remove(routes.previews.path(data['image_hash']))
+
+        cached = self._predict()
+        lookup = json.loads(self.app.post('/predict/lookup', data=json.dumps({'hash': data['image_hash']}),
+                                          content_type='application/json').data)
+
+        self.assertTrue(cached['cached'])
+        self.assertNotIn('preview_url', cached)
+        self.assertTrue(lookup['found'])
+        self.assertNotIn('preview_url', lookup)
+        self.assertEqual(mock_model.predict.call_count, 1)
+
+    def test_unknown_and_invalid(self):
+        """Неизвестный хэш -> 404, некорректный хэш или ROI -> 400"""
+        self.assertEqual(self.app.get(f"/images/{'a' * 64}/preview").status_code, 404)
+        self.assertEqual(self.app.get('/images/not-a-hash/preview').status_code, 400)
+        self.assertEqual(self.app.get(f"/images/{'a' * 64}/preview?roi=1,2").status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
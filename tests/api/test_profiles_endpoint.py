@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import io
+import json
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+import app.routes as routes
+from app.profiling import RequestProfiler, profile_signature
+
+SECRET = 'test-secret'
+
+
+class TestProfilesEndpoint(unittest.TestCase):
+    """API тесты профилирования запросов и /profiles"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        self.directory = tempfile.mkdtemp()
+        self.profiler = patch.object(routes, 'profiler', RequestProfiler(self.directory, secret=SECRET))
+        self.profiler.start()
+        routes.prediction_cache.clear()
+
+    def tearDown(self):
+        self.profiler.stop()
+        routes.prediction_cache.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _image_bytes(self, color):
+        buffered = io.BytesIO()
+        Image.new('RGB', (80, 60), color=color).save(buffered, format='PNG')
+        return buffered.getvalue()
+
+    def _upload(self, headers):
+        return self.app.post('/predict/upload', data=self._image_bytes((9, 8, 7)),
+                             content_type='image/png', headers=headers)
+
+    @patch('app.routes.model')
+    def test_signed_request_profiled(self, mock_model):
+        """Подписанный запрос профилируется вместе с подготовкой изображения"""
+        mock_model.predict.return_value = np.array([[0.1, 0.9]], dtype=np.float32)
+
+        response = self._upload({'X-Request-ID': 'slow-1', 'X-Profile': profile_signature(SECRET, 'slow-1')})
+
+        self.assertEqual(response.status_code, 200)
+        name = response.headers['X-Profile-Id']
+        self.assertTrue(name.endswith('-slow-1'))
+
+        auth = {'Authorization': f'Bearer {SECRET}'}
+        listed = json.loads(self.app.get('/profiles', headers=auth).data)
+        self.assertEqual([p['name'] for p in listed['profiles']], [name])
+
+        summary = self.app.get(f'/profiles/{name}.txt', headers=auth)
+        self.assertEqual(summary.status_code, 200)
+        # Декодирование выполнялось в потоке запроса и попало в профиль
+        self.assertIn('prepare_image', summary.get_data(as_text=True))
+
+    @patch('app.routes.model')
+    def test_unsigned_request_not_profiled(self, mock_model):
+        mock_model.predict.return_value = np.array([[0.1, 0.9]], dtype=np.float32)
+
+        response = self._upload({'X-Request-ID': 'x-1', 'X-Profile': 'forged'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_profiles_require_secret(self):
+        self.assertEqual(self.app.get('/profiles').status_code, 404)
+        self.assertEqual(self.app.get('/profiles', headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+        self.assertEqual(self.app.get('/profiles/x.prof', headers={'Authorization': f'Bearer {SECRET}'}).status_code,
+                         404)
+
+    def test_stack_profiles(self):
+        """Свернутые стеки отвечающего воркера — в формате collapsed"""
+        auth = {'Authorization': f'Bearer {SECRET}'}
+        routes.stack_sampler.sample()
+
+        listed = json.loads(self.app.get('/profiles/stacks', headers=auth).data)
+        self.assertIn(os.getpid(), [worker['pid'] for worker in listed['workers']])
+        self.assertIn('overhead', listed['stats'])
+
+        response = self.app.get(f'/profiles/stacks/{os.getpid()}', headers=auth)
+        self.assertEqual(response.status_code, 200)
+        for line in response.get_data(as_text=True).splitlines():
+            self.assertRegex(line, r'^\S+ \d+$')
+        self.assertEqual(self.app.get(f'/profiles/stacks/{os.getpid()}').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,282 @@
+import unittest
+import sys
+import os
+import io
+import json
+import gzip
+import base64
+import shutil
+import hashlib
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+import app.routes as routes
+from app.memory import MB, MemoryBudget
+
+
+class TestUploadEndpoint(unittest.TestCase):
+    """API тесты /predict/upload (сырое тело и multipart)"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+
+    def _encode(self, image, image_format):
+        buffered = io.BytesIO()
+        image.save(buffered, format=image_format)
+        return buffered.getvalue()
+
+    def _image_bytes(self, color, image_format='PNG', size=(340, 270)):
+        buffered = io.BytesIO()
+        Image.new('RGB', size, color=color).save(buffered, format=image_format)
+        return buffered.getvalue()
+
+    @patch('app.routes.model')
+    def test_raw_body(self, mock_model):
+        """Файл в теле запроса с Content-Type image/*"""
+        mock_model.predict.return_value = np.array([[0.2, 0.8]], dtype=np.float32)
+
+        response = self.app.post('/predict/upload', data=self._image_bytes((10, 20, 30)),
+                                 content_type='image/png')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        np.testing.assert_allclose(data['predictions'], [0.2, 0.8], rtol=1e-6)
+        self.assertEqual(data['processed_shape'], [1, 299, 299, 3])
+
+    @patch('app.routes.model')
+    def test_server_timing_and_request_id(self, mock_model):
+        """Server-Timing с этапами запроса, X-Request-ID клиента и запись app.timing"""
+        mock_model.predict.return_value = np.array([[0.2, 0.8]], dtype=np.float32)
+
+        with self.assertLogs('app.timing', level='INFO') as logs:
+            response = self.app.post('/predict/upload', data=self._image_bytes((11, 22, 33)),
+                                     content_type='image/png', headers={'X-Request-ID': 'ui-42'})
+            response.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Request-ID'], 'ui-42')
+        timing = response.headers['Server-Timing']
+        stages = [entry.split(';')[0].strip() for entry in timing.split(',')]
+        for stage in ('body_parse', 'decode', 'preprocess', 'inference', 'response_encode', 'total', 'request'):
+            self.assertIn(stage, stages)
+        self.assertIn('request;desc="ui-42"', timing)
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['request_id'], 'ui-42')
+        self.assertEqual(record['path'], '/predict/upload')
+        self.assertEqual(record['status'], 200)
+        self.assertIn('inference', record['stages_ms'])
+
+    def test_request_id_generated(self):
+        """Без X-Request-ID клиента ID создается; он есть и в ответах с ошибкой"""
+        response = self.app.post('/predict/upload', data=b'', content_type='image/png')
+        self.assertRegex(response.headers['X-Request-ID'], r'^[0-9a-f]{32}$')
+        self.assertIn('total;dur=', response.headers['Server-Timing'])
+
+    @patch('app.routes.model')
+    def test_tiff_octet_stream(self, mock_model):
+        """TIFF без MIME типа (application/octet-stream)"""
+        mock_model.predict.return_value = np.array([[0.6, 0.4]], dtype=np.float32)
+
+        response = self.app.post('/predict/upload', data=self._image_bytes((40, 50, 60), 'TIFF'),
+                                 content_type='application/octet-stream')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['success'])
+
+    @patch('app.routes.model')
+    def test_multipart_with_roi(self, mock_model):
+        """multipart/form-data: файл в поле image, ROI в поле roi"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        response = self.app.post('/predict/upload', data={
+            'image': (io.BytesIO(self._image_bytes((70, 80, 90))), 'scan.png'),
+            'roi': '{"x": 10, "y": 20, "width": 100, "height": 50}',
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['roi'], {'x': 10, 'y': 20, 'width': 100, 'height': 50})
+
+    @patch('app.routes.model')
+    def test_roi_query_string(self, mock_model):
+        """ROI для сырого тела передается в query string"""
+        mock_model.predict.return_value = np.array([[0.5, 0.5]], dtype=np.float32)
+
+        response = self.app.post('/predict/upload?roi=5,6,70,80', data=self._image_bytes((15, 25, 35)),
+                                 content_type='image/png')
+
+        data = json.loads(response.data)
+        self.assertEqual(data['roi'], {'x': 5, 'y': 6, 'width': 70, 'height': 80})
+
+    @patch('app.routes.model')
+    def test_same_result_as_json_endpoint(self, mock_model):
+        """Загрузка файла и base64 JSON дают один и тот же закэшированный результат"""
+        mock_model.predict.return_value = np.array([[0.1, 0.9]], dtype=np.float32)
+        image_bytes = self._image_bytes((100, 110, 120))
+
+        upload = json.loads(self.app.post('/predict/upload', data=image_bytes,
+                                          content_type='image/png').data)
+        legacy = json.loads(self.app.post('/predict', data=json.dumps({
+            'image': 'data:image/png;base64,' + base64.b64encode(image_bytes).decode()
+        }), content_type='application/json').data)
+
+        self.assertEqual(upload['image_hash'], legacy['image_hash'])
+        self.assertFalse(upload['cached'])
+        self.assertTrue(legacy['cached'])
+        mock_model.predict.assert_called_once()
+
+    @patch('app.routes.model')
+    def test_empty_and_unsupported(self, mock_model):
+        """Пустое тело -> 400, неподдерживаемый тип -> 415, некорректный ROI -> 400"""
+        empty = self.app.post('/predict/upload', data=b'', content_type='image/png')
+        missing = self.app.post('/predict/upload', data={}, content_type='multipart/form-data')
+        text = self.app.post('/predict/upload', data='hello', content_type='text/plain')
+        bad_roi = self.app.post('/predict/upload?roi=1,2,3', data=self._image_bytes((1, 2, 3)),
+                                content_type='image/png')
+
+        self.assertEqual(empty.status_code, 400)
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(text.status_code, 415)
+        self.assertEqual(bad_roi.status_code, 400)
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.model')
+    def test_spooled_uploads(self, mock_model):
+        """Тело больше UPLOAD_SPOOL_MB пишется на диск; результат тот же, файлы удаляются"""
+        mock_model.predict.return_value = np.array([[0.4, 0.6]], dtype=np.float32)
+        image_bytes = self._image_bytes((130, 140, 150), 'TIFF')
+        spool_dir = tempfile.mkdtemp()
+
+        try:
+            with patch.dict(app.config, {'UPLOAD_SPOOL_MB': 0, 'UPLOAD_SPOOL_DIR': spool_dir}):
+                raw = json.loads(self.app.post('/predict/upload?roi=0,0,200,150', data=image_bytes,
+                                               content_type='image/tiff').data)
+                routes.prediction_cache.clear()
+                multipart = json.loads(self.app.post('/predict/upload', data={
+                    'image': (io.BytesIO(image_bytes), 'scan.tif'),
+                    'roi': '0,0,200,150',
+                }, content_type='multipart/form-data').data)
+                routes.prediction_cache.clear()
+                legacy = json.loads(self.app.post('/predict', data=json.dumps({
+                    'image': 'data:image/tiff;base64,' + base64.b64encode(image_bytes).decode(),
+                    'roi': [0, 0, 200, 150],
+                }), content_type='application/json').data)
+
+            for data in (raw, multipart, legacy):
+                self.assertTrue(data['success'])
+                self.assertFalse(data['cached'])
+                self.assertEqual(data['image_hash'], hashlib.sha256(image_bytes).hexdigest())
+                self.assertEqual(data['roi'], {'x': 0, 'y': 0, 'width': 200, 'height': 150})
+            self.assertEqual(os.listdir(spool_dir), [])
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    @patch('app.routes.model')
+    def test_too_large(self, mock_model):
+        """Изображение больше MAX_UPLOAD_MB -> 413 без инференса"""
+        image_bytes = b'\x00' * (1024 * 1024 + 1)
+
+        with patch.dict(app.config, {'MAX_UPLOAD_MB': 1}):
+            raw = self.app.post('/predict/upload', data=image_bytes, content_type='image/png')
+            legacy = self.app.post('/predict', data=json.dumps({
+                'image': base64.b64encode(image_bytes * 2).decode()
+            }), content_type='application/json')
+
+        self.assertEqual(raw.status_code, 413)
+        self.assertEqual(legacy.status_code, 413)
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.model')
+    def test_memory_budget(self, mock_model):
+        """Сверх бюджета памяти: TIFF декодируется уменьшенным, PNG -> 413 до декодирования"""
+        mock_model.predict.return_value = np.array([[0.2, 0.8]], dtype=np.float32)
+        pixels = np.random.default_rng(0).integers(0, 256, size=(1200, 1600, 3), dtype=np.uint8)
+        tiff_bytes = self._encode(Image.fromarray(pixels), 'TIFF')
+        png_bytes = self._encode(Image.fromarray(pixels), 'PNG')
+
+        with patch.object(routes, 'memory_budget', MemoryBudget(4 * MB)):
+            tiff = self.app.post('/predict/upload', data=tiff_bytes, content_type='image/tiff')
+            png = self.app.post('/predict/upload', data=png_bytes, content_type='image/png')
+
+        self.assertEqual(tiff.status_code, 200)
+        data = json.loads(tiff.data)
+        self.assertEqual(data['decode_method'], 'tiff_bands')
+        self.assertEqual(data['decode_scale'], 2)
+        self.assertEqual(data['source_size'], [1600, 1200])
+        self.assertNotIn('roi', data)
+        self.assertEqual(data['preview_url'], f"/images/{data['image_hash']}/preview")
+        self.assertEqual(png.status_code, 413)
+        self.assertIn('1600x1200', json.loads(png.data)['error'])
+        mock_model.predict.assert_called_once()
+
+    @patch('app.routes.model')
+    def test_gzip_encoded_bodies(self, mock_model):
+        """Content-Encoding: gzip для сырого тела, multipart и JSON дает тот же результат"""
+        mock_model.predict.return_value = np.array([[0.25, 0.75]], dtype=np.float32)
+        image_bytes = self._image_bytes((160, 170, 180), 'TIFF')
+        expected_hash = hashlib.sha256(image_bytes).hexdigest()
+        headers = {'Content-Encoding': 'gzip'}
+
+        raw = self.app.post('/predict/upload', data=gzip.compress(image_bytes),
+                            content_type='image/tiff', headers=headers)
+        routes.prediction_cache.clear()
+
+        multipart = app.test_request_context('/predict/upload', method='POST', data={
+            'image': (io.BytesIO(image_bytes), 'scan.tif')
+        }, content_type='multipart/form-data')
+        multipart_response = self.app.post('/predict/upload', data=gzip.compress(multipart.request.get_data()),
+                                           content_type=multipart.request.content_type, headers=headers)
+        routes.prediction_cache.clear()
+
+        legacy = self.app.post('/predict', data=gzip.compress(json.dumps({
+            'image': base64.b64encode(image_bytes).decode()
+        }).encode()), content_type='application/json', headers=headers)
+
+        for response in (raw, multipart_response, legacy):
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertFalse(data['cached'])
+            self.assertEqual(data['image_hash'], expected_hash)
+
+        compression = routes.decompression.stats.stats()
+        self.assertIn('gzip', compression['supported'])
+        self.assertGreaterEqual(compression['encodings']['gzip']['requests'], 3)
+
+    @patch('app.routes.model')
+    def test_compressed_errors(self, mock_model):
+        """Битый gzip -> 400, бомба -> 413 (и для /predict/lookup в JSON), неизвестная кодировка -> 415"""
+        corrupt = self.app.post('/predict/upload', data=b'garbage', content_type='image/tiff',
+                                headers={'Content-Encoding': 'gzip'})
+        with patch.dict(app.config, {'MAX_UPLOAD_MB': 1}):
+            bomb = self.app.post('/predict/upload', data=gzip.compress(b'\x00' * (4 * 1024 * 1024)),
+                                 content_type='image/tiff', headers={'Content-Encoding': 'gzip'})
+        unsupported = self.app.post('/predict/upload', data=b'x', content_type='image/tiff',
+                                    headers={'Content-Encoding': 'br'})
+        lookup_corrupt = self.app.post('/predict/lookup', data=b'garbage', content_type='application/json',
+                                       headers={'Content-Encoding': 'gzip'})
+        lookup_bomb = self.app.post('/predict/lookup', data=gzip.compress(b' ' * (8 * 1024 * 1024)),
+                                    content_type='application/json', headers={'Content-Encoding': 'gzip'})
+
+        self.assertEqual(corrupt.status_code, 400)
+        self.assertEqual(bomb.status_code, 413)
+        self.assertEqual(unsupported.status_code, 415)
+        self.assertEqual(lookup_corrupt.status_code, 400)
+        self.assertFalse(json.loads(lookup_corrupt.data)['success'])
+        self.assertEqual(lookup_bomb.status_code, 413)
+        mock_model.predict.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
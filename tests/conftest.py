@@ -2,10 +2,21 @@
 import pytest
 import sys
 import os
+import shutil
+import tempfile
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Снимки метрик тестов — в своем каталоге (до импорта приложения): в общем
+# $TMPDIR/flask_ml_metrics они складывались бы с прошлыми запусками и сервером
+METRICS_DIR = tempfile.mkdtemp(prefix='flask_ml_metrics_test_')
+os.environ['METRICS_DIR'] = METRICS_DIR
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
 @pytest.fixture(scope='session')
 def app():
     """Фикстура для создания Flask приложения"""
@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image, ImageDraw, ImageFilter
+import numpy as np
+from app import app
+from app.quality import QualityGate, compute_metrics, describe
+from app.routes import preprocess_image
+
+
+def make_cells_image(size=(800, 600)):
+    """Синтетическое изображение: яркие волокна на темном фоне"""
+    rng = np.random.default_rng(0)
+    image = Image.new('RGB', size, (5, 5, 10))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.integers(0, size[0] - 20), rng.integers(0, size[1] - 20)
+        dx, dy = rng.integers(-60, 60, 2)
+        draw.line([(x, y), (x + dx, y + dy)], fill=(200, 220, 255), width=2)
+    return image
+
+
+class TestQualityGate(unittest.TestCase):
+    """Тесты проверки качества перед инференсом"""
+
+    def setUp(self):
+        self.gate = QualityGate(enabled=True)
+        self.cells = make_cells_image()
+
+    def _assess(self, image):
+        return self.gate.assess(preprocess_image(image)[0])
+
+    def test_good_image_passes(self):
+        """Изображение с клетками проходит проверку"""
+        report = self._assess(self.cells)
+
+        self.assertTrue(report['passed'])
+        self.assertEqual(report['reasons'], [])
+        self.assertEqual(set(report['metrics']), {'variance', 'focus', 'saturation', 'foreground'})
+
+    def test_blank_field_rejected(self):
+        """Пустое поле отсеивается"""
+        report = self._assess(Image.new('RGB', (800, 600), (10, 10, 10)))
+
+        self.assertFalse(report['passed'])
+        self.assertIn('low_variance', report['reasons'])
+        self.assertIn('no_foreground', report['reasons'])
+
+    def test_out_of_focus_rejected(self):
+        """Сильно размытый кадр отсеивается по резкости"""
+        report = self._assess(self.cells.filter(ImageFilter.GaussianBlur(25)))
+
+        self.assertFalse(report['passed'])
+        self.assertIn('out_of_focus', report['reasons'])
+
+    def test_saturated_rejected(self):
+        """Пересвеченный кадр отсеивается"""
+        report = self._assess(Image.new('RGB', (800, 600), (255, 255, 255)))
+
+        self.assertFalse(report['passed'])
+        self.assertIn('saturated', report['reasons'])
+        self.assertEqual(report['metrics']['saturation'], 1.0)
+
+    def test_metrics_on_constant_array(self):
+        """Метрики однородного массива равны нулю"""
+        metrics = compute_metrics(np.full((299, 299, 3), 0.5, dtype=np.float32))
+
+        self.assertEqual(metrics['variance'], 0.0)
+        self.assertEqual(metrics['focus'], 0.0)
+        self.assertEqual(metrics['foreground'], 0.0)
+
+    def test_stats_track_hit_rate_and_saved_time(self):
+        """Статистика считает долю отсеянных и сэкономленное время"""
+        self.gate.record({'passed': True, 'reasons': []}, inference_seconds=0.5)
+        self.gate.record({'passed': False, 'reasons': ['saturated']}, inference_seconds=0.5)
+
+        stats = self.gate.stats()
+        self.assertEqual(stats['checked'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['reasons'], {'saturated': 1})
+        self.assertEqual(stats['inference_saved_ms'], 500.0)
+
+    def test_describe(self):
+        """Причины отказа описываются по-русски"""
+        self.assertEqual(describe({'reasons': ['saturated']}), 'изображение пересвечено')
+
+
+class TestQualityGateEndpoint(unittest.TestCase):
+    """Тесты /predict с включенной проверкой качества"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+    def _post_image(self, image):
+        buffered = io.BytesIO()
+        image.save(buffered, format='PNG')
+        image_base64 = base64.b64encode(buffered.getvalue()).decode()
+        return self.app.post(
+            '/predict',
+            data=json.dumps({'image': f'data:image/png;base64,{image_base64}'}),
+            content_type='application/json'
+        )
+
+    @patch('app.routes.quality_gate', QualityGate(enabled=True))
+    @patch('app.routes.model')
+    def test_unusable_image_skips_inference(self, mock_model):
+        """Непригодное изображение возвращается без вызова модели"""
+        response = self._post_image(Image.new('RGB', (400, 300), (0, 0, 0)))
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertFalse(data['usable'])
+        self.assertIsNone(data['predictions'])
+        self.assertIn('variance', data['quality']['metrics'])
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.quality_gate', QualityGate(enabled=True))
+    @patch('app.routes.model')
+    def test_usable_image_reports_metrics(self, mock_model):
+        """Пригодное изображение проходит в модель, метрики есть в ответе"""
+        mock_model.predict.return_value = np.array([[0.9, 0.1]], dtype=np.float32)
+
+        response = self._post_image(make_cells_image())
+
+        data = json.loads(response.data)
+        self.assertTrue(data['usable'])
+        self.assertTrue(data['quality']['passed'])
+        np.testing.assert_allclose(data['predictions'], [0.9, 0.1], rtol=1e-6)
+        mock_model.predict.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
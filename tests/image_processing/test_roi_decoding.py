@@ -0,0 +1,144 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.imaging import ROIError, parse_roi, clamp_roi, open_image_region
+
+
+class TestROIDecoding(unittest.TestCase):
+    """Тесты декодирования области интереса (ROI)"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.pixels = rng.integers(0, 256, size=(1500, 2000, 3), dtype=np.uint8)
+        self.image = Image.fromarray(self.pixels)
+
+    def _encode(self, image, **kwargs):
+        buffered = io.BytesIO()
+        image.save(buffered, **kwargs)
+        return buffered.getvalue()
+
+    def test_parse_roi_formats(self):
+        """ROI принимается как словарь и как список"""
+        self.assertEqual(parse_roi({'x': 10, 'y': 20, 'width': 30, 'height': 40}), (10, 20, 40, 60))
+        self.assertEqual(parse_roi([10, 20, 30, 40]), (10, 20, 40, 60))
+        self.assertIsNone(parse_roi(None))
+
+    def test_parse_roi_invalid(self):
+        """Некорректный ROI отклоняется"""
+        for value in [{'x': 1}, [1, 2, 3], [0, 0, 0, 10], [-1, 0, 10, 10], 'abc']:
+            with self.subTest(value=value):
+                with self.assertRaises(ROIError):
+                    parse_roi(value)
+
+    def test_clamp_roi(self):
+        """ROI ограничивается границами изображения"""
+        self.assertEqual(clamp_roi((1900, 1400, 2100, 1600), (2000, 1500)), (1900, 1400, 2000, 1500))
+        with self.assertRaises(ROIError):
+            clamp_roi((2100, 0, 2200, 100), (2000, 1500))
+
+    def test_tiff_region_decodes_only_roi(self):
+        """Несжатый TIFF: декодируется только область ROI, пиксели совпадают"""
+        tiff_bytes = self._encode(self.image, format='TIFF')
+
+        region, info = open_image_region(tiff_bytes, (300, 200, 1000, 900))
+
+        self.assertEqual(info['decode_method'], 'tiff_region')
+        self.assertEqual(info['roi'], {'x': 300, 'y': 200, 'width': 700, 'height': 700})
+        self.assertEqual(info['source_size'], [2000, 1500])
+        # Буфер декодера имеет размер ROI, а не всего изображения
+        self.assertEqual(region.size, (700, 700))
+        np.testing.assert_array_equal(np.array(region), self.pixels[200:900, 300:1000])
+
+    def test_tiff_region_grayscale_edge(self):
+        """ROI у края grayscale TIFF обрезается границами изображения"""
+        gray = self.image.convert('L')
+        tiff_bytes = self._encode(gray, format='TIFF')
+
+        region, info = open_image_region(tiff_bytes, (1900, 1400, 2100, 1600))
+
+        self.assertEqual(info['roi'], {'x': 1900, 'y': 1400, 'width': 100, 'height': 100})
+        np.testing.assert_array_equal(np.array(region), np.array(gray)[1400:, 1900:])
+
+    def test_compressed_tiff_falls_back_to_crop(self):
+        """Сжатый TIFF декодируется целиком и обрезается"""
+        tiff_bytes = self._encode(self.image, format='TIFF', compression='tiff_lzw')
+
+        region, info = open_image_region(tiff_bytes, (0, 0, 150, 130))
+
+        self.assertEqual(info['decode_method'], 'full')
+        self.assertEqual(region.size, (150, 130))
+
+    def test_jpeg_reduced_scale_decode(self):
+        """JPEG: большой ROI декодируется в уменьшенном масштабе, но не меньше входа модели"""
+        jpeg_bytes = self._encode(self.image, format='JPEG')
+
+        region, info = open_image_region(jpeg_bytes, (0, 0, 1500, 1300))
+
+        self.assertEqual(info['decode_method'], 'jpeg_draft')
+        self.assertGreater(info['decode_scale'], 1)
+        self.assertGreaterEqual(min(region.size), 299)
+
+    def test_jpeg_small_roi_full_scale(self):
+        """JPEG: маленький ROI декодируется в полном масштабе"""
+        jpeg_bytes = self._encode(self.image, format='JPEG')
+
+        region, info = open_image_region(jpeg_bytes, (100, 100, 400, 400))
+
+        self.assertEqual(info['decode_scale'], 1)
+        self.assertEqual(region.size, (300, 300))
+
+
+class TestROIEndpoint(unittest.TestCase):
+    """Тесты /predict с ROI"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (1000, 800), color='red').save(buffered, format='TIFF')
+        self.image_base64 = base64.b64encode(buffered.getvalue()).decode()
+
+    def _post(self, payload):
+        return self.app.post('/predict', data=json.dumps(payload), content_type='application/json')
+
+    @patch('app.routes.model')
+    def test_predict_reports_roi(self, mock_model):
+        """Ответ содержит фактически использованный ROI"""
+        mock_model.predict.return_value = np.array([[0.6, 0.4]], dtype=np.float32)
+
+        response = self._post({
+            'image': f'data:image/tiff;base64,{self.image_base64}',
+            'roi': {'x': 900, 'y': 100, 'width': 400, 'height': 300},
+        })
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['roi'], {'x': 900, 'y': 100, 'width': 100, 'height': 300})
+        self.assertEqual(data['decode_method'], 'tiff_region')
+        self.assertEqual(data['processed_shape'], [1, 299, 299, 3])
+
+    @patch('app.routes.model')
+    def test_predict_invalid_roi(self, mock_model):
+        """Некорректный ROI -> 400"""
+        response = self._post({
+            'image': f'data:image/tiff;base64,{self.image_base64}',
+            'roi': [5000, 5000, 10, 10],
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(json.loads(response.data)['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import unittest
+import sys
+import os
+import io
+import json
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.admission import (AdmissionController, DeadlineExceeded, Overloaded, PriorityLock, ScheduleError,
+                           parse_priority, parse_timeout_ms)
+import app.routes as routes
+
+
+class FakeClock:
+    """Управляемые часы для проверки задержек без sleep"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Тесты контроля допуска"""
+
+    def test_limit_and_queue_full(self):
+        """Сверх лимита и заполненной очереди — сразу Overloaded с Retry-After"""
+        clock = FakeClock()
+        controller = AdmissionController(limit=1, max_queue=0, adaptive=False, clock=clock)
+
+        admitted = controller.acquire()
+        clock.now = 4.0
+        with self.assertRaises(Overloaded):
+            controller.acquire()
+        controller.release(admitted)
+
+        # Retry-After — через одну наблюдаемую задержку (4 с) место освободится
+        controller.acquire()
+        with self.assertRaises(Overloaded) as context:
+            controller.acquire()
+        self.assertEqual(context.exception.retry_after, 4)
+        stats = controller.stats()
+        self.assertEqual((stats['admitted'], stats['rejected'], stats['in_flight']), (2, 2, 1))
+
+    def test_queued_request_admitted_on_release(self):
+        """Запрос в очереди ждет и проходит, когда место освобождается"""
+        controller = AdmissionController(limit=1, max_queue=1, queue_timeout=5, adaptive=False)
+        admitted = controller.acquire()
+        entered = threading.Event()
+
+        def waiter():
+            with controller.admit():
+                entered.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        self.assertFalse(entered.wait(0.1))
+        self.assertEqual(controller.stats()['queued'], 1)
+
+        controller.release(admitted)
+        thread.join(5)
+        self.assertTrue(entered.is_set())
+        self.assertEqual(controller.stats()['queued'], 0)
+
+    def test_queue_timeout(self):
+        """Ожидание дольше queue_timeout — Overloaded, счетчик timeouts"""
+        controller = AdmissionController(limit=1, max_queue=4, queue_timeout=0.05, adaptive=False)
+        controller.acquire()
+
+        with self.assertRaises(Overloaded):
+            controller.acquire()
+        self.assertEqual(controller.stats()['timeouts'], 1)
+
+    def test_estimated_wait_fails_fast(self):
+        """Если ожидаемое ожидание больше queue_timeout, запрос не встает в очередь"""
+        clock = FakeClock()
+        controller = AdmissionController(limit=1, max_queue=100, queue_timeout=10, adaptive=False, clock=clock)
+        admitted = controller.acquire()
+        clock.now = 30.0
+        controller.release(admitted)
+        controller.acquire()
+
+        with self.assertRaises(Overloaded) as context:
+            controller.check()
+        self.assertEqual(context.exception.retry_after, 30)
+
+    def test_adaptive_limit(self):
+        """Лимит растет при стабильной задержке под нагрузкой и падает при ее росте"""
+        clock = FakeClock()
+        controller = AdmissionController(limit=2, max_limit=8, clock=clock)
+
+        def run(latency, concurrent):
+            tickets = [controller.acquire() for _ in range(concurrent)]
+            clock.now += latency
+            for ticket in tickets:
+                controller.release(ticket)
+
+        for _ in range(30):
+            run(0.1, int(controller.limit))
+        grown = controller.limit
+        self.assertGreater(grown, 4)
+
+        for _ in range(10):
+            run(1.0, int(controller.limit))
+        self.assertLess(controller.limit, grown / 2)
+        self.assertGreaterEqual(controller.limit, controller.min_limit)
+
+    def test_releaser_and_weight(self):
+        """Место освобождается один раз; задержка пакета делится на число изображений"""
+        clock = FakeClock()
+        controller = AdmissionController(limit=1, adaptive=False, clock=clock)
+
+        release = controller.releaser(controller.acquire(), weight=100)
+        clock.now = 20.0
+        release()
+        release()
+
+        stats = controller.stats()
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertAlmostEqual(stats['latency_short_ms'], 200.0)
+
+    def _queue_waiters(self, controller, requests):
+        """Запускает ожидающие запросы по одному (порядок прихода фиксирован);
+        возвращает список, куда они пишут свои имена при допуске"""
+        order = []
+        threads = []
+
+        def waiter(name, priority, deadline):
+            try:
+                admitted = controller.acquire(priority, deadline)
+            except (Overloaded, DeadlineExceeded) as e:
+                order.append((name, type(e).__name__))
+                return
+            order.append(name)
+            controller.release(admitted)
+
+        for name, priority, deadline in requests:
+            queued = controller.stats()['queued_by_priority']
+            thread = threading.Thread(target=waiter, args=(name, priority, deadline))
+            thread.start()
+            threads.append(thread)
+            while controller.stats()['queued_by_priority'] == queued and thread.is_alive():
+                thread.join(0.01)
+        return order, threads
+
+    def test_priority_then_deadline_order(self):
+        """Очередь обслуживается по приоритету, внутри класса — по ближайшему сроку"""
+        controller = AdmissionController(limit=1, max_queue=10, queue_timeout=5, adaptive=False)
+        admitted = controller.acquire()
+
+        order, threads = self._queue_waiters(controller, [
+            ('bulk', 'bulk', None),
+            ('normal-late', 'normal', controller.deadline(60)),
+            ('normal-soon', 'normal', controller.deadline(30)),
+            ('interactive', 'interactive', None),
+        ])
+        self.assertEqual(controller.stats()['queued_by_priority'], {'interactive': 1, 'normal': 2, 'bulk': 1})
+
+        controller.release(admitted)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['interactive', 'normal-soon', 'normal-late', 'bulk'])
+
+    def test_priority_lock_order(self):
+        """Допущенные запросы получают модель в порядке приоритета, а не прихода"""
+        lock = PriorityLock()
+        order = []
+        threads = []
+        with lock.hold('bulk'):
+            for name, priority in [('bulk', 'bulk'), ('normal', 'normal'), ('interactive', 'interactive')]:
+                thread = threading.Thread(target=self._hold, args=(lock, priority, order, name))
+                thread.start()
+                threads.append(thread)
+                while lock.waiting() < len(threads):
+                    threading.Event().wait(0.01)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ['interactive', 'normal', 'bulk'])
+
+    @staticmethod
+    def _hold(lock, priority, order, name):
+        with lock.hold(priority):
+            order.append(name)
+
+    def test_expired_deadline_dropped(self):
+        """Истекший срок — DeadlineExceeded сразу и во время ожидания в очереди"""
+        clock = FakeClock()
+        controller = AdmissionController(limit=1, adaptive=False, clock=clock)
+        with self.assertRaises(DeadlineExceeded):
+            controller.check(deadline=controller.deadline(0))
+        with self.assertRaises(DeadlineExceeded):
+            controller.acquire(deadline=controller.deadline(-1))
+
+        controller = AdmissionController(limit=1, max_queue=4, queue_timeout=5, adaptive=False)
+        controller.acquire()
+        with self.assertRaises(DeadlineExceeded):
+            controller.acquire(deadline=controller.deadline(0.05))
+        stats = controller.stats()
+        self.assertEqual((stats['expired'], stats['queued'], stats['in_flight']), (1, 0, 1))
+
+    def test_full_queue_preempts_lower_priority(self):
+        """В полной очереди интерактивный запрос вытесняет пакетный, а не получает 429"""
+        controller = AdmissionController(limit=1, max_queue=1, queue_timeout=5, adaptive=False)
+        admitted = controller.acquire()
+
+        order, threads = self._queue_waiters(controller, [('bulk', 'bulk', None)])
+        with self.assertRaises(Overloaded):
+            controller.check('bulk')
+        controller.check('interactive')
+        more, more_threads = self._queue_waiters(controller, [('interactive', 'interactive', None)])
+        threads[0].join(5)
+        self.assertEqual(order, [('bulk', 'Overloaded')])
+
+        controller.release(admitted)
+        more_threads[0].join(5)
+        self.assertEqual(more, ['interactive'])
+        self.assertEqual(controller.stats()['preempted'], 1)
+
+    def test_parse_schedule(self):
+        """Заголовки приоритета и срока: значения по умолчанию и ошибки"""
+        self.assertEqual(parse_priority(None, 'bulk'), 'bulk')
+        self.assertEqual(parse_priority(' Interactive '), 'interactive')
+        self.assertIsNone(parse_timeout_ms(None))
+        self.assertEqual(parse_timeout_ms('1500'), 1.5)
+        with self.assertRaises(ScheduleError):
+            parse_priority('urgent')
+        with self.assertRaises(ScheduleError):
+            parse_timeout_ms('soon')
+
+    def test_disabled(self):
+        """Выключенный контроллер пропускает все"""
+        controller = AdmissionController(enabled=False, limit=1, max_queue=0)
+        for _ in range(5):
+            controller.acquire()
+        controller.check()
+
+
+class TestAdmissionEndpoints(unittest.TestCase):
+    """Перегрузка на уровне endpoints"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+        buffered = io.BytesIO()
+        Image.new('RGB', (200, 150), color=(9, 99, 199)).save(buffered, format='PNG')
+        self.image_bytes = buffered.getvalue()
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+
+    @patch('app.routes.model')
+    def test_overloaded_returns_429(self, mock_model):
+        """Занятый лимит и полная очередь -> 429 с Retry-After без инференса"""
+        controller = AdmissionController(limit=1, max_queue=0, adaptive=False)
+        controller.acquire()
+
+        with patch.object(routes, 'admission', controller):
+            response = self.app.post('/predict/upload', data=self.image_bytes, content_type='image/png')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        self.assertEqual(json.loads(response.data)['retry_after'], int(response.headers['Retry-After']))
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.model')
+    def test_expired_deadline_skips_inference(self, mock_model):
+        """Истекший X-Deadline-Ms -> 504 без декодирования; неизвестный X-Priority -> 400"""
+        expired = self.app.post('/predict/upload', data=self.image_bytes, content_type='image/png',
+                                headers={'X-Deadline-Ms': '0'})
+        invalid = self.app.post('/predict/upload', data=self.image_bytes, content_type='image/png',
+                                headers={'X-Priority': 'urgent'})
+
+        self.assertEqual(expired.status_code, 504)
+        self.assertFalse(json.loads(expired.data)['success'])
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('urgent', json.loads(invalid.data)['error'])
+        mock_model.predict.assert_not_called()
+
+    @patch('app.routes.model')
+    def test_admitted_request_released(self, mock_model):
+        """Обычный запрос проходит и освобождает место"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+        controller = AdmissionController(limit=1, max_queue=0, adaptive=False)
+
+        with patch.object(routes, 'admission', controller):
+            first = self.app.post('/predict/upload', data=self.image_bytes, content_type='image/png')
+            routes.prediction_cache.clear()
+            second = self.app.post('/predict/upload', data=self.image_bytes, content_type='image/png')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        stats = controller.stats()
+        self.assertEqual((stats['admitted'], stats['in_flight']), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from flask import Flask, request, Response
+from app.asgi import WSGIBridge
+
+
+def make_app():
+    """Небольшое Flask-приложение: эхо тела и потоковый ответ"""
+    flask_app = Flask(__name__)
+
+    @flask_app.route('/echo', methods=['POST'])
+    def echo():
+        return {'size': len(request.get_data()), 'path': request.path,
+                'query': request.args.get('q'), 'priority': request.headers.get('X-Priority'),
+                'thread': threading.current_thread().name}
+
+    @flask_app.route('/stream')
+    def stream():
+        return Response((f"{i}\n" for i in range(3)), mimetype='application/x-ndjson')
+
+    return flask_app
+
+
+def call(bridge, method, path, body_chunks=(), headers=(), query=b''):
+    """Выполняет ASGI-запрос: тело приходит блоками; возвращает (status, headers, body-блоки)"""
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)] or [{'type': 'http.request', 'body': b''}]
+    sent = []
+
+    async def receive():
+        if messages:
+            await asyncio.sleep(0)
+            return messages.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query, 'http_version': '1.1',
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 5555),
+    }
+    asyncio.run(bridge(scope, receive, send))
+    start = sent[0]
+    return start['status'], dict(start['headers']), [m['body'] for m in sent[1:]]
+
+
+class TestASGIBridge(unittest.TestCase):
+    """Тесты асинхронного режима обслуживания"""
+
+    def setUp(self):
+        self.bridge = WSGIBridge(make_app(), max_body=1024 * 1024, spool_bytes=1024, threads=2)
+
+    def tearDown(self):
+        self.bridge.executor.shutdown()
+
+    def test_body_received_in_chunks(self):
+        """Тело из нескольких блоков (chunked, без Content-Length) доходит до Flask целиком,
+        обработчик выполняется в пуле"""
+        chunks = [b'a' * 1000, b'b' * 1000, b'c' * 500]
+        status, headers, body = call(self.bridge, 'POST', '/echo', chunks, query=b'q=1',
+                                     headers=[('content-type', 'application/octet-stream'),
+                                              ('x-priority', 'interactive')])
+
+        self.assertEqual(status, 200)
+        data = json.loads(b''.join(body))
+        self.assertEqual(data['size'], 2500)
+        self.assertEqual((data['path'], data['query'], data['priority']), ('/echo', '1', 'interactive'))
+        self.assertTrue(data['thread'].startswith('asgi-handler'))
+
+    def test_body_limit(self):
+        """Тело больше max_body -> 413 без вызова приложения, по Content-Length и по факту"""
+        declared = call(self.bridge, 'POST', '/echo', [b'x'], headers=[('content-length', str(2 * 1024 * 1024))])
+        actual = call(self.bridge, 'POST', '/echo', [b'x' * (512 * 1024)] * 3)
+
+        for status, headers, body in (declared, actual):
+            self.assertEqual(status, 413)
+            self.assertFalse(json.loads(b''.join(body))['success'])
+            self.assertRegex(headers[b'x-request-id'], rb'^[0-9a-f]{32}$')
+
+    def test_error_keeps_request_id(self):
+        """Ответ 413 без вызова Flask возвращает X-Request-ID клиента"""
+        status, headers, _ = call(self.bridge, 'POST', '/echo', [b'x'],
+                                  headers=[('content-length', str(2 * 1024 * 1024)), ('x-request-id', 'big-1')])
+        self.assertEqual(status, 413)
+        self.assertEqual(headers[b'x-request-id'], b'big-1')
+
+    def test_spooled_writes_off_loop(self):
+        """Блоки сверх spool_bytes пишутся на диск в пуле, а не в цикле событий"""
+        writers = []
+
+        class RecordingSpool(tempfile.SpooledTemporaryFile):
+            def write(self, data):
+                writers.append(threading.current_thread() is threading.main_thread())
+                return super().write(data)
+
+        with mock.patch('app.asgi.tempfile.SpooledTemporaryFile', RecordingSpool):
+            status, _, body = call(self.bridge, 'POST', '/echo', [b'a' * 800, b'b' * 800, b'c' * 800])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(b''.join(body))['size'], 2400)
+        # Первый блок помещается в память (1024), следующие — уже на диск
+        self.assertEqual(writers, [True, False, False])
+
+    def test_streaming_response(self):
+        """Потоковый ответ отдается по блокам, последний блок закрывает тело"""
+        status, headers, body = call(self.bridge, 'GET', '/stream')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'application/x-ndjson')
+        self.assertEqual([chunk for chunk in body if chunk], [b'0\n', b'1\n', b'2\n'])
+
+    def test_lifespan_startup(self):
+        """При старте воркера выполняется on_startup (загрузка модели)"""
+        started = []
+        bridge = WSGIBridge(make_app(), max_body=1024, spool_bytes=1024, threads=1,
+                            on_startup=lambda: started.append(True))
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(bridge({'type': 'lifespan'}, receive, send))
+        self.assertEqual(started, [True])
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
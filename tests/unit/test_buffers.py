@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+import tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from PIL import Image
+import numpy as np
+from app.buffers import BufferPool, aligned_empty, BUFFER_ALIGNMENT
+from app.routes import preprocess_image
+
+# Размер одного float32 входа модели
+INPUT_NBYTES = 299 * 299 * 3 * 4
+
+
+class TestBufferPool(unittest.TestCase):
+    """Тесты пула буферов входа модели"""
+
+    def setUp(self):
+        self.image = Image.new('RGB', (600, 400), color='red')
+
+    def test_aligned_empty(self):
+        """Буферы выровнены по 64 байтам"""
+        for _ in range(5):
+            buffer = aligned_empty((1, 299, 299, 3))
+            self.assertEqual(buffer.ctypes.data % BUFFER_ALIGNMENT, 0)
+            self.assertEqual(buffer.dtype, np.float32)
+
+    def test_acquire_release_reuses_slots(self):
+        """Освобожденный слот переиспользуется"""
+        pool = BufferPool(2)
+        first = pool.acquire()
+        pool.release(first)
+
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats()['free'], 1)
+
+    def test_overflow_allocates_temporary(self):
+        """При исчерпании пула выделяется временный буфер, который не попадает в пул"""
+        pool = BufferPool(1)
+        slot = pool.acquire()
+        extra = pool.acquire()
+
+        self.assertIsNot(extra, slot)
+        self.assertEqual(pool.stats()['overflow'], 1)
+
+        pool.release(extra)
+        pool.release(slot)
+        self.assertEqual(pool.stats()['free'], 1)
+
+    def test_preprocess_writes_into_slot(self):
+        """preprocess_image пишет прямо в буфер и совпадает с прежним результатом"""
+        pool = BufferPool(1)
+        slot = pool.acquire()
+
+        result = preprocess_image(self.image, out=slot)
+
+        self.assertIs(result, slot)
+        resized = self.image.resize((299, 299), Image.Resampling.LANCZOS)
+        expected = np.expand_dims(np.array(resized, dtype=np.float32) / 255.0, axis=0)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_preprocess_grayscale_into_slot(self):
+        """Grayscale дополняется до RGB при записи в буфер"""
+        slot = BufferPool(1).acquire()
+        result = preprocess_image(Image.new('L', (350, 250), color=128), out=slot)
+
+        self.assertEqual(result.shape, (1, 299, 299, 3))
+        np.testing.assert_array_equal(result[..., 0], result[..., 2])
+
+    def _traced(self, use_pool, pool, iterations=20):
+        """Прирост и пик памяти (tracemalloc) за серию предобработок"""
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            results = []
+            for _ in range(iterations):
+                if use_pool:
+                    slot = pool.acquire()
+                    preprocess_image(self.image, out=slot)
+                    pool.release(slot)
+                else:
+                    # Результат удерживается до инференса, как в обработчике запроса
+                    results.append(preprocess_image(self.image))
+                    results = results[-2:]
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return current - base, peak - base
+
+    def test_pool_reduces_allocations(self):
+        """С пулом буферов не выделяются новые float32 массивы"""
+        pool = BufferPool(2)
+        # Прогрев
+        self._traced(True, pool, iterations=2)
+
+        pooled_growth, pooled_peak = self._traced(True, pool)
+        fresh_growth, fresh_peak = self._traced(False, pool)
+
+        # Ни одного нового float32 буфера не удерживается и не выделяется
+        self.assertLess(pooled_growth, INPUT_NBYTES)
+        self.assertLess(pooled_peak, INPUT_NBYTES)
+        self.assertLess(pooled_peak, fresh_peak / 2)
+        self.assertGreater(fresh_growth, INPUT_NBYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
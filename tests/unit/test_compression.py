@@ -0,0 +1,104 @@
+import unittest
+import sys
+import os
+import json
+import gzip
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from app.compression import DecompressionMiddleware, DECODERS
+from app.uploads import UploadError, UploadTooLarge
+
+
+def echo_body(environ, start_response):
+    """WSGI-приложение, возвращающее прочитанное тело и оставшиеся заголовки"""
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'application/octet-stream'),
+                              ('X-Content-Length', environ.get('CONTENT_LENGTH') or ''),
+                              ('X-Content-Encoding', environ.get('HTTP_CONTENT_ENCODING', ''))])
+    return [body]
+
+
+class TestDecompression(unittest.TestCase):
+    """Тесты распаковки тел запросов с Content-Encoding"""
+
+    def setUp(self):
+        self.payload = b'II*\x00' + bytes(range(256)) * 4000
+
+    def _call(self, middleware, body, encoding):
+        environ = EnvironBuilder(method='POST', data=body, headers={'Content-Encoding': encoding}).get_environ()
+        app_iter, status, headers = run_wsgi_app(middleware, environ)
+        return status, headers, b''.join(app_iter)
+
+    def test_gzip(self):
+        """gzip распаковывается потоком, заголовки сжатия убираются, байты считаются"""
+        middleware = DecompressionMiddleware(echo_body, max_bytes=10 * 1024 * 1024)
+        compressed = gzip.compress(self.payload)
+
+        status, headers, body = self._call(middleware, compressed, 'gzip')
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, self.payload)
+        self.assertEqual(headers['X-Content-Length'], '')
+        self.assertEqual(headers['X-Content-Encoding'], '')
+        stats = middleware.stats.stats()['encodings']['gzip']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['wire_bytes'], len(compressed))
+        self.assertEqual(stats['decoded_bytes'], len(self.payload))
+        self.assertGreater(stats['ratio'], 1)
+
+    @unittest.skipUnless('zstd' in DECODERS, 'пакет zstandard не установлен')
+    def test_zstd(self):
+        """zstd распаковывается, если установлен zstandard"""
+        import zstandard
+        middleware = DecompressionMiddleware(echo_body, max_bytes=10 * 1024 * 1024)
+
+        _, _, body = self._call(middleware, zstandard.ZstdCompressor().compress(self.payload), 'zstd')
+
+        self.assertEqual(body, self.payload)
+
+    def test_bomb_limit(self):
+        """Распакованный объем сверх лимита обрывается UploadTooLarge"""
+        middleware = DecompressionMiddleware(echo_body, max_bytes=64 * 1024)
+        bomb = gzip.compress(b'\x00' * (16 * 1024 * 1024))
+        self.assertLess(len(bomb), 64 * 1024)
+
+        with self.assertRaises(UploadTooLarge):
+            self._call(middleware, bomb, 'gzip')
+        self.assertEqual(middleware.stats.stats()['encodings']['gzip']['rejected'], 1)
+
+    def test_per_path_limit(self):
+        """Предел распакованного тела задается по пути запроса"""
+        middleware = DecompressionMiddleware(echo_body, max_bytes=1024, limits={'/upload': 1024 * 1024})
+        compressed = gzip.compress(self.payload[:100 * 1024])
+
+        environ = EnvironBuilder(path='/upload', method='POST', data=compressed,
+                                 headers={'Content-Encoding': 'gzip'}).get_environ()
+        app_iter, status, _ = run_wsgi_app(middleware, environ)
+        self.assertEqual(b''.join(app_iter), self.payload[:100 * 1024])
+
+        with self.assertRaises(UploadTooLarge):
+            self._call(middleware, compressed, 'gzip')
+
+    def test_corrupt_body(self):
+        """Битые сжатые данные — UploadError"""
+        middleware = DecompressionMiddleware(echo_body, max_bytes=1024 * 1024)
+
+        with self.assertRaises(UploadError):
+            self._call(middleware, b'not gzip at all', 'gzip')
+
+    def test_identity_and_unsupported(self):
+        """Без сжатия тело не трогается; неизвестная кодировка — 415 с Accept-Encoding"""
+        middleware = DecompressionMiddleware(echo_body, max_bytes=1024 * 1024)
+
+        status, headers, body = self._call(middleware, b'plain', 'identity')
+        self.assertEqual((status, body), ('200 OK', b'plain'))
+
+        status, headers, body = self._call(middleware, b'data', 'br')
+        self.assertEqual(status, '415 Unsupported Media Type')
+        self.assertIn('gzip', headers['Accept-Encoding'])
+        self.assertFalse(json.loads(body)['success'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.jobs import JobQueue, QueueFull
+
+
+def wait_for(queue, job_id, statuses=('done', 'failed'), timeout=5.0):
+    """Ждет, пока задание перейдет в один из статусов"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Задание {job_id} не завершилось: {queue.get(job_id)}")
+
+
+def echo_handler(image_bytes, params):
+    return {'size': len(image_bytes), 'params': params}
+
+
+class TestJobQueue(unittest.TestCase):
+    """Тесты персистентной очереди заданий"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _queue(self, **kwargs):
+        kwargs.setdefault('poll_interval', 0.05)
+        queue = JobQueue(self.directory, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def test_submit_and_complete(self):
+        """Задание выполняется в фоне, результат доступен по id, входной файл удаляется"""
+        queue = self._queue()
+        job = queue.submit(b'12345', {'roi': None})
+        self.assertEqual(job['status'], 'queued')
+        self.assertEqual(job['position'], 0)
+
+        queue.ensure_started(echo_handler)
+
+        done = wait_for(queue, job['job_id'])
+        self.assertEqual(done['status'], 'done')
+        self.assertEqual(done['result'], {'size': 5, 'params': {'roi': None}})
+        self.assertEqual(done['attempts'], 1)
+        self.assertFalse(os.path.exists(queue.input_path(job['job_id'])))
+
+    def test_handler_error(self):
+        """Исключение обработчика — статус failed с текстом ошибки"""
+        queue = self._queue()
+
+        def failing(image_bytes, params):
+            raise ValueError("cannot identify image file")
+
+        queue.ensure_started(failing)
+        job = wait_for(queue, queue.submit(b'x')['job_id'])
+
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('cannot identify', job['error'])
+
+    def test_complete_error_keeps_worker(self):
+        """Ошибка SQLite при записи результата не останавливает поток-исполнитель"""
+        queue = self._queue(workers=1)
+        complete = queue._complete
+        calls = []
+
+        def locked_once(job_id, **kwargs):
+            calls.append(job_id)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError('database is locked')
+            return complete(job_id, **kwargs)
+
+        queue._complete = locked_once
+        first = queue.submit(b'a')['job_id']
+        queue.ensure_started(echo_handler)
+        self._wait_calls(calls, 1)
+        second = queue.submit(b'bb')['job_id']
+
+        self.assertEqual(wait_for(queue, second)['result']['size'], 2)
+        # Результат первого не записан: задание ждет истечения аренды
+        self.assertEqual(queue.get(first)['status'], 'running')
+
+    def _wait_calls(self, calls, count, timeout=5.0):
+        deadline = time.time() + timeout
+        while len(calls) < count and time.time() < deadline:
+            time.sleep(0.02)
+
+    def test_survives_restart(self):
+        """Задания, поставленные до перезапуска, выполняет новый экземпляр очереди"""
+        first = self._queue()
+        job_ids = [first.submit(b'a' * i)['job_id'] for i in range(1, 4)]
+        self.assertEqual(first.get(job_ids[2])['position'], 2)
+
+        second = self._queue()
+        second.ensure_started(echo_handler)
+
+        for i, job_id in enumerate(job_ids, start=1):
+            self.assertEqual(wait_for(second, job_id)['result']['size'], i)
+
+    def test_expired_lease_requeued(self):
+        """Задание упавшего воркера возвращается в очередь после истечения аренды"""
+        crashed = self._queue(lease=0.2)
+        crashed.worker_id = 'dead-worker'
+        job_id = crashed.submit(b'abc')['job_id']
+        self.assertEqual(crashed._claim()[0], job_id)
+        self.assertEqual(crashed.get(job_id)['status'], 'running')
+
+        time.sleep(0.3)
+        survivor = self._queue(lease=0.2)
+        survivor.ensure_started(echo_handler)
+
+        job = wait_for(survivor, job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['attempts'], 2)
+
+    def test_lease_extended_for_long_jobs(self):
+        """Аренда продлевается, пока задание выполняется дольше нее"""
+        queue = self._queue(lease=0.2)
+        release = threading.Event()
+
+        def slow(image_bytes, params):
+            release.wait(5)
+            return {'ok': True}
+
+        queue.ensure_started(slow)
+        job_id = queue.submit(b'abc')['job_id']
+        wait_for(queue, job_id, statuses=('running',))
+        time.sleep(0.6)
+
+        # Чужой воркер не должен перехватить задание
+        other = self._queue(lease=0.2)
+        other.worker_id = 'other'
+        self.assertIsNone(other._claim())
+
+        release.set()
+        job = wait_for(queue, job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['attempts'], 1)
+
+    def test_max_attempts(self):
+        """Задание, уронившее воркер max_attempts раз, помечается failed"""
+        queue = self._queue(lease=0.05, max_attempts=2)
+        queue.worker_id = 'dead-worker'
+        job_id = queue.submit(b'abc')['job_id']
+        for _ in range(2):
+            self.assertIsNotNone(queue._claim())
+            time.sleep(0.1)
+
+        self.assertIsNone(queue._claim())
+        job = queue.get(job_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('Воркер', job['error'])
+        self.assertFalse(os.path.exists(queue.input_path(job_id)))
+
+    def test_stale_worker_does_not_complete(self):
+        """Воркер, потерявший аренду, не перезаписывает задание и не удаляет его вход"""
+        stale = self._queue(lease=0.05)
+        stale.worker_id = 'stale-worker'
+        job_id = stale.submit(b'abc')['job_id']
+        stale._claim()
+        time.sleep(0.1)
+
+        current = self._queue(lease=5)
+        current.worker_id = 'current-worker'
+        self.assertEqual(current._claim()[0], job_id)
+
+        stale._complete(job_id, error='поздний результат')
+        self.assertEqual(stale.get(job_id)['status'], 'running')
+        self.assertTrue(os.path.exists(stale.input_path(job_id)))
+        self.assertEqual(stale.stats()['failed_here'], 0)
+
+        current._complete(job_id, result={'ok': True})
+        self.assertEqual(current.get(job_id)['result'], {'ok': True})
+        self.assertFalse(os.path.exists(current.input_path(job_id)))
+
+    def test_queue_full(self):
+        """Сверх max_pending незавершенных заданий — QueueFull, файл не остается"""
+        queue = self._queue(max_pending=2)
+        queue.submit(b'1')
+        queue.submit(b'2')
+
+        with self.assertRaises(QueueFull):
+            queue.submit(b'3')
+        self.assertEqual(len(os.listdir(queue.inputs_dir)), 2)
+        self.assertEqual(queue.stats()['queued'], 2)
+
+    def test_retention(self):
+        """Завершенные задания старше retention удаляются"""
+        queue = self._queue(lease=0.15, retention=0.1)
+        queue.ensure_started(echo_handler)
+        job_id = queue.submit(b'abc')['job_id']
+        wait_for(queue, job_id)
+
+        deadline = time.time() + 3
+        while queue.get(job_id) is not None and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertIsNone(queue.get(job_id))
+
+    def test_retention_removes_inputs_and_stale_tmp(self):
+        """Вместе с заданием удаляется его вход; недописанные *.tmp старше stale_tmp — тоже"""
+        queue = self._queue(lease=0.15, retention=0.1, stale_tmp=0.1)
+        queue.worker_id = 'dead-worker'
+        job_id = queue.submit(b'abc')['job_id']
+        queue._claim()
+        queue._complete(job_id, error='ошибка')
+        # Вход, оставшийся от задания (например, воркер упал между записью статуса и удалением)
+        with open(queue.input_path(job_id), 'wb') as f:
+            f.write(b'abc')
+        tmp_path = os.path.join(queue.inputs_dir, 'crashed.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(b'partial')
+
+        queue.ensure_started(echo_handler)
+        deadline = time.time() + 3
+        while (os.path.exists(tmp_path) or os.path.exists(queue.input_path(job_id))) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertIsNone(queue.get(job_id))
+        self.assertEqual(os.listdir(queue.inputs_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.logs import AsyncLogging, SampledFilter
+
+
+class RecordingHandler(logging.Handler):
+    """Запоминает сообщения и поток, в котором они записаны; delay — имитация медленного вывода"""
+
+    def __init__(self, delay=0.0, gate=None):
+        super().__init__()
+        self.delay = delay
+        self.gate = gate
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.delay:
+            time.sleep(self.delay)
+        self.messages.append(self.format(record))
+        self.threads.add(threading.current_thread().name)
+
+
+def emit_many(logger, count):
+    """Время вызывающего потока на count записей с форматированием аргументов"""
+    shape = (1, 299, 299, 3)
+    predictions = [0.1234567, 0.8765433]
+    started = time.perf_counter()
+    for i in range(count):
+        logger.info("✅ Предобработка %d: %s, результаты %s", i, shape, predictions)
+    return time.perf_counter() - started
+
+
+def log_in_child():
+    """Запись после fork: поток записи создан заново в дочернем процессе"""
+    logging.getLogger('test.logs.fork').info('from child')
+    # Процесс multiprocessing завершается без atexit — даем потоку записи дописать
+    time.sleep(0.2)
+
+
+class TestAsyncLogging(unittest.TestCase):
+    """Тесты асинхронного и выборочного логирования"""
+
+    def _logger(self, name, *handlers):
+        logger = logging.getLogger(name)
+        logger.handlers = list(handlers)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(setattr, logger, 'handlers', [])
+        return logger
+
+    def test_records_written_by_background_thread(self):
+        target = RecordingHandler()
+        logger = self._logger('test.logs.async', target)
+        async_logging = AsyncLogging(queue_size=100)
+        async_logging.install(logger)
+        try:
+            logger.info('размер %s', (299, 299))
+        finally:
+            async_logging.stop()
+
+        self.assertEqual(target.messages, ['размер (299, 299)'])
+        self.assertNotIn(threading.current_thread().name, target.threads)
+        # После stop обработчики возвращены логгеру
+        self.assertEqual(logger.handlers, [target])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        gate = threading.Event()
+        target = RecordingHandler(gate=gate)
+        logger = self._logger('test.logs.full', target)
+        async_logging = AsyncLogging(queue_size=2)
+        async_logging.install(logger)
+        try:
+            started = time.perf_counter()
+            for i in range(10):
+                logger.info('запись %d', i)
+            self.assertLess(time.perf_counter() - started, 1.0)
+            self.assertGreater(async_logging.stats()['dropped'], 0)
+        finally:
+            gate.set()
+            async_logging.stop()
+
+    def test_restarted_after_fork(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        path = os.path.join(directory, 'child.log')
+        logger = self._logger('test.logs.fork', logging.FileHandler(path))
+        async_logging = AsyncLogging()
+        async_logging.install(logger)
+        try:
+            child = multiprocessing.get_context('fork').Process(target=log_in_child)
+            child.start()
+            child.join(10)
+        finally:
+            async_logging.stop()
+        with open(path) as f:
+            self.assertIn('from child', f.read())
+
+    def test_sampled_filter(self):
+        """Решение для запроса важнее случайного; без решения — доля rate"""
+        values = iter([0.05, 0.5])
+        sampled = SampledFilter(0.1, rng=lambda: next(values))
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'm', None, None)
+        self.assertTrue(sampled.filter(record))
+        self.assertFalse(sampled.filter(record))
+
+        decision = {'value': True}
+        per_request = SampledFilter(0.0, decide=lambda: decision['value'])
+        self.assertTrue(per_request.filter(record))
+        decision['value'] = False
+        self.assertFalse(per_request.filter(record))
+        self.assertEqual((per_request.passed, per_request.suppressed), (1, 1))
+
+    def test_benchmark_request_thread_cost(self):
+        """Бенчмарк: стоимость логирования для потока запроса при медленном выводе"""
+        count = 2000
+        sync_target = RecordingHandler(delay=0.0001)
+        sync_cost = emit_many(self._logger('test.logs.bench.sync', sync_target), count)
+
+        async_target = RecordingHandler(delay=0.0001)
+        logger = self._logger('test.logs.bench.async', async_target)
+        async_logging = AsyncLogging(queue_size=count)
+        async_logging.install(logger)
+        try:
+            async_cost = emit_many(logger, count)
+        finally:
+            async_logging.stop()
+
+        sampled_logger = self._logger('test.logs.bench.sampled', RecordingHandler(delay=0.0001))
+        sampled_logger.addFilter(SampledFilter(0.01))
+        sampled_cost = emit_many(sampled_logger, count)
+
+        print(f"\nЛогирование, мкс на запись в потоке запроса: синхронно {sync_cost / count * 1e6:.1f}, "
+              f"очередь {async_cost / count * 1e6:.1f}, выборка 1% {sampled_cost / count * 1e6:.1f}")
+        self.assertEqual(len(async_target.messages), count)
+        self.assertLess(async_cost, sync_cost / 2)
+        self.assertLess(sampled_cost, sync_cost / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
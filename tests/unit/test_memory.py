@@ -0,0 +1,181 @@
+import unittest
+import sys
+import os
+import io
+import tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from PIL import Image
+import numpy as np
+from app.imaging import open_reduced
+from app.memory import (MB, MemoryBudget, MemoryBudgetExceeded, StageMemory, estimate_decode_bytes,
+                        pixel_bytes)
+from app.uploads import UploadTooLarge
+
+
+def encode(image, **kwargs):
+    buffered = io.BytesIO()
+    image.save(buffered, **kwargs)
+    return buffered.getvalue()
+
+
+class TestDecodeEstimate(unittest.TestCase):
+    """Тесты оценки памяти декодирования по заголовку"""
+
+    def test_pixel_bytes(self):
+        """Байт на пиксель в памяти Pillow"""
+        self.assertEqual(pixel_bytes('L'), 1)
+        self.assertEqual(pixel_bytes('I;16'), 2)
+        self.assertEqual(pixel_bytes('RGB'), 4)
+        self.assertEqual(pixel_bytes('CMYK'), 4)
+
+    def test_estimate_includes_rgb_conversion(self):
+        """Не-RGB изображение конвертируется в RGB: учитываются обе копии"""
+        self.assertEqual(estimate_decode_bytes((1000, 1000), 'RGB', 'PNG'), 4_000_000)
+        self.assertEqual(estimate_decode_bytes((1000, 1000), 'L', 'PNG'), 5_000_000)
+        self.assertEqual(estimate_decode_bytes((1000, 1000), 'L', 'TIFF'), 5_000_000)
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """Тесты решения по бюджету памяти до декодирования"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.pixels = rng.integers(0, 256, size=(1200, 1600, 3), dtype=np.uint8)
+        self.image = Image.fromarray(self.pixels)
+
+    def test_disabled_budget(self):
+        """Бюджет 0 — изображение даже не открывается"""
+        budget = MemoryBudget(0)
+        self.assertIsNone(budget.plan(b'not an image'))
+        self.assertFalse(budget.stats()['enabled'])
+
+    def test_within_budget(self):
+        """Изображение в бюджете декодируется полностью"""
+        budget = MemoryBudget(64 * MB)
+        self.assertIsNone(budget.plan(encode(self.image, format='PNG')))
+        stats = budget.stats()
+        self.assertEqual(stats['checked'], 1)
+        self.assertEqual(stats['downgraded'], 0)
+
+    def test_tiff_downgraded_to_bands(self):
+        """Несжатый TIFF сверх бюджета: наименьшее подходящее уменьшение и полосы"""
+        budget = MemoryBudget(4 * MB)
+
+        factor, band_rows = budget.plan(encode(self.image, format='TIFF'))
+
+        # 1600x1200x4 = 7.3 MB; в 1/2 — 1.8 MB + полоса 1 MB
+        self.assertEqual(factor, 2)
+        self.assertEqual(band_rows, MB // (1600 * 4))
+        self.assertEqual(budget.stats()['downgraded'], 1)
+
+    def test_jpeg_downgraded_to_draft(self):
+        """JPEG сверх бюджета уменьшается через draft"""
+        budget = MemoryBudget(MB)
+        factor, _ = budget.plan(encode(self.image, format='JPEG'))
+        self.assertEqual(factor, 4)
+
+    def test_png_rejected(self):
+        """PNG не декодируется с уменьшением: отказ до декодирования (413)"""
+        budget = MemoryBudget(4 * MB)
+
+        with self.assertRaises(MemoryBudgetExceeded) as context:
+            budget.plan(encode(self.image, format='PNG'))
+
+        self.assertIsInstance(context.exception, UploadTooLarge)
+        self.assertIn('1600x1200', str(context.exception))
+        self.assertEqual(budget.stats()['rejected'], 1)
+
+    def test_reject_action(self):
+        """action='reject' — без уменьшенного декодирования"""
+        budget = MemoryBudget(4 * MB, action='reject')
+        with self.assertRaises(MemoryBudgetExceeded):
+            budget.plan(encode(self.image, format='TIFF'))
+
+    def test_model_input_size_limit(self):
+        """Изображение не уменьшается меньше входа модели"""
+        budget = MemoryBudget(MB // 2)
+        with self.assertRaises(MemoryBudgetExceeded):
+            budget.plan(encode(self.image, format='TIFF'))
+
+    def test_roi_estimated_by_region(self):
+        """С ROI оценивается только область"""
+        budget = MemoryBudget(4 * MB)
+        self.assertIsNone(budget.plan(encode(self.image, format='PNG'), (0, 0, 500, 500)))
+
+    def test_unknown_action(self):
+        with self.assertRaises(ValueError):
+            MemoryBudget(MB, action='ignore')
+
+
+class TestReducedDecode(unittest.TestCase):
+    """Тесты уменьшенного декодирования целиком"""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.pixels = rng.integers(0, 256, size=(1200, 1600, 3), dtype=np.uint8)
+        self.image = Image.fromarray(self.pixels)
+
+    def test_tiff_bands_match_full_reduce(self):
+        """Полосы TIFF дают то же, что уменьшение полностью декодированного изображения"""
+        tiff_bytes = encode(self.image, format='TIFF')
+
+        reduced, info = open_reduced(tiff_bytes, 2, 100)
+
+        self.assertEqual(info, {'source_size': [1600, 1200], 'decode_scale': 2, 'decode_method': 'tiff_bands'})
+        self.assertEqual(reduced.size, (800, 600))
+        np.testing.assert_array_equal(np.array(reduced), np.array(self.image.reduce(2)))
+
+    def test_tiff_bands_grayscale(self):
+        """Одноканальный TIFF уменьшается в своем режиме"""
+        gray = self.image.convert('L')
+        reduced, _ = open_reduced(encode(gray, format='TIFF'), 4, 64)
+        self.assertEqual(reduced.mode, 'L')
+        np.testing.assert_array_equal(np.array(reduced), np.array(gray.reduce(4)))
+
+    def test_jpeg_draft(self):
+        """JPEG декодируется в уменьшенном масштабе"""
+        reduced, info = open_reduced(encode(self.image, format='JPEG'), 4, 0)
+        self.assertEqual(info['decode_method'], 'jpeg_draft')
+        self.assertEqual(info['decode_scale'], 4)
+        self.assertEqual(reduced.size, (400, 300))
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            open_reduced(encode(self.image, format='PNG'), 2, 100)
+
+
+class TestStageMemory(unittest.TestCase):
+    """Тесты замеров памяти этапов"""
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_disabled(self):
+        """Выключенный замер ничего не записывает"""
+        report = {}
+        with StageMemory(False).measure('decode', report):
+            pass
+        self.assertEqual(report, {})
+
+    def test_traced_peak(self):
+        """Пик tracemalloc этапа учитывает освобожденную внутри этапа память"""
+        stage_memory = StageMemory(True)
+        report = {}
+
+        with stage_memory.measure('preprocess', report):
+            data = bytearray(8 * MB)
+            del data
+
+        usage = report['preprocess']
+        self.assertGreaterEqual(usage['traced_peak_bytes'], 8 * MB)
+        self.assertIn('rss_delta_bytes', usage)
+
+    def test_no_report(self):
+        """report=None (результат некуда вернуть) — без замера"""
+        with StageMemory(True).measure('decode', None):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
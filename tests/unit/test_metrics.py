@@ -0,0 +1,138 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.metrics import EXITED_FILE, MetricsRegistry, clear_snapshots, rss_bytes
+
+
+def make_registry(directory=None):
+    registry = MetricsRegistry(directory, flush_interval=3600)
+    registry.counter('requests_total', 'Запросы')
+    registry.histogram('stage_seconds', 'Этапы', buckets=(0.1, 1.0))
+    registry.gauge('queue', 'Очередь')
+    return registry
+
+
+def record_in_child(directory):
+    """Наблюдения в отдельном процессе (как в другом воркере gunicorn)"""
+    registry = make_registry(directory)
+    registry.inc('requests_total', {'endpoint': '/predict'}, 2)
+    registry.observe('stage_seconds', 0.5, {'stage': 'decode'})
+    registry.flush()
+
+
+def sample(text, line_start):
+    """Значение первой строки экспозиции, начинающейся с line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """Тесты метрик Prometheus, общих для воркеров"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Корзины накопительные, +Inf равна числу наблюдений"""
+        registry = make_registry()
+        for value in (0.05, 0.5, 5.0):
+            registry.observe('stage_seconds', value, {'stage': 'decode'})
+
+        text = registry.render()
+        self.assertIn('# TYPE flask_ml_stage_seconds histogram', text)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_bucket{stage="decode",le="0.1"}'), 1)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_bucket{stage="decode",le="1"}'), 2)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_bucket{stage="decode",le="+Inf"}'), 3)
+        self.assertAlmostEqual(sample(text, 'flask_ml_stage_seconds_sum{stage="decode"}'), 5.55)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_count{stage="decode"}'), 3)
+
+    def test_aggregates_across_processes(self):
+        """Счетчики и гистограммы другого процесса суммируются, в том числе после его завершения"""
+        registry = make_registry(self.directory)
+        registry.inc('requests_total', {'endpoint': '/predict'})
+        registry.observe('stage_seconds', 0.05, {'stage': 'decode'})
+
+        child = multiprocessing.get_context('fork').Process(target=record_in_child, args=(self.directory,))
+        child.start()
+        child.join(10)
+        self.assertEqual(child.exitcode, 0)
+
+        text = registry.render()
+        self.assertEqual(sample(text, 'flask_ml_requests_total{endpoint="/predict"}'), 3)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_count{stage="decode"}'), 2)
+        self.assertEqual(sample(text, 'flask_ml_stage_seconds_bucket{stage="decode",le="0.1"}'), 1)
+
+    def test_exited_processes_folded(self):
+        """Снимки завершившихся процессов складываются в один файл и не учитываются дважды"""
+        registry = make_registry(self.directory)
+        registry.inc('requests_total', {'endpoint': '/predict'})
+        for _ in range(3):
+            child = multiprocessing.get_context('fork').Process(target=record_in_child, args=(self.directory,))
+            child.start()
+            child.join(10)
+
+        first = registry.render()
+        second = registry.render()
+
+        self.assertEqual(sample(first, 'flask_ml_requests_total{endpoint="/predict"}'), 7)
+        self.assertEqual(sample(second, 'flask_ml_requests_total{endpoint="/predict"}'), 7)
+        self.assertEqual(sample(second, 'flask_ml_stage_seconds_count{stage="decode"}'), 3)
+        snapshots = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        self.assertEqual(len(snapshots), 2)
+        self.assertIn(EXITED_FILE, snapshots)
+
+        clear_snapshots(self.directory)
+        self.assertEqual(sample(registry.render(), 'flask_ml_requests_total{endpoint="/predict"}'), 1)
+
+    def test_forked_process_starts_from_zero(self):
+        """После fork процесс не наследует значения родителя"""
+        registry = make_registry(self.directory)
+        registry.inc('requests_total', {'endpoint': '/predict'}, 5)
+
+        child = multiprocessing.get_context('fork').Process(target=registry.flush)
+        child.start()
+        child.join(10)
+
+        text = registry.render()
+        self.assertEqual(sample(text, 'flask_ml_requests_total{endpoint="/predict"}'), 5)
+
+    def test_gauges_per_live_process(self):
+        """Gauges — по процессу с меткой pid; завершившиеся процессы не показываются"""
+        registry = make_registry(self.directory)
+        registry.add_collector(lambda: {'queue': 4})
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        stale = make_registry(self.directory)
+        stale.add_collector(lambda: {'queue': 9})
+        snapshot = stale.snapshot()
+        snapshot['pid'] = dead.pid
+        with open(os.path.join(self.directory, 'stale.json'), 'w') as f:
+            json.dump(snapshot, f)
+
+        text = registry.render()
+        self.assertEqual(sample(text, f'flask_ml_queue{{pid="{os.getpid()}"}}'), 4)
+        self.assertNotIn(f'pid="{dead.pid}"', text)
+
+    def test_label_escaping(self):
+        registry = make_registry()
+        registry.inc('requests_total', {'endpoint': 'a"b\\c'})
+        self.assertIn('flask_ml_requests_total{endpoint="a\\"b\\\\c"} 1', registry.render())
+
+    def test_rss_bytes(self):
+        self.assertGreater(rss_bytes(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
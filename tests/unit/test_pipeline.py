@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+import json
+import time
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app import app
+from app.pipeline import PreprocessPipeline
+
+
+def square(value):
+    """Функция для пула: возвращает (result, timings)"""
+    return value * value, {'square': 0.001}
+
+
+def slow_square(value):
+    time.sleep(0.2)
+    return value * value, {'square': 0.2}
+
+
+class TestPreprocessPipeline(unittest.TestCase):
+    """Тесты пула декодирования и предобработки"""
+
+    def test_modes(self):
+        """Все режимы пула возвращают результат и собирают время этапов"""
+        for mode in ['inline', 'thread', 'process']:
+            with self.subTest(mode=mode):
+                pipeline = PreprocessPipeline(mode, workers=2)
+                try:
+                    self.assertEqual(pipeline.run(square, 7), 49)
+                    stats = pipeline.stats()
+                    self.assertEqual(stats['executor'], mode)
+                    self.assertEqual(stats['completed'], 1)
+                    self.assertEqual(stats['in_flight'], 0)
+                    self.assertEqual(stats['stages']['square']['count'], 1)
+                    self.assertIn('queue_wait', stats['stages'])
+                finally:
+                    pipeline.shutdown()
+
+    def test_unknown_mode(self):
+        """Неизвестный режим отклоняется"""
+        with self.assertRaises(ValueError):
+            PreprocessPipeline('gpu')
+
+    def test_parallel_execution_and_queue_depth(self):
+        """Задачи выполняются параллельно, лишние ждут в очереди"""
+        pipeline = PreprocessPipeline('thread', workers=2)
+        depths = []
+        threads = [threading.Thread(target=pipeline.run, args=(slow_square, i)) for i in range(3)]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        depths.append(pipeline.stats()['queue_depth'])
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        pipeline.shutdown()
+
+        # 3 задачи по 0.2с на 2 воркерах: ~0.4с, а не 0.6с
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(depths, [1])
+        self.assertEqual(pipeline.stats()['completed'], 3)
+
+    def test_errors_propagate(self):
+        """Исключения из воркера пробрасываются вызывающему"""
+        pipeline = PreprocessPipeline('thread', workers=1)
+
+        def failing():
+            raise ValueError("bad image")
+
+        with self.assertRaises(ValueError):
+            pipeline.run(failing)
+        self.assertEqual(pipeline.stats()['in_flight'], 0)
+        pipeline.shutdown()
+
+    def test_submit_gather(self):
+        """submit/gather: задачи идут параллельно, ошибка одной не мешает остальным"""
+        def maybe_fail(value):
+            if value == 2:
+                raise ValueError("bad image")
+            return slow_square(value)
+
+        for mode in ['inline', 'thread']:
+            with self.subTest(mode=mode):
+                pipeline = PreprocessPipeline(mode, workers=4)
+                start = time.perf_counter()
+                tasks = pipeline.submit(maybe_fail, [(i,) for i in range(4)])
+                outcomes = pipeline.gather(tasks)
+                elapsed = time.perf_counter() - start
+                pipeline.shutdown()
+
+                self.assertEqual([result for result, _ in outcomes], [0, 1, None, 9])
+                self.assertIsInstance(outcomes[2][1], ValueError)
+                self.assertEqual(pipeline.stats()['in_flight'], 0)
+                self.assertEqual(pipeline.stats()['completed'], 4)
+                if mode == 'thread':
+                    self.assertLess(elapsed, 0.4)
+
+    def test_health_exposes_pipeline_stats(self):
+        """/health показывает статистику пула"""
+        client = app.test_client()
+        data = json.loads(client.get('/health').data)
+
+        self.assertIn('pipeline', data)
+        self.assertIn('queue_depth', data['pipeline'])
+        self.assertIn('stages', data['pipeline'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.cache import PredictionCache, cache_key, image_hash
+import app.routes as routes
+
+
+class FakeClock:
+    """Управляемые часы для проверки TTL"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPredictionCache(unittest.TestCase):
+    """Тесты LRU-кэша результатов"""
+
+    def test_hit_and_miss(self):
+        """Попадания и промахи считаются"""
+        cache = PredictionCache(max_entries=4)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', {'predictions': [1]}, 10)
+
+        self.assertEqual(cache.get('a'), {'predictions': [1]})
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_lru_eviction_by_entries(self):
+        """При превышении числа записей вытесняется давно не использованная"""
+        cache = PredictionCache(max_entries=2)
+        cache.put('a', 1, 1)
+        cache.put('b', 2, 1)
+        cache.get('a')
+        cache.put('c', 3, 1)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_eviction_by_size(self):
+        """Лимит объема соблюдается, слишком большие записи не кэшируются"""
+        cache = PredictionCache(max_entries=10, max_bytes=100)
+        cache.put('a', 1, 60)
+        cache.put('b', 2, 60)
+        cache.put('huge', 3, 1000)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.stats()['bytes'], 60)
+
+    def test_ttl_expiration(self):
+        """Запись с истекшим TTL не возвращается"""
+        clock = FakeClock()
+        cache = PredictionCache(ttl=10, clock=clock)
+        cache.put('a', 1, 1)
+
+        clock.now = 9
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 11
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_disabled(self):
+        """Кэш с нулевым размером ничего не хранит"""
+        cache = PredictionCache(max_entries=0)
+        cache.put('a', 1, 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertFalse(cache.stats()['enabled'])
+
+    def test_cache_key(self):
+        """Ключ зависит от версии модели и ROI"""
+        content_hash = image_hash(b'image')
+        self.assertNotEqual(cache_key(content_hash, 'v1'), cache_key(content_hash, 'v2'))
+        self.assertNotEqual(cache_key(content_hash, 'v1'), cache_key(content_hash, 'v1', (0, 0, 10, 10)))
+
+
+class TestPredictionCacheEndpoint(unittest.TestCase):
+    """Тесты кэширования в /predict"""
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (320, 240), color=(10, 200, 30)).save(buffered, format='PNG')
+        self.image_bytes = buffered.getvalue()
+        self.payload = json.dumps({
+            'image': 'data:image/png;base64,' + base64.b64encode(self.image_bytes).decode()
+        })
+
+    def _post(self):
+        return self.app.post('/predict', data=self.payload, content_type='application/json')
+
+    @patch('app.routes.model')
+    def test_repeat_request_served_from_cache(self, mock_model):
+        """Повторный запрос возвращается из кэша без декодирования и инференса"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        first = json.loads(self._post().data)
+        with patch('app.routes.Image.open') as mock_open:
+            second = json.loads(self._post().data)
+            mock_open.assert_not_called()
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['predictions'], second['predictions'])
+        self.assertEqual(second['image_hash'], image_hash(self.image_bytes))
+        mock_model.predict.assert_called_once()
+
+    @patch('app.routes.model')
+    def test_model_version_change_misses(self, mock_model):
+        """Смена версии модели делает старые записи недоступными"""
+        mock_model.predict.return_value = np.array([[0.3, 0.7]], dtype=np.float32)
+
+        self._post()
+        with patch('app.routes.model_version', 'next-version'):
+            data = json.loads(self._post().data)
+
+        self.assertFalse(data['cached'])
+        self.assertEqual(mock_model.predict.call_count, 2)
+
+    def test_health_exposes_cache_stats(self):
+        """/health показывает статистику кэша"""
+        data = json.loads(self.app.get('/health').data)
+        self.assertIn('hit_rate', data['prediction_cache'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+from app.previews import PreviewStore, preview_id, preview_url
+
+
+class TestPreviewStore(unittest.TestCase):
+    """Тесты каталога превью"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_created_once(self):
+        """Превью создается один раз и не больше max_size по длинной стороне"""
+        store = PreviewStore(self.directory, max_size=100)
+        pid = 'a' * 64
+
+        self.assertTrue(store.save(pid, Image.new('RGB', (300, 600), color=(1, 2, 3))))
+        self.assertFalse(store.save(pid, Image.new('RGB', (300, 600), color=(9, 9, 9))))
+
+        self.assertEqual(Image.open(store.path(pid)).size, (50, 100))
+        self.assertEqual(store.stats()['created'], 1)
+
+    def test_small_image_not_upscaled(self):
+        """Маленькое изображение сохраняется в исходном размере"""
+        store = PreviewStore(self.directory, max_size=100)
+        store.save('b' * 64, Image.new('L', (40, 30)))
+
+        image = Image.open(store.path('b' * 64))
+        self.assertEqual(image.size, (40, 30))
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_eviction(self):
+        """Сверх max_files удаляются самые старые превью"""
+        store = PreviewStore(self.directory, max_files=2)
+        for i, char in enumerate('abc'):
+            store.save(char * 64, Image.new('RGB', (10, 10)))
+            os.utime(store.path(char * 64), (time.time() + i, time.time() + i))
+
+        self.assertFalse(store.exists('a' * 64))
+        self.assertTrue(store.exists('c' * 64))
+        self.assertEqual(store.stats()['files'], 2)
+
+    def test_eviction_least_recently_used(self):
+        """Использованное превью (touch, повторное сохранение) вытесняется последним"""
+        store = PreviewStore(self.directory, max_files=2)
+        for i, char in enumerate('ab'):
+            store.save(char * 64, Image.new('RGB', (10, 10)))
+            os.utime(store.path(char * 64), (time.time() - 100 + i, time.time() - 100 + i))
+
+        self.assertTrue(store.touch('a' * 64))
+        store.save('c' * 64, Image.new('RGB', (10, 10)))
+
+        self.assertTrue(store.exists('a' * 64))
+        self.assertFalse(store.exists('b' * 64))
+        self.assertFalse(store.touch('b' * 64))
+
+    def test_stats_without_listing(self):
+        """stats() не просматривает каталог"""
+        store = PreviewStore(self.directory, max_files=100)
+        store.save('a' * 64, Image.new('RGB', (10, 10)))
+        with patch('app.previews.os.scandir') as scandir, patch('app.previews.os.listdir') as listdir:
+            self.assertEqual(store.stats()['files'], 1)
+        scandir.assert_not_called()
+        listdir.assert_not_called()
+
+    def test_eviction_batched(self):
+        """Каталог просматривается раз в evict_every сохранений"""
+        store = PreviewStore(self.directory, max_files=3, evict_every=3)
+        with patch('app.previews.os.scandir', wraps=os.scandir) as scandir:
+            for char in 'abcde':
+                store.save(char * 64, Image.new('RGB', (10, 10)))
+            self.assertEqual(scandir.call_count, 1)
+            self.assertEqual(store.stats()['files'], 5)
+
+            store.save('f' * 64, Image.new('RGB', (10, 10)))
+            self.assertEqual(scandir.call_count, 2)
+        self.assertEqual(store.stats()['files'], 3)
+        self.assertEqual(store.stats()['evictions'], 3)
+
+    def test_ids(self):
+        """Идентификатор и URL зависят от ROI; чужие имена файлов отвергаются"""
+        roi_info = {'roi': {'x': 1, 'y': 2, 'width': 3, 'height': 4}}
+        store = PreviewStore(self.directory)
+
+        self.assertEqual(preview_id('f' * 64, roi_info), 'f' * 64 + '_1_2_3_4')
+        self.assertEqual(preview_url('f' * 64, roi_info), f"/images/{'f' * 64}/preview?roi=1,2,3,4")
+        self.assertIsNone(store.path('../../etc/passwd'))
+
+
+if __name__ == '__main__':
+    unittest.main()
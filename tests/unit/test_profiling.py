@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.profiling import MAX_SIGNATURE_TTL, RequestProfiler, profile_signature
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+class TestRequestProfiler(unittest.TestCase):
+    """Тесты профилирования запросов по требованию"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_signed_request(self):
+        """Подписанный запрос профилируется, неверная подпись — нет"""
+        profiler = RequestProfiler(self.directory, secret='s3cret')
+        signature = profile_signature('s3cret', 'req-1')
+
+        self.assertEqual(profiler.mode('req-1', signature, tf_requested=True), {'tf_trace': True})
+        self.assertIsNone(profiler.mode('req-2', signature))
+        self.assertIsNone(profiler.mode('req-1'))
+        self.assertEqual(profiler.stats()['rejected'], 1)
+
+    def test_signature_expires(self):
+        """Подпись действует до своего срока; срок дальше MAX_SIGNATURE_TTL не принимается"""
+        now = [1000.0]
+        profiler = RequestProfiler(self.directory, secret='s3cret', clock=lambda: now[0])
+        signature = profile_signature('s3cret', 'req-1', ttl=60, now=1000.0)
+        expires, digest = signature.split('.')
+
+        self.assertIsNotNone(profiler.mode('req-1', signature))
+        self.assertIsNone(profiler.mode('req-1', f"{int(expires) + 1}.{digest}"))
+        now[0] = 1061.0
+        self.assertIsNone(profiler.mode('req-1', signature))
+        self.assertIsNone(profiler.mode('req-1', profile_signature('s3cret', 'req-1', ttl=MAX_SIGNATURE_TTL + 60,
+                                                                   now=1061.0)))
+        self.assertIsNone(profiler.mode('req-1', digest))
+        self.assertEqual(profiler.stats()['rejected'], 4)
+
+    def test_signature_ignored_without_secret(self):
+        profiler = RequestProfiler(self.directory, sample_rate=0.5, rng=lambda: 0.9)
+        self.assertIsNone(profiler.mode('req-1', profile_signature('', 'req-1')))
+
+    def test_sampling(self):
+        """Выборка — только cProfile, без трассы TensorFlow"""
+        values = iter([0.05, 0.5])
+        profiler = RequestProfiler(self.directory, sample_rate=0.1, rng=lambda: next(values))
+        self.assertEqual(profiler.mode('a'), {'tf_trace': False})
+        self.assertIsNone(profiler.mode('b'))
+        self.assertEqual(profiler.stats()['sampled'], 1)
+
+    def test_capture_writes_artifacts(self):
+        profiler = RequestProfiler(self.directory, secret='s')
+        with profiler.capture('req-1') as capture:
+            busy_work()
+
+        self.assertEqual(capture.files, [capture.name + '.prof', capture.name + '.txt'])
+        with open(os.path.join(self.directory, capture.name + '.txt')) as f:
+            self.assertIn('busy_work', f.read())
+        listed = profiler.list()
+        self.assertEqual([c['name'] for c in listed], [capture.name])
+        self.assertIsNotNone(profiler.artifact_path(capture.name + '.prof'))
+
+    def test_ring_eviction(self):
+        """Старые профили удаляются сверх max_captures"""
+        profiler = RequestProfiler(self.directory, secret='s', max_captures=2)
+        names = []
+        for i in range(3):
+            with profiler.capture(f'req-{i}') as capture:
+                busy_work()
+            names.append(capture.name)
+            os.utime(os.path.join(self.directory, capture.name + '.prof'), (1000 + i, 1000 + i))
+            os.utime(os.path.join(self.directory, capture.name + '.txt'), (1000 + i, 1000 + i))
+        profiler._evict()
+
+        self.assertEqual(sorted(c['name'] for c in profiler.list()), sorted(names[1:]))
+
+    def test_one_capture_at_a_time(self):
+        """Пока идет один профиль, другой запрос выполняется без профилирования"""
+        profiler = RequestProfiler(self.directory, secret='s')
+        inner = []
+        with profiler.capture('outer') as outer:
+            thread = threading.Thread(target=lambda: inner.append(profiler.capture('inner').__enter__()))
+            thread.start()
+            thread.join()
+        self.assertIsNotNone(outer)
+        self.assertEqual(inner, [None])
+        self.assertEqual(profiler.stats()['skipped_busy'], 1)
+
+    def test_artifact_path_rejects_other_files(self):
+        profiler = RequestProfiler(self.directory, secret='s')
+        for filename in ('../etc/passwd', 'x.prof', '20260101T000000-a/../b.prof', '20260101T000000-a.py'):
+            with self.subTest(filename=filename):
+                self.assertIsNone(profiler.artifact_path(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
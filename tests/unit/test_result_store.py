@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+import shutil
+import tempfile
+import multiprocessing
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.result_store import ResultStore
+import app.routes as routes
+
+
+def write_from_other_process(path, key, value):
+    """Запись результата из другого процесса (как из другого воркера gunicorn)"""
+    ResultStore(path).put(key, value)
+
+
+class TestResultStore(unittest.TestCase):
+    """Тесты общего хранилища результатов"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'data', 'results.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_put_get(self):
+        """Сохраненный результат читается обратно"""
+        store = ResultStore(self.path)
+        store.put('v1:abc', {'predictions': [0.1, 0.9]})
+
+        self.assertEqual(store.get('v1:abc'), {'predictions': [0.1, 0.9]})
+        self.assertIsNone(store.get('v1:missing'))
+        stats = store.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_wal_mode(self):
+        """База работает в режиме WAL"""
+        store = ResultStore(self.path)
+        mode = store._connect().execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_survives_restart(self):
+        """Результаты переживают пересоздание хранилища (перезапуск воркера)"""
+        ResultStore(self.path).put('v1:abc', {'predictions': [1.0]})
+
+        self.assertEqual(ResultStore(self.path).get('v1:abc'), {'predictions': [1.0]})
+
+    def test_shared_between_processes(self):
+        """Результат, записанный другим процессом, виден этому"""
+        store = ResultStore(self.path)
+        process = multiprocessing.Process(
+            target=write_from_other_process,
+            args=(self.path, 'v1:shared', {'predictions': [0.5]})
+        )
+        process.start()
+        process.join(10)
+
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(store.get('v1:shared'), {'predictions': [0.5]})
+
+    def test_eviction_by_entries(self):
+        """Сверх лимита вытесняются давно не использованные записи"""
+        store = ResultStore(self.path, max_entries=2)
+        store.put('a', {'v': 1})
+        store.put('b', {'v': 2})
+        store.get('a')
+        store.put('c', {'v': 3})
+
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), {'v': 1})
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_eviction_by_size(self):
+        """Лимит объема соблюдается"""
+        store = ResultStore(self.path, max_bytes=100)
+        store.put('a', {'v': 'x' * 60})
+        store.put('b', {'v': 'y' * 60})
+
+        self.assertIsNone(store.get('a'))
+        self.assertLessEqual(store.stats()['bytes'], 100)
+
+
+class TestResultStoreEndpoint(unittest.TestCase):
+    """Тесты /predict с общим хранилищем результатов"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = ResultStore(os.path.join(self.temp_dir, 'results.sqlite3'))
+        self.app = app.test_client()
+        self.app.testing = True
+        routes.prediction_cache.clear()
+
+        buffered = io.BytesIO()
+        Image.new('RGB', (280, 210), color=(70, 20, 140)).save(buffered, format='PNG')
+        self.payload = json.dumps({
+            'image': 'data:image/png;base64,' + base64.b64encode(buffered.getvalue()).decode()
+        })
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @patch('app.routes.model')
+    def test_result_shared_across_workers(self, mock_model):
+        """Результат другого воркера берется из хранилища без инференса"""
+        mock_model.predict.return_value = np.array([[0.2, 0.8]], dtype=np.float32)
+
+        with patch('app.routes.result_store', self.store):
+            first = json.loads(self.app.post('/predict', data=self.payload,
+                                             content_type='application/json').data)
+            # Другой воркер: кэш в памяти пуст
+            routes.prediction_cache.clear()
+            second = json.loads(self.app.post('/predict', data=self.payload,
+                                              content_type='application/json').data)
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['predictions'], second['predictions'])
+        mock_model.predict.assert_called_once()
+        self.assertEqual(self.store.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.sampler import StackSampler, TRUNCATED
+
+
+def spin(stop):
+    """Поток, занятый вычислениями, пока не установлен stop"""
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+class TestStackSampler(unittest.TestCase):
+    """Тесты постоянной выборки стеков"""
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.busy = threading.Thread(target=spin, args=(self.stop,), name='busy_7')
+        self.busy.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.stop.set()
+        self.busy.join()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_collapsed_stacks(self):
+        """Стек занятого потока — от имени потока (без номера) до функции"""
+        sampler = StackSampler()
+        for _ in range(5):
+            sampler.sample()
+
+        lines = sampler.collapsed().splitlines()
+        busy = [line for line in lines if line.startswith('busy;')]
+        self.assertTrue(busy, lines)
+        stack, count = busy[0].rsplit(' ', 1)
+        self.assertIn('test_sampler:spin', stack)
+        self.assertGreater(int(count), 0)
+        self.assertEqual(sampler.stats()['samples'], 5)
+
+    def test_idle_threads_skipped(self):
+        """Поток, ожидающий события, не попадает в профиль (если не include_idle)"""
+        waiting = threading.Event()
+        waiter = threading.Thread(target=waiting.wait, name='waiter')
+        waiter.start()
+        try:
+            time.sleep(0.05)
+            sampler = StackSampler()
+            sampler.sample()
+            self.assertNotIn('waiter;', sampler.collapsed())
+
+            with_idle = StackSampler(include_idle=True)
+            with_idle.sample()
+            self.assertIn('waiter;', with_idle.collapsed())
+        finally:
+            waiting.set()
+            waiter.join()
+
+    def test_max_stacks(self):
+        sampler = StackSampler(max_stacks=1, include_idle=True)
+        for _ in range(3):
+            sampler.sample()
+        self.assertLessEqual(len(sampler.collapsed().splitlines()), 2)
+        if sampler.stats()['dropped']:
+            self.assertIn(TRUNCATED, sampler.collapsed())
+
+    def test_overhead_measured_and_bounded(self):
+        """Затраты выборки измеряются и остаются ниже max_overhead"""
+        sampler = StackSampler(hz=50, max_overhead=0.01)
+        sampler.ensure_started()
+        time.sleep(1.0)
+
+        stats = sampler.stats()
+        self.assertTrue(stats['running'])
+        self.assertGreater(stats['samples'], 10)
+        self.assertGreater(stats['overhead'], 0)
+        self.assertLess(stats['overhead'], 0.01)
+
+    def test_rate_reduced_when_over_budget(self):
+        sampler = StackSampler(hz=50, max_overhead=1e-9)
+        sampler.ensure_started()
+        time.sleep(0.3)
+        self.assertLess(sampler.stats()['hz'], 50)
+
+    def test_workers_from_shared_directory(self):
+        """Стеки других воркеров читаются из их файлов"""
+        sampler = StackSampler(directory=self.directory)
+        with open(os.path.join(self.directory, '424242.folded'), 'w') as f:
+            f.write('MainThread;app.routes:predict 3\n')
+
+        pids = [worker['pid'] for worker in sampler.workers()]
+        self.assertEqual(pids, sorted([os.getpid(), 424242]))
+        self.assertEqual(sampler.collapsed_for(424242), 'MainThread;app.routes:predict 3\n')
+        self.assertIsNone(sampler.collapsed_for(1))
+
+        sampler.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
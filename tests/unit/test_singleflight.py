@@ -0,0 +1,144 @@
+import unittest
+import sys
+import os
+import io
+import json
+import time
+import base64
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+import numpy as np
+from app import app
+from app.singleflight import SingleFlight
+import app.routes as routes
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Тесты объединения одновременных одинаковых вызовов"""
+
+    def _run_concurrently(self, flight, key, fn, count=5):
+        results = []
+        errors = []
+
+        def worker():
+            try:
+                results.append(flight.do(key, fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_execute_once(self):
+        """Одновременные вызовы с одним ключом выполняют работу один раз"""
+        flight = SingleFlight()
+        calls = []
+
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return 42
+
+        results, errors = self._run_concurrently(flight, 'k', work)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [(42, False)] + [(42, True)] * 4)
+        self.assertEqual(flight.stats(), {'in_flight': 0, 'executed': 1, 'coalesced': 4, 'retried': 0})
+
+    def test_errors_shared(self):
+        """Ошибка первого вызова получают и ожидающие"""
+        flight = SingleFlight()
+
+        def work():
+            time.sleep(0.1)
+            raise ValueError("broken image")
+
+        results, errors = self._run_concurrently(flight, 'k', work, count=3)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+
+    def test_retry_on_leader_specific_errors(self):
+        """Ошибка из retry_on не передается ожидающему: он выполняет свой вызов"""
+        flight = SingleFlight()
+        leader_started = threading.Event()
+        results = []
+
+        def leader():
+            leader_started.set()
+            time.sleep(0.2)
+            raise TimeoutError("срок ведущего истек")
+
+        def follower():
+            leader_started.wait(5)
+            results.append(flight.do('k', lambda: 'свой результат', retry_on=(TimeoutError,)))
+
+        thread = threading.Thread(target=follower)
+        thread.start()
+        with self.assertRaises(TimeoutError):
+            flight.do('k', leader, retry_on=(TimeoutError,))
+        thread.join(5)
+
+        self.assertEqual(results, [('свой результат', False)])
+        self.assertEqual(flight.stats()['retried'], 1)
+
+    def test_sequential_calls_not_coalesced(self):
+        """Последовательные вызовы выполняются заново"""
+        flight = SingleFlight()
+        self.assertEqual(flight.do('k', lambda: 1), (1, False))
+        self.assertEqual(flight.do('k', lambda: 2), (2, False))
+
+
+class TestSingleFlightEndpoint(unittest.TestCase):
+    """Тесты объединения одинаковых запросов в /predict"""
+
+    def setUp(self):
+        routes.prediction_cache.clear()
+        buffered = io.BytesIO()
+        Image.new('RGB', (310, 230), color=(90, 90, 10)).save(buffered, format='PNG')
+        self.payload = json.dumps({
+            'image': 'data:image/png;base64,' + base64.b64encode(buffered.getvalue()).decode()
+        })
+
+    def tearDown(self):
+        routes.prediction_cache.clear()
+
+    @patch('app.routes.model')
+    def test_duplicate_requests_share_inference(self, mock_model):
+        """Дубликаты, пришедшие во время инференса, получают тот же результат"""
+        def slow_predict(batch, verbose=0):
+            time.sleep(0.3)
+            return np.array([[0.4, 0.6]], dtype=np.float32)
+        mock_model.predict.side_effect = slow_predict
+        responses = []
+
+        def post():
+            client = app.test_client()
+            responses.append(json.loads(client.post('/predict', data=self.payload,
+                                                    content_type='application/json').data))
+
+        before = routes.inflight.stats()['coalesced']
+        threads = [threading.Thread(target=post) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_model.predict.call_count, 1)
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(all(r['success'] for r in responses))
+        self.assertEqual(sum(r['coalesced'] for r in responses), 2)
+        self.assertEqual(routes.inflight.stats()['coalesced'] - before, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import sys
+import os
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.tracing import RequestTrace, request_id
+
+
+class TestTracing(unittest.TestCase):
+    """Тесты request ID и разбивки времени запроса"""
+
+    def test_request_id(self):
+        """ID клиента сохраняется, недопустимый или пустой заменяется новым"""
+        self.assertEqual(request_id('deploy-health-blue-1a2b'), 'deploy-health-blue-1a2b')
+        for incoming in (None, '', 'a b', 'x"y', 'a' * 129, 'id\r\nSet-Cookie: x'):
+            with self.subTest(incoming=incoming):
+                generated = request_id(incoming)
+                self.assertRegex(generated, r'^[0-9a-f]{32}$')
+
+    def test_server_timing(self):
+        """Повторы этапа суммируются; в конце — total и request ID"""
+        trace = RequestTrace('abc')
+        trace.record('decode', 0.010)
+        trace.record('inference', 0.020)
+        trace.record('decode', 0.005)
+
+        entries = [entry.strip() for entry in trace.server_timing().split(',')]
+        self.assertEqual(entries[0], 'decode;dur=15.0')
+        self.assertEqual(entries[1], 'inference;dur=20.0')
+        self.assertTrue(entries[2].startswith('total;dur='))
+        self.assertEqual(entries[3], 'request;desc="abc"')
+
+    def test_log_record(self):
+        trace = RequestTrace('abc')
+        trace.record('decode', 0.002)
+        record = json.loads(trace.log_record(method='POST', path='/predict', status=200))
+        self.assertEqual(record['request_id'], 'abc')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['stages_ms'], {'decode': 2.0})
+        self.assertEqual(record['pid'], os.getpid())
+        self.assertGreaterEqual(record['duration_ms'], 0)
+        self.assertNotIn('memory_bytes', record)
+
+    def test_log_record_memory(self):
+        """Замеры памяти этапов попадают в запись app.timing"""
+        trace = RequestTrace('abc')
+        trace.record_memory('decode', {'traced_peak_bytes': 1024, 'rss_delta_bytes': -4096})
+        record = json.loads(trace.log_record(status=200))
+        self.assertEqual(record['memory_bytes'], {'decode': {'traced_peak_bytes': 1024, 'rss_delta_bytes': -4096}})
+
+
+if __name__ == '__main__':
+    unittest.main()
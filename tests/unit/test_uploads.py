@@ -0,0 +1,113 @@
+import unittest
+import sys
+import os
+import io
+import json
+import base64
+import pickle
+import shutil
+import hashlib
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from unittest.mock import patch
+from PIL import Image
+from app.uploads import (SpooledUpload, UploadError, UploadTooLarge, image_source,
+                         spool_json_image, spool_stream)
+
+
+class TestUploads(unittest.TestCase):
+    """Тесты приема больших загрузок во временный файл"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        buffered = io.BytesIO()
+        Image.new('RGB', (120, 90), color=(30, 60, 90)).save(buffered, format='TIFF')
+        self.image_bytes = buffered.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _json_body(self, fields):
+        return io.BytesIO(json.dumps(fields).encode())
+
+    def test_spool_stream(self):
+        """Поток пишется в файл, хэш и размер считаются по ходу записи"""
+        with patch('app.uploads.CHUNK_SIZE', 1000):
+            upload = spool_stream(io.BytesIO(self.image_bytes), 10 * 1024 * 1024, self.directory)
+
+        self.assertEqual(len(upload), len(self.image_bytes))
+        self.assertEqual(upload.hash, hashlib.sha256(self.image_bytes).hexdigest())
+        self.assertEqual(upload[:4], self.image_bytes[:4])
+        with Image.open(image_source(upload)) as image:
+            self.assertEqual(image.size, (120, 90))
+
+        upload.close()
+        self.assertFalse(os.path.exists(upload.path))
+
+    def test_size_limit(self):
+        """Сверх лимита — UploadTooLarge, временный файл удаляется"""
+        with self.assertRaises(UploadTooLarge):
+            spool_stream(io.BytesIO(b'x' * 5000), 4096, self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_json_base64_chunked(self):
+        """base64 из JSON декодируется по блокам, префикс data URL и \\/ обрабатываются"""
+        encoded = base64.b64encode(self.image_bytes).decode()
+        body = json.dumps({'roi': [1, 2, 30, 40], 'image': 'data:image/tiff;base64,' + encoded})
+        body = body.replace('/', '\\/')
+
+        with patch('app.uploads.CHUNK_SIZE', 333):
+            upload, fields = spool_json_image(io.BytesIO(body.encode()), 10 * 1024 * 1024, self.directory)
+
+        with upload:
+            self.assertEqual(fields, {'roi': [1, 2, 30, 40]})
+            self.assertEqual(bytes(upload.data), self.image_bytes)
+            self.assertEqual(upload.hash, hashlib.sha256(self.image_bytes).hexdigest())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_json_nested_image_key(self):
+        """Ключ image во вложенном объекте не принимается за изображение"""
+        encoded = base64.b64encode(self.image_bytes).decode()
+        body = self._json_body({'meta': {'image': 'x'}, 'image': encoded, 'include_image': True})
+
+        upload, fields = spool_json_image(body, 10 * 1024 * 1024, self.directory)
+        with upload:
+            self.assertEqual(fields, {'meta': {'image': 'x'}, 'include_image': True})
+            self.assertEqual(bytes(upload.data), self.image_bytes)
+
+    def test_json_errors(self):
+        """Нет изображения или битый base64 — UploadError, файлы не остаются"""
+        for body in ({'roi': None}, {'image': ''}, {'image': 'abc'}):
+            with self.assertRaises(UploadError):
+                spool_json_image(self._json_body(body), 1024 * 1024, self.directory)
+        with self.assertRaises(UploadTooLarge):
+            spool_json_image(self._json_body({'image': base64.b64encode(b'x' * 3000).decode()}),
+                             2048, self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_pickle_does_not_own_file(self):
+        """Копия для процесса пула не удаляет файл при закрытии"""
+        upload = spool_stream(io.BytesIO(self.image_bytes), 1024 * 1024, self.directory)
+        copy = pickle.loads(pickle.dumps(upload))
+
+        self.assertEqual((copy.path, copy.hash, len(copy)), (upload.path, upload.hash, len(upload)))
+        copy.close()
+        self.assertTrue(os.path.exists(upload.path))
+        upload.close()
+        self.assertFalse(os.path.exists(upload.path))
+
+    def test_from_file(self):
+        """Существующий файл открывается без чтения в память и не удаляется"""
+        path = os.path.join(self.directory, 'input')
+        with open(path, 'wb') as f:
+            f.write(self.image_bytes)
+
+        with SpooledUpload.from_file(path) as upload:
+            self.assertEqual(upload.hash, hashlib.sha256(self.image_bytes).hexdigest())
+            self.assertEqual(len(upload), len(self.image_bytes))
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()